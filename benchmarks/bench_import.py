@@ -0,0 +1,90 @@
+"""
+Startup benchmarks: import time and cold CLI runs.
+
+Each scenario runs in a fresh interpreter.  Wall time is the best of
+--repeat runs; the import breakdown comes from ``python -X importtime``.
+
+    python -m benchmarks.bench_import [--repeat R] [--top N]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+SCENARIOS = {
+    "import lineblock": "import lineblock",
+    "import lineblock.api": "import lineblock.api",
+    "lineblock --help": "import sys; sys.argv = ['lineblock', '--help']\n"
+                        "from lineblock.cli import main; main()",
+    "main.py --help": "import runpy, sys; sys.argv = ['main.py', '--help']\n"
+                      "runpy.run_path({main!r}, run_name='__main__')",
+    "main.py tiny tree": "import runpy, sys; sys.argv = ['main.py', {tree!r}]\n"
+                         "runpy.run_path({main!r}, run_name='__main__')",
+}
+
+
+def make_tiny_tree(root):
+    (root / "a.py").write_text('# block extract "a"\nline a\n# end extract\n')
+    (root / "doc.md").write_text('<!-- block insert "a" -->\nline a\n<!-- end insert -->\n')
+
+
+def run(code, importtime=False):
+    """Run code in a fresh interpreter; return (seconds, stderr)."""
+    args = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", code]
+    env = {**os.environ, "PYTHONPATH": str(ROOT)}
+    start = time.perf_counter()
+    result = subprocess.run(args, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    elapsed = time.perf_counter() - start
+    # --help exits with SystemExit(0)
+    if result.returncode != 0:
+        raise RuntimeError(f"{code!r} failed:\n{result.stderr}")
+    return elapsed, result.stderr
+
+
+def parse_importtime(stderr):
+    """Return [(cumulative_us, self_us, module)] from -X importtime output."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:"):].split("|")
+        rows.append((int(cumulative_us), int(self_us), module.rstrip()))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=10, help="Timing repetitions (default: 10)")
+    parser.add_argument("--top", type=int, default=8, help="Slowest imports listed per scenario (default: 8)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tree = Path(tmp_dir)
+        make_tiny_tree(tree)
+        baseline = min(run("pass")[0] for _ in range(args.repeat))
+        print(f"{'scenario':<20} {'wall ms':>8} {'- python':>9} {'imports ms':>11} {'modules':>8}")
+        breakdowns = {}
+        for name, template in SCENARIOS.items():
+            code = template.format(main=str(ROOT / "main.py"), tree=str(tree))
+            wall = min(run(code)[0] for _ in range(args.repeat))
+            rows = parse_importtime(run(code, importtime=True)[1])
+            total_us = sum(self_us for _, self_us, _ in rows)
+            breakdowns[name] = rows
+            print(f"{name:<20} {wall * 1000:>8.1f} {(wall - baseline) * 1000:>9.1f} "
+                  f"{total_us / 1000:>11.1f} {len(rows):>8}")
+
+    for name, rows in breakdowns.items():
+        print(f"\n{name}: slowest imports (cumulative us)")
+        top_level = [row for row in rows if not row[2].startswith("  ")]
+        for cumulative_us, _, module in sorted(top_level, reverse=True)[:args.top]:
+            print(f"  {cumulative_us:>8}  {module.strip()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Micro-benchmarks for Common.indent_lines and Common.indent_text on large blocks.
+
+Compares the indentation engine against the original per-line implementation
+and checks that the results are byte-identical.
+
+    python -m benchmarks.bench_indent [--lines N] [--repeat R]
+"""
+
+import argparse
+import timeit
+
+from lineblock.common import Common
+
+
+def reference_indent_lines(lines, spaces):
+    """The original per-line implementation of Common.indent_lines."""
+    indented = []
+    for line in lines:
+        stripped = line.rstrip("\n")
+        if spaces >= 0:
+            indented_line = f"{' ' * spaces}{stripped}\n"
+        else:
+            spaces_to_remove = -spaces
+            leading_spaces = len(stripped) - len(stripped.lstrip())
+            remove_count = min(spaces_to_remove, leading_spaces)
+            indented_line = stripped[remove_count:] + "\n"
+        indented.append(indented_line)
+    return indented
+
+
+def make_block(n_lines):
+    return [f"{' ' * (4 * (i % 4))}value_{i} = compute({i}, {i * 7})  # comment\n" for i in range(n_lines)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, default=100_000, help="Lines per block (default: 100000)")
+    parser.add_argument("--repeat", type=int, default=5, help="Timing repetitions (default: 5)")
+    args = parser.parse_args()
+
+    lines = make_block(args.lines)
+    text = "".join(lines)
+
+    print(f"{'indent':>6} {'reference':>10} {'lines':>10} {'text':>10}  (best of {args.repeat}, ms)")
+    for spaces in (0, 4, -4):
+        expected = reference_indent_lines(lines, spaces)
+        assert Common.indent_lines(lines, spaces) == expected
+        assert Common.indent_text(text, spaces) == "".join(expected)
+
+        timings = [
+            min(timeit.repeat(lambda: fn(arg, spaces), number=1, repeat=args.repeat)) * 1000
+            for fn, arg in (
+                (reference_indent_lines, lines),
+                (Common.indent_lines, lines),
+                (Common.indent_text, text),
+            )
+        ]
+        print(f"{spaces:>6} " + " ".join(f"{t:>10.2f}" for t in timings))
+
+
+if __name__ == "__main__":
+    main()
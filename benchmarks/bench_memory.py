@@ -0,0 +1,104 @@
+"""
+Memory-regression benchmark: peak RSS of a run on a standard corpus.
+
+Each measurement runs lineblock.lineblock.lineblock() on a freshly generated
+corpus in a fresh interpreter and reads that process's peak RSS.  The RSS
+of an interpreter that only imports lineblock is reported alongside, so
+growth in the run itself stands out.
+
+    python -m benchmarks.bench_memory [--scenario dense] [--save results.json]
+    python -m benchmarks.bench_memory --baseline results.json [--threshold 0.15]
+
+With --baseline, exits 1 if the peak RSS of any scenario grew by more than
+--threshold (relative) over the baseline.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from benchmarks.corpus import SCENARIOS, generate_corpus, scaled
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Standard corpus shapes checked by default
+DEFAULT_SCENARIOS = ("dense", "large_files", "fanout")
+
+CHILD = """
+import contextlib, io, json, sys
+from lineblock.memory import max_rss
+from lineblock.lineblock import lineblock
+if sys.argv[1] != "-":
+    with contextlib.redirect_stdout(io.StringIO()):
+        lineblock(path=sys.argv[1])
+print(json.dumps({"max_rss": max_rss()}))
+"""
+
+
+def peak_rss(tree) -> int:
+    """Peak RSS in bytes of a fresh interpreter running lineblock on tree ("-": import only)."""
+    env = {**os.environ, "PYTHONPATH": str(ROOT)}
+    result = subprocess.run([sys.executable, "-c", CHILD, str(tree)], env=env,
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.splitlines()[-1])["max_rss"]
+
+
+def measure(scenarios, repeat: int, seed: int, scale: float) -> dict:
+    results = {"baseline_interpreter": min(peak_rss("-") for _ in range(repeat))}
+    for name in scenarios:
+        samples = []
+        for _ in range(repeat):
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                generate_corpus(tmp_dir, seed=seed, **scaled(SCENARIOS[name], scale))
+                samples.append(peak_rss(tmp_dir))
+        results[name] = min(samples)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help=f"Scenario to measure (can be used multiple times; default: {', '.join(DEFAULT_SCENARIOS)})")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per scenario; the lowest peak is kept (default: 3)")
+    parser.add_argument("--seed", type=int, default=0, help="Corpus seed (default: 0)")
+    parser.add_argument("--scale", type=float, default=1.0, help="File count multiplier (default: 1.0)")
+    parser.add_argument("--save", metavar="FILE", help="Write the results as JSON")
+    parser.add_argument("--baseline", metavar="FILE", help="Compare against saved results")
+    parser.add_argument("--threshold", type=float, default=0.15,
+                        help="Relative peak RSS growth flagged as a regression (default: 0.15)")
+    args = parser.parse_args()
+
+    if sys.platform == "win32":
+        parser.error("peak RSS is only measured on POSIX systems")
+
+    results = measure(args.scenario or DEFAULT_SCENARIOS, args.repeat, args.seed, args.scale)
+    if args.save:
+        Path(args.save).write_text(json.dumps(
+            {"meta": {"seed": args.seed, "scale": args.scale}, "results": results}, indent=2) + "\n")
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+
+    regressions = 0
+    print(f"{'scenario':<22} {'peak RSS MiB':>13} {'baseline MiB':>13} {'change':>8}")
+    for name, rss in results.items():
+        line = f"{name:<22} {rss / 2 ** 20:>13.1f}"
+        if baseline and name in baseline:
+            change = (rss - baseline[name]) / baseline[name]
+            regressed = name != "baseline_interpreter" and change > args.threshold
+            regressions += regressed
+            line += f" {baseline[name] / 2 ** 20:>13.1f} {change:>+8.1%}" + ("  REGRESSION" if regressed else "")
+        print(line)
+    if baseline is not None:
+        print(f"{regressions} regression(s) above {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
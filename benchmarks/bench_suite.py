@@ -0,0 +1,159 @@
+"""
+End-to-end benchmark suite over synthetic corpora.
+
+For each scenario (see benchmarks.corpus.SCENARIOS) a fresh corpus is
+generated for every repetition, outside the timed region, and these phases
+are timed separately:
+
+    discover  discover_files() over the tree
+    extract   Run.extract_all() over the discovered files
+    insert    Run.insert_all(), rewriting every (stale) insert region
+    full      lineblock.lineblock.lineblock() on a fresh corpus
+    noop      lineblock.lineblock.lineblock() again, with nothing to change
+
+Results are written as JSON; `compare` flags regressions against a saved
+baseline and exits non-zero if there are any.
+
+    python -m benchmarks.bench_suite run [--scenario NAME ...] [--out results.json]
+    python -m benchmarks.bench_suite compare BASELINE CURRENT [--threshold 0.1]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.corpus import SCENARIOS, generate_corpus, scaled
+from lineblock.lineblock import discover_files, lineblock
+from lineblock.run import Run
+
+PHASES = ("discover", "extract", "insert", "full", "noop")
+
+
+def _timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def measure(params: dict, seed: int) -> dict:
+    """Time every phase once, each on a freshly generated corpus."""
+    timings = {}
+    with tempfile.TemporaryDirectory() as tmp_dir, contextlib.redirect_stdout(io.StringIO()):
+        root = Path(tmp_dir).resolve() / "phases"
+        generate_corpus(root, seed=seed, **params)
+        timings["discover"], files = _timed(lambda: list(discover_files(root)))
+        run = Run()
+        run.source_root = root
+        timings["extract"], _ = _timed(lambda: run.extract_all(files))
+        timings["insert"], _ = _timed(lambda: run.insert_all(files))
+        run.close()
+
+        root = Path(tmp_dir).resolve() / "full"
+        generate_corpus(root, seed=seed, **params)
+        timings["full"], _ = _timed(lambda: lineblock(path=root))
+        timings["noop"], _ = _timed(lambda: lineblock(path=root))
+    return timings
+
+
+def run_suite(scenarios, repeat: int, seed: int, scale: float) -> dict:
+    results = {}
+    for name in scenarios:
+        params = scaled(SCENARIOS[name], scale)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            corpus = generate_corpus(tmp_dir, seed=seed, **params)
+        samples = [measure(params, seed) for _ in range(repeat)]
+        results[name] = {
+            "corpus": corpus,
+            "phases": {
+                phase: {
+                    "min": min(sample[phase] for sample in samples),
+                    "median": statistics.median(sample[phase] for sample in samples),
+                }
+                for phase in PHASES
+            },
+        }
+        phases = results[name]["phases"]
+        print(f"{name:<16} " + " ".join(f"{phases[phase]['min'] * 1000:>9.1f}" for phase in PHASES),
+              file=sys.stderr)
+    return results
+
+
+def compare(baseline: dict, current: dict, threshold: float, min_delta: float, metric: str) -> int:
+    """Print a comparison table; return the number of regressions."""
+    regressions = 0
+    print(f"{'scenario':<16} {'phase':<9} {'baseline ms':>12} {'current ms':>11} {'change':>8}")
+    for name, result in current["results"].items():
+        if name not in baseline["results"]:
+            continue
+        for phase, values in result["phases"].items():
+            before = baseline["results"][name]["phases"].get(phase, {}).get(metric)
+            after = values[metric]
+            if before is None:
+                continue
+            change = (after - before) / before if before else 0.0
+            regressed = change > threshold and after - before > min_delta
+            regressions += regressed
+            print(f"{name:<16} {phase:<9} {before * 1000:>12.1f} {after * 1000:>11.1f} {change:>+8.1%}"
+                  + ("  REGRESSION" if regressed else ""))
+    print(f"{regressions} regression(s) above {threshold:.0%}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Run the suite and write JSON results")
+    run_parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                            help="Scenario to run (can be used multiple times; default: all)")
+    run_parser.add_argument("--repeat", type=int, default=3, help="Repetitions per scenario (default: 3)")
+    run_parser.add_argument("--seed", type=int, default=0, help="Corpus seed (default: 0)")
+    run_parser.add_argument("--scale", type=float, default=1.0, help="File count multiplier (default: 1.0)")
+    run_parser.add_argument("--out", default="-", help="Results file (default: stdout)")
+
+    compare_parser = subparsers.add_parser("compare", help="Compare results against a baseline")
+    compare_parser.add_argument("baseline", help="Baseline results file")
+    compare_parser.add_argument("current", help="Current results file")
+    compare_parser.add_argument("--threshold", type=float, default=0.10,
+                                help="Relative slowdown flagged as a regression (default: 0.10)")
+    compare_parser.add_argument("--min-delta", type=float, default=0.005,
+                                help="Ignore slowdowns smaller than this many seconds (default: 0.005)")
+    compare_parser.add_argument("--metric", choices=("min", "median"), default="min",
+                                help="Statistic compared (default: min)")
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+        return 1 if compare(baseline, current, args.threshold, args.min_delta, args.metric) else 0
+
+    print(f"{'scenario':<16} " + " ".join(f"{phase + ' ms':>9}" for phase in PHASES), file=sys.stderr)
+    results = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "scale": args.scale,
+            "repeat": args.repeat,
+        },
+        "results": run_suite(args.scenario or list(SCENARIOS), args.repeat, args.seed, args.scale),
+    }
+    text = json.dumps(results, indent=2) + "\n"
+    if args.out == "-":
+        sys.stdout.write(text)
+    else:
+        Path(args.out).write_text(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,159 @@
+"""
+Seeded synthetic corpus generator.
+
+Writes a tree of source files holding extract regions and document files
+holding insert regions.  The same arguments and seed always produce the
+same tree.  Every insert region starts out stale, so the first lineblock
+run rewrites all of them and a second run is a no-op.
+
+    python -m benchmarks.corpus OUT_DIR [--scenario NAME] [--seed S] [--scale F]
+"""
+
+import argparse
+import random
+from pathlib import Path
+
+# Dialect -> (file suffix, marker prefix, marker suffix)
+DIALECTS = {
+    "Python": (".py", "#", ""),
+    "HTML": (".md", "<!--", " -->"),
+    "C": (".c", "//", ""),
+    "SQL": (".sql", "--", ""),
+}
+
+# Named corpus shapes; see generate_corpus() for the parameters
+SCENARIOS = {
+    "small": dict(files=50, lines=100, density=0.05, fanout=2),
+    "many_files": dict(files=2000, lines=20, density=0.02, fanout=2),
+    "large_files": dict(files=20, lines=20000, density=0.01, fanout=2),
+    "dense": dict(files=100, lines=300, density=0.3, fanout=2),
+    "fanout": dict(files=200, lines=100, density=0.02, fanout=20),
+    "long_lines": dict(files=50, lines=200, density=0.05, fanout=2, long_line_ratio=0.2),
+    "single_dialect": dict(files=200, lines=100, density=0.05, fanout=2, dialects=("Python",)),
+}
+
+WORDS = ("alpha", "beta", "gamma", "delta", "value", "result", "compute", "index", "block", "line")
+
+
+def scaled(params: dict, scale: float) -> dict:
+    """Scenario parameters with the file count scaled (at least 2 files)."""
+    return {**params, "files": max(2, int(params["files"] * scale))}
+
+
+def _filler(rng: random.Random, long_line_ratio: float, long_line_length: int) -> str:
+    if long_line_ratio and rng.random() < long_line_ratio:
+        words = []
+        length = 0
+        while length < long_line_length:
+            word = rng.choice(WORDS)
+            words.append(word)
+            length += len(word) + 1
+        return " ".join(words) + "\n"
+    indent = " " * (4 * rng.randrange(3))
+    return f"{indent}{rng.choice(WORDS)}_{rng.randrange(1000)} = {rng.choice(WORDS)}({rng.randrange(100)})\n"
+
+
+def generate_corpus(
+        root,
+        seed: int = 0,
+        files: int = 100,
+        lines: int = 200,
+        density: float = 0.05,
+        dialects=tuple(DIALECTS),
+        fanout: int = 2,
+        long_line_ratio: float = 0.0,
+        long_line_length: int = 4000,
+) -> dict:
+    """
+    Write a synthetic corpus under root.
+
+    Args:
+        root: Directory to write into (created if missing)
+        seed: Random seed
+        files: Number of files; half hold extract regions, half insert regions
+        lines: Filler lines per file
+        density: Probability of a marker region after each filler line
+        dialects: Marker dialects to mix, from DIALECTS
+        fanout: Insert regions per extracted identity
+        long_line_ratio: Fraction of filler lines that are long
+        long_line_length: Length of a long line in characters
+
+    Returns:
+        dict: Counts of files, bytes, extracts and inserts written
+    """
+    rng = random.Random(seed)
+    root = Path(root)
+    n_sources = max(1, files // 2)
+    n_docs = max(1, files - n_sources)
+
+    def file_path(kind: str, n: int, dialect: str) -> Path:
+        path = root / f"d{n % 10}" / f"s{n % 3}" / f"{kind}{n}{DIALECTS[dialect][0]}"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        return path
+
+    def marker(dialect: str, text: str) -> str:
+        _, prefix, suffix = DIALECTS[dialect]
+        return f"{prefix} {text}{suffix}\n"
+
+    stats = {"files": 0, "bytes": 0, "extracts": 0, "inserts": 0}
+
+    def write(path: Path, content: list):
+        text = "".join(content)
+        path.write_text(text)
+        stats["files"] += 1
+        stats["bytes"] += len(text.encode("utf-8"))
+
+    identities = []
+    for n in range(n_sources):
+        dialect = rng.choice(dialects)
+        content = []
+        for _ in range(lines):
+            content.append(_filler(rng, long_line_ratio, long_line_length))
+            if rng.random() < density:
+                identity = f"blk{len(identities)}"
+                identities.append(identity)
+                content.append(marker(dialect, f'block extract "{identity}"'))
+                content.extend(_filler(rng, long_line_ratio, long_line_length) for _ in range(rng.randint(3, 15)))
+                content.append(marker(dialect, "end extract"))
+        write(file_path("src", n, dialect), content)
+    stats["extracts"] = len(identities)
+
+    # Spread fanout references to each identity over the documents
+    references = [[] for _ in range(n_docs)]
+    for identity in identities:
+        for _ in range(fanout):
+            references[rng.randrange(n_docs)].append(identity)
+
+    for n, doc_references in enumerate(references):
+        dialect = rng.choice(dialects)
+        # Insert regions go between filler lines, in random positions
+        slots = {}
+        for identity in doc_references:
+            slots.setdefault(rng.randrange(lines + 1), []).append(identity)
+        content = []
+        for i in range(lines + 1):
+            for identity in slots.get(i, ()):
+                content.append(marker(dialect, f'block insert "{identity}"'))
+                content.append("stale\n")
+                content.append(marker(dialect, "end insert"))
+            if i < lines:
+                content.append(_filler(rng, long_line_ratio, long_line_length))
+        write(file_path("doc", n, dialect), content)
+        stats["inserts"] += len(doc_references)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("out", help="Directory to write the corpus into")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="small", help="Corpus shape (default: small)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+    parser.add_argument("--scale", type=float, default=1.0, help="File count multiplier (default: 1.0)")
+    args = parser.parse_args()
+
+    stats = generate_corpus(args.out, seed=args.seed, **scaled(SCENARIOS[args.scenario], args.scale))
+    print(", ".join(f"{key}: {value}" for key, value in stats.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -6,12 +6,32 @@ and their corresponding documentation by inserting and extracting code blocks
 based on markers in files.
 """
 
-from .block_extract import BlockExtract
-from .block_insert import BlockInsert
+from importlib import import_module
+
 from .exceptions import UnclosedBlockError, OrphanedExtractEndMarkerError
 
-# Import main function for CLI usage
-from .cli import main, lineblock
+# Public names and the submodule defining each.  Submodules are imported on
+# first attribute access, so `import lineblock` stays cheap and the CLI does
+# not pay for asyncio, argparse or the legacy classes it does not use.
+# As with the former eager import, importing the lineblock.lineblock
+# submodule rebinds the name `lineblock` on the package to that module.
+_LAZY_ATTRIBUTES = {
+    'BlockExtract': '.block_extract',
+    'BlockInsert': '.block_insert',
+    'render': '.api',
+    'extract_blocks': '.api',
+    'RenderResult': '.api',
+    'iter_blocks': '.lineblock',
+    'RunStats': '.stats',
+    'Hooks': '.hooks',
+    'save_index': '.index',
+    'load_index': '.index',
+    'RunCancelledError': '.exceptions',
+    'async_sync_tree': '.aio',
+    'async_render': '.aio',
+    'main': '.cli',
+    'lineblock': '.cli',
+}
 
 __version__ = "0.0.1"
 __author__ = "Kim Jarvis"
@@ -21,6 +41,30 @@ __all__ = [
     'BlockInsert',
     'UnclosedBlockError',
     'OrphanedExtractEndMarkerError',
+    'render',
+    'extract_blocks',
+    'RenderResult',
+    'iter_blocks',
+    'RunStats',
+    'Hooks',
+    'save_index',
+    'load_index',
+    'RunCancelledError',
+    'async_sync_tree',
+    'async_render',
     'main',
     'lineblock'
-]
\ No newline at end of file
+]
+
+
+def __getattr__(name):
+    module = _LAZY_ATTRIBUTES.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRIBUTES))
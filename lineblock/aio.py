@@ -0,0 +1,166 @@
+"""
+asyncio API.
+
+Runs lineblock from an event loop without blocking it: file reads, scans,
+renders and writes happen in an executor with bounded concurrency, and
+control returns to the loop between files.  Files are replaced atomically,
+so cancelling a run never leaves a half-written file.
+"""
+
+import asyncio
+from concurrent.futures import Executor
+from pathlib import Path
+from typing import Awaitable, Callable, List, Optional, Union
+
+from lineblock.api import BlockIndex, RenderResult, as_block_map, render
+from lineblock.block_store import block_lookup
+from lineblock.format_cache import FormatCache
+from lineblock.lineblock import discover_files, load_exclude_patterns, _normalize_to_list
+from lineblock.process import process
+from lineblock.writer import AtomicWriter
+
+ProgressCallback = Callable[[dict], Awaitable[None]]
+
+
+async def _gather_or_cancel(coroutines) -> list:
+    """
+    Like asyncio.gather(), but the first failure cancels the other tasks and
+    waits for them before it propagates (asyncio.TaskGroup, before 3.11).
+    """
+    tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+async def async_render(
+        text: Union[str, bytes],
+        blocks: BlockIndex,
+        dialect: Optional[str] = None,
+        filename: str = "<string>",
+        stamp: bool = False,
+        executor: Optional[Executor] = None,
+) -> RenderResult:
+    """
+    Asynchronous render(): renders text in an executor and returns its RenderResult.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        executor, lambda: render(text, blocks, dialect=dialect, filename=filename, stamp=stamp)
+    )
+
+
+async def async_sync_tree(
+        path: Union[str, Path],
+        pattern: Optional[Union[str, List[str]]] = None,
+        exclude: Optional[Union[str, List[str]]] = None,
+        exclude_file: Optional[str] = None,
+        dirs: Optional[Union[str, List[str]]] = None,
+        concurrency: int = 8,
+        progress: Optional[ProgressCallback] = None,
+        check: bool = False,
+        stamp: bool = False,
+        blocks: Optional[BlockIndex] = None,
+        executor: Optional[Executor] = None,
+) -> dict:
+    """
+    Asynchronous lineblock(): extract blocks from a file or tree and update its insert regions.
+
+    Args:
+        path: Target path (file or directory)
+        pattern: Pattern(s) to match (directory only)
+        exclude: Pattern(s) to exclude (directory only)
+        exclude_file: File containing exclusion patterns (directory only)
+        dirs: Specific subdirectories to process (directory only)
+        concurrency: Maximum number of files read, rendered or written at once
+        progress: Async callback awaited with an event dict: "discovered"
+            (files), "extracted" (path, blocks), "rendered" (path, changed),
+            "written" (path) and "done"
+        check: Compare only; never write
+        stamp: Write hash-stamped insert end markers
+        blocks: Use this block index instead of extracting one from the tree
+        executor: Executor for file work; the loop's default executor if None
+
+    Returns:
+        dict: "files" (processed), "updated" (files changed, or that would
+        change in check mode) and "regions" (one record per insert region)
+    """
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    writer = AtomicWriter()
+    writes = set()
+    format_cache = FormatCache()
+
+    async def emit(event: str, **fields) -> None:
+        if progress is not None:
+            await progress({"event": event, **fields})
+
+    async def in_executor(fn, *args):
+        async with semaphore:
+            result = await loop.run_in_executor(executor, fn, *args)
+        # Yield to the loop between files
+        await asyncio.sleep(0)
+        return result
+
+    target = Path(path).expanduser().resolve()
+    if not target.exists():
+        raise FileNotFoundError(f"Path does not exist: {target}")
+    if target.is_file():
+        files = [target]
+    else:
+        exclude_patterns = _normalize_to_list(exclude) or []
+        if exclude_file:
+            exclude_patterns.extend(load_exclude_patterns(exclude_file))
+        files = await in_executor(lambda: list(discover_files(
+            target, _normalize_to_list(pattern), _normalize_to_list(dirs), exclude_patterns)))
+    await emit("discovered", files=len(files))
+
+    if blocks is None:
+        async def extract(file_path: Path) -> List[dict]:
+            file_blocks = await in_executor(process, file_path)
+            await emit("extracted", path=file_path, blocks=len(file_blocks))
+            return file_blocks
+
+        # gather keeps file order, so identities resolve as in a synchronous run
+        block_map = [block for file_blocks in await _gather_or_cancel(map(extract, files))
+                     for block in file_blocks]
+    else:
+        block_map = as_block_map(blocks)
+
+    # Searched by identity for every region: indexed once for the whole run
+    lookup = block_lookup(block_map)
+
+    def render_file(file_path: Path):
+        with open(file_path, "r") as f:
+            text = f.read()
+        return render(text, lookup, filename=str(file_path), stamp=stamp, format_cache=format_cache)
+
+    async def sync_file(file_path: Path) -> RenderResult:
+        result = await in_executor(render_file, file_path)
+        await emit("rendered", path=file_path, changed=result.changed)
+        if result.changed and not check:
+            # Shielded: once started, the atomic replace completes even if the run is cancelled
+            write = asyncio.ensure_future(in_executor(writer.write, file_path, result.text))
+            writes.add(write)
+            await asyncio.shield(write)
+            await emit("written", path=file_path)
+        return result
+
+    # On a failure the files not yet rendered are left alone; writes already
+    # started complete before the error reaches the caller
+    try:
+        results = await _gather_or_cancel(map(sync_file, files))
+    finally:
+        if writes:
+            await asyncio.gather(*writes, return_exceptions=True)
+    report = {
+        "files": files,
+        "updated": [file_path for file_path, result in zip(files, results) if result.changed],
+        "regions": [region for result in results for region in result.regions],
+    }
+    await emit("done", files=len(files), updated=len(report["updated"]))
+    return report
@@ -0,0 +1,143 @@
+"""
+In-memory API.
+
+Renders and extracts blocks from text already held in memory, without any
+filesystem I/O, so build tools can call lineblock in-process.
+"""
+
+from typing import Dict, Iterable, List, Optional, Union
+
+from lineblock.block_store import BlockLookup, BlockStore
+from lineblock.common import Common
+from lineblock.format_cache import FormatCache
+from lineblock.markers import Markers
+from lineblock.sink import insert_regions
+from lineblock.source import Source
+
+Text = Union[str, bytes]
+BlockIndex = Union[List[dict], BlockStore, BlockLookup, Dict[str, Union[str, List[str]]]]
+
+
+class RenderResult:
+    """
+    Result of render().
+
+    Attributes:
+        text: The rendered text (bytes if the input was bytes)
+        changed: True if any insert region was updated
+        regions: One dict per insert region, with path, line, identity and
+            status ("updated" or "current")
+    """
+
+    def __init__(self, text: Text, changed: bool, regions: List[dict]):
+        self.text = text
+        self.changed = changed
+        self.regions = regions
+
+    @property
+    def updated(self) -> List[dict]:
+        """The regions that were out of date."""
+        return [region for region in self.regions if region["status"] == "updated"]
+
+    def __repr__(self):
+        return (f"RenderResult(changed={self.changed}, regions={len(self.regions)}, "
+                f"updated={len(self.updated)})")
+
+
+def _dialects(dialect: Optional[str]) -> Iterable[dict]:
+    return Markers.markers() if dialect is None else [Markers.get(dialect)]
+
+
+def _decode(text: Text):
+    if isinstance(text, bytes):
+        return text.decode("utf-8"), True
+    return text, False
+
+
+def as_block_map(blocks: BlockIndex) -> Union[List[dict], BlockStore]:
+    """
+    Normalise a block index to a block map.
+
+    Accepts a block map (as returned by extract_blocks() or process()), a
+    BlockStore, or a mapping of identity to block text or lines.
+    """
+    if isinstance(blocks, (list, BlockStore, BlockLookup)):
+        return blocks
+    block_map = []
+    for identity, block in blocks.items():
+        lines = Common.split_lines(block) if isinstance(block, str) else list(block)
+        block_map.append({
+            "path": None,
+            "identity": identity,
+            "block": lines,
+            "hash": Common.block_hash(lines),
+        })
+    return block_map
+
+
+def extract_blocks(text: Text, dialect: Optional[str] = None, filename: str = "<string>") -> List[dict]:
+    """
+    Extract the blocks marked in text.
+
+    Args:
+        text: Document content (str or UTF-8 bytes)
+        dialect: Marker dialect type name (e.g. "HTML", "Python"); all dialects if None
+        filename: Name recorded in block records and error messages
+
+    Returns:
+        list: Block records with path, identity, start_line, end_line, indent,
+        head, tail, block and hash
+
+    Raises:
+        UnclosedBlockError, OrphanedExtractEndMarkerError, NestedExtractBeginMarkerError:
+            If the extract markers are malformed
+    """
+    text, _ = _decode(text)
+    lines = Common.split_lines(text)
+    block_map = []
+    for markers in _dialects(dialect):
+        if not Markers.may_contain(markers, text, "Extract"):
+            continue
+        source = Source(path=filename, markers=markers)
+        source.process_lines(lines)
+        block_map.extend(source.block_map)
+    return block_map
+
+
+def render(
+        text: Text,
+        blocks: BlockIndex,
+        dialect: Optional[str] = None,
+        filename: str = "<string>",
+        stamp: bool = False,
+        format_cache: Optional[FormatCache] = None,
+) -> RenderResult:
+    """
+    Render the insert regions of text from a block index.
+
+    Args:
+        text: Document content (str or UTF-8 bytes)
+        blocks: Block map, BlockStore, or mapping of identity to block text/lines
+        dialect: Marker dialect type name; all dialects if None
+        filename: Name reported in the regions and error messages
+        stamp: Write hash-stamped insert end markers
+        format_cache: Formatted-block cache to share across calls
+
+    Returns:
+        RenderResult: The rendered text and a report of its insert regions
+
+    Raises:
+        OrphanedInsertEndMarkerError: If an insert end marker has no begin marker
+        ValueError: If an identity is not in the block index
+    """
+    text, is_bytes = _decode(text)
+    format_cache = format_cache if format_cache is not None else FormatCache()
+    lines, changed, regions, _ = insert_regions(
+        text, as_block_map(blocks), dialects=_dialects(dialect), source_file=filename,
+        format_cache=format_cache, stamp=stamp, source_name=filename)
+    rendered = "".join(lines) if changed else text
+    return RenderResult(
+        text=rendered.encode("utf-8") if is_bytes else rendered,
+        changed=changed,
+        regions=regions,
+    )
@@ -1,4 +1,3 @@
-import re
 from pathlib import Path
 
 from lineblock.common import Common
@@ -10,25 +9,28 @@ class BlockExtract(Common):
         self,
         source_path: str,
         extract_directory_prefix: str,
+        skip_fresh: bool = False,
     ):
         self.source_path = source_path
         self.extract_directory_prefix = extract_directory_prefix
+        self.skip_fresh = skip_fresh
 
     def is_end_marker(self, markers, line):
         s = line.strip()
-        if re.fullmatch(markers["Extract"]["End"], s):
+        if Markers.compiled(markers)["Extract"]["End"].fullmatch(s):
             return True
         return False
 
     def extract_block_info(self, markers, line):
         # Pattern: leading_ws + prefixmarker + filename + [optional indent] + [optional head] + [optional tail] + suffixmarker + [anything]
-        match = re.match(markers["Extract"]["Begin"], line)
+        match = Markers.compiled(markers)["Extract"]["Begin"].match(line)
         if match:
             leading_ws = match.group(1)
-            file_name = match.group(2)
-            extra_indent = int(match.group(3)) if match.group(3) else 0
-            head = int(match.group(4)) if match.group(4) else 0
-            tail = int(match.group(5)) if match.group(5) else 0
+            # File name can be in group 2 (double quotes), 3 (single quotes), or 4 (unquoted word)
+            file_name = match.group(2) or match.group(3) or match.group(4)
+            extra_indent = int(match.group(5)) if match.group(5) else 0
+            head = int(match.group(6)) if match.group(6) else 0
+            tail = int(match.group(7)) if match.group(7) else 0
             original_indent = len(leading_ws)
             total_indent = (
                     original_indent + extra_indent
@@ -38,9 +40,26 @@ class BlockExtract(Common):
         return False,
 
     def process_file1(self):
+        if self.skip_fresh and self.is_up_to_date():
+            return
         for markers in Markers.markers():
             self.process_file(markers)
 
+    def is_up_to_date(self):
+        """True if every block file extracted from the source is newer than the source."""
+        try:
+            with open(self.source_path, "r") as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return False
+        outputs = []
+        for markers in Markers.markers():
+            for line in lines:
+                info = self.extract_block_info(markers, line)
+                if info[0]:
+                    outputs.append(info[1])
+        return bool(outputs) and self.is_fresh(outputs, [self.source_path])
+
     def process_file(self, markers):
         try:
             with open(self.source_path, "r") as f:
@@ -116,8 +135,8 @@ class BlockExtract(Common):
                     # Remove the top `head` lines and bottom `tail` lines
                     trimmed_lines = indented_lines[head:-tail or None]
 
-                    with open(file_path, "w") as out_f:
-                        out_f.writelines(trimmed_lines)
+                    # Leave identical block files untouched so their mtimes stay stable
+                    self.write_if_changed(file_path, "".join(trimmed_lines))
             i += 1
 
     def process(self):
@@ -153,11 +172,13 @@ class BlockExtract(Common):
 def block_extract(
     source_path: str,
     extract_directory_prefix: str,
+    skip_fresh: bool = False,
 ):
     try:
         extractor = BlockExtract(
             source_path=source_path,
             extract_directory_prefix=extract_directory_prefix,
+            skip_fresh=skip_fresh,
         )
         extractor.process()
     except (UnclosedBlockError, OrphanedExtractEndMarkerError) as e:
@@ -1,10 +1,14 @@
-import re
 from pathlib import Path
 
 from lineblock.common import Common
 from lineblock.exceptions import OrphanedInsertEndMarkerError
+from lineblock.file_cache import BlockFileCache
+from lineblock.lineblock import discover_files, load_exclude_patterns
 from lineblock.markers import Markers
 
+# Files processed in directory mode when no pattern is given
+DEFAULT_PATTERNS = ["*.py", "*.md"]
+
 class BlockInsert(Common):
     def __init__(
         self,
@@ -12,28 +16,43 @@ class BlockInsert(Common):
         insert_directory_prefix: str,
         output_directory: str = None,
         clear_mode: bool = False,
+        skip_fresh: bool = False,
+        patterns: list = None,
+        excludes: list = None,
+        exclude_file: str = None,
+        dirs: list = None,
+        jobs: int = 1,
+        block_cache: BlockFileCache = None,
     ):
         self.source_file = source_file
         self.insert_directory_prefix = insert_directory_prefix
         self.output_directory = output_directory
         self.clear_mode = clear_mode
+        self.skip_fresh = skip_fresh
+        self.patterns = patterns
+        self.excludes = excludes
+        self.exclude_file = exclude_file
+        self.dirs = dirs
+        self.jobs = jobs
+        self.block_cache = block_cache if block_cache is not None else BlockFileCache()
 
     def is_end_marker(self, markers, line):
         s = line.strip()
-        if re.fullmatch(markers["Insert"]["End"], s):
+        if Markers.compiled(markers)["Insert"]["End"].fullmatch(s):
             return True
         return False
 
 
     def extract_block_info(self, markers, line):
         # Pattern: leading_ws + prefixmarker + filename + [optional indent] + [optional head] + [optional tail] + suffixmarker + [anything]
-        match = re.match(markers["Insert"]["Begin"], line)
+        match = Markers.compiled(markers)["Insert"]["Begin"].match(line)
         if match:
             leading_ws = match.group(1)
-            file_name = match.group(2)
-            extra_indent = int(match.group(3)) if match.group(3) else 0
-            head = int(match.group(4)) if match.group(4) else 0
-            tail = int(match.group(5)) if match.group(5) else 0
+            # File name can be in group 2 (double quotes), 3 (single quotes), or 4 (unquoted word)
+            file_name = match.group(2) or match.group(3) or match.group(4)
+            extra_indent = int(match.group(5)) if match.group(5) else 0
+            head = int(match.group(6)) if match.group(6) else 0
+            tail = int(match.group(7)) if match.group(7) else 0
             original_indent = len(leading_ws)
             total_indent = original_indent + extra_indent
             file_path = Path(self.insert_directory_prefix) / file_name
@@ -42,9 +61,49 @@ class BlockInsert(Common):
 
         return None
 
-    def process_file1(self):
+    def process_file1(self, source_root=None):
+        if self.skip_fresh and self.is_up_to_date(source_root):
+            return
+        for markers in Markers.markers():
+            self.process_file(markers, source_root)
+
+    def output_path(self, source_root=None):
+        """Path the processed source file is written to."""
+        source_file_path = Path(self.source_file).resolve()
+        if self.output_directory is None:
+            # In-place modification
+            return source_file_path
+        # Write to output directory preserving relative structure
+        output_root = Path(self.output_directory).resolve()
+        if source_root is None:
+            # Single file case: output directly to output_root/filename
+            return output_root / source_file_path.name
+        # Directory case: preserve relative path under output_root
+        return output_root / source_file_path.relative_to(source_root)
+
+    def is_up_to_date(self, source_root=None):
+        """
+        True if the output is at least as new as the source and every block file it references.
+
+        Only a separate output can be fresh: updated in place, the source is
+        its own output, and timestamps cannot tell a region added or edited
+        by hand from a rendered one, so the source is always processed.
+        """
+        output_path = self.output_path(source_root)
+        if output_path == Path(self.source_file).resolve():
+            return False
+        try:
+            with open(self.source_file, "r") as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return False
+        prerequisites = [self.source_file]
         for markers in Markers.markers():
-            self.process_file(markers)
+            for line in lines:
+                info = self.extract_block_info(markers, line)
+                if info:
+                    prerequisites.append(info[0])
+        return self.is_fresh([output_path], prerequisites)
 
 
     def process_file(self, markers, source_root=None):
@@ -64,19 +123,7 @@ class BlockInsert(Common):
         inside_block = False
 
         # Determine output path
-        if self.output_directory is None:
-            # In-place modification
-            output_path = source_file_path
-        else:
-            # Write to output directory preserving relative structure
-            output_root = Path(self.output_directory).resolve()
-            if source_root is None:
-                # Single file case: output directly to output_root/filename
-                output_path = output_root / source_file_path.name
-            else:
-                # Directory case: preserve relative path under output_root
-                rel_path = source_file_path.relative_to(source_root)
-                output_path = output_root / rel_path
+        output_path = self.output_path(source_root)
 
         while i < len(original_lines):
             line = original_lines[i]
@@ -174,8 +221,7 @@ class BlockInsert(Common):
 
                         try:
                             # Load the expected block content
-                            with open(file_path, "r") as f:
-                                expected_block_content = f.readlines()
+                            expected_block_content = self.block_cache.read(file_path)
 
                             # Apply indentation to expected block content
                             expected_indented_block = self.indent_lines(expected_block_content, total_indent)
@@ -213,8 +259,7 @@ class BlockInsert(Common):
                         replacement = [line]
 
                         try:
-                            with open(file_path, "r") as f:
-                                block_content = f.readlines()
+                            block_content = self.block_cache.read(file_path)
 
                             # If the original marker line doesn't end with \n,
                             # we need to add a newline before the block content for proper formatting
@@ -277,15 +322,19 @@ class BlockInsert(Common):
 
         # Write output if changed
         if output != original_lines:
+            # In directory mode, mirror the source tree under the output directory
+            if source_root is not None and self.output_directory is not None:
+                output_path.parent.mkdir(parents=True, exist_ok=True)
+
             # Ensure output directory exists - raise exception if it doesn't
             if not output_path.parent.exists():
                 raise FileNotFoundError(
                     f"Output directory '{output_path.parent}' does not exist."
                 )
-            with open(output_path, "w") as f:
-                f.writelines(output)
-            action = "Created" if self.output_directory else "Updated"
-            print(f"{action} file: {output_path}")
+            # Leave an identical output untouched so its mtime stays stable
+            if self.write_if_changed(output_path, "".join(output)):
+                action = "Created" if self.output_directory else "Updated"
+                print(f"{action} file: {output_path}")
 
     def process(self):
         source_file_path = Path(self.source_file).expanduser().resolve()
@@ -294,14 +343,14 @@ class BlockInsert(Common):
         if not source_file_path.exists():
             raise FileNotFoundError(f"Source path '{source_file_path}' does not exist.")
 
-        # Ensure source_file is a file
-        if not source_file_path.is_file():
+        # Ensure source_file is a file, unless running in directory mode
+        if not source_file_path.is_file() and not source_file_path.is_dir():
             raise ValueError(
                 f"Source path '{source_file_path}' must be a file, not a directory."
             )
 
         # Ensure source_file has either .py or .md extension
-        if source_file_path.suffix.lower() not in [".py", ".md"]:
+        if source_file_path.is_file() and source_file_path.suffix.lower() not in [".py", ".md"]:
             raise ValueError(
                 f"Source path '{source_file_path}' must be a .py or .md file, not '{source_file_path.suffix}'."
             )
@@ -343,7 +392,41 @@ class BlockInsert(Common):
         if self.output_directory:
             self.output_directory = str(output_root)
 
-        self.process_file1()
+        if source_file_path.is_dir():
+            self.process_directory(source_file_path, output_root)
+        else:
+            self.process_file1()
+
+    def process_directory(self, root, output_root=None):
+        """
+        Directory mode: process every matching file under root.
+
+        Files are selected with the same pattern, exclusion and sub-directory
+        options as the main lineblock command, and processed by `jobs`
+        threads sharing one block file cache.
+        """
+        exclude_patterns = list(self.excludes or [])
+        if self.exclude_file:
+            exclude_patterns.extend(load_exclude_patterns(self.exclude_file))
+
+        files = []
+        for path in discover_files(root, self.patterns or DEFAULT_PATTERNS, self.dirs, exclude_patterns):
+            # Never process files already written to an output directory inside the tree
+            if output_root is not None and path.is_relative_to(output_root):
+                continue
+            files.append(path)
+
+        def process_one(path):
+            BlockInsert(
+                source_file=str(path),
+                insert_directory_prefix=self.insert_directory_prefix,
+                output_directory=self.output_directory,
+                clear_mode=self.clear_mode,
+                skip_fresh=self.skip_fresh,
+                block_cache=self.block_cache,
+            ).process_file1(source_root=root)
+
+        self.map_jobs(process_one, files, self.jobs)
 
 
 def block_insert(
@@ -351,13 +434,25 @@ def block_insert(
     insert_directory_prefix: str,
     output_directory: str = None,
     clear_mode: bool = False,
+    skip_fresh: bool = False,
+    patterns: list = None,
+    excludes: list = None,
+    exclude_file: str = None,
+    dirs: list = None,
+    jobs: int = 1,
 ):
-    """Insert code blocks into Python/Markdown files based on markers."""
+    """Insert code blocks into Python/Markdown files, or a directory of them, based on markers."""
     block_inserter = BlockInsert(
         source_file=source_file,
         insert_directory_prefix=insert_directory_prefix,
         output_directory=output_directory,
         clear_mode=clear_mode,
+        skip_fresh=skip_fresh,
+        patterns=patterns,
+        excludes=excludes,
+        exclude_file=exclude_file,
+        dirs=dirs,
+        jobs=jobs,
     )
     try:
         block_inserter.process()
@@ -0,0 +1,220 @@
+import json
+import os
+import re
+import sys
+import threading
+from collections import OrderedDict
+from typing import Optional, Union
+
+from lineblock.common import Common
+
+
+_SIZE_UNITS = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+
+def parse_size(value: Union[int, str]) -> int:
+    """
+    Parse a memory size such as ``512M``, ``64k`` or ``1048576`` into bytes.
+    """
+    if isinstance(value, int):
+        return value
+    match = re.fullmatch(r"\s*(\d+)\s*([kKmMgG]?)[bB]?\s*", value)
+    if not match:
+        raise ValueError(f"Invalid memory size '{value}'")
+    return int(match.group(1)) * _SIZE_UNITS[match.group(2).upper()]
+
+
+def block_size(lines) -> int:
+    """Approximate number of bytes held in memory by a list of block lines."""
+    return sys.getsizeof(lines) + sum(sys.getsizeof(line) for line in lines)
+
+
+class BlockLookup:
+    """
+    Identity lookup over a block map, built once per run.
+
+    Holds the first record extracted for each identity, with its content
+    hash, so that resolving an insert region is a dict lookup rather than a
+    scan of the block map.
+    """
+
+    def __init__(self, block_map):
+        self.block_map = block_map
+        self._first = {}
+        for record in block_map:
+            if record["identity"] not in self._first:
+                if not record.get("hash"):
+                    record = {**record, "hash": Common.block_hash(record["block"])}
+                self._first[record["identity"]] = record
+
+    def __len__(self):
+        return len(self.block_map)
+
+    def __iter__(self):
+        return iter(self.block_map)
+
+    @property
+    def identities(self) -> set:
+        return set(self._first)
+
+    def find(self, identity: str) -> Optional[dict]:
+        """Return the first record extracted for identity, or None."""
+        return self._first.get(identity)
+
+    def content_hash(self, identity: str) -> Optional[str]:
+        record = self._first.get(identity)
+        return record["hash"] if record is not None else None
+
+    def path(self, identity: str) -> Optional[str]:
+        """Path of the file the first record for identity comes from."""
+        record = self._first.get(identity)
+        return record["path"] if record is not None else None
+
+
+def block_lookup(block_map) -> Union[BlockLookup, "BlockStore"]:
+    """A block map that can be searched by identity: block_map itself if it already can."""
+    if hasattr(block_map, "find"):
+        return block_map
+    return BlockLookup(block_map)
+
+
+class BlockStore:
+    """
+    Block map with a memory budget.
+
+    Holds the same block records as the list built by ``process()``.  When the
+    block content held in memory exceeds ``max_memory`` bytes, the content of
+    the least recently used blocks is spilled to a temporary sqlite database
+    and read back on demand.  Record metadata always stays in memory.
+    """
+
+    def __init__(self, max_memory: Optional[Union[int, str]] = None):
+        self.max_memory = parse_size(max_memory) if max_memory is not None else None
+        self._records = []
+        self._first = {}
+        self._resident = OrderedDict()  # record index -> size of resident block
+        self._resident_bytes = 0
+        self._db = None
+        self._db_path = None
+        self._lock = threading.Lock()
+
+        # Instrumentation
+        self.spilled_blocks = 0
+        self.spilled_bytes = 0
+        self.spill_reads = 0
+        self.spill_read_bytes = 0
+
+    def __len__(self):
+        return len(self._records)
+
+    def __iter__(self):
+        for index in range(len(self._records)):
+            yield self._record(index)
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def append(self, record: dict):
+        with self._lock:
+            index = len(self._records)
+            self._records.append(dict(record))
+            self._first.setdefault(record["identity"], index)
+            size = block_size(record["block"])
+            self._resident[index] = size
+            self._resident_bytes += size
+            self._evict()
+
+    def extend(self, records):
+        for record in records:
+            self.append(record)
+
+    @property
+    def identities(self) -> set:
+        """The distinct identities in the store (without reading spilled content)."""
+        return set(self._first)
+
+    def find(self, identity: str) -> Optional[dict]:
+        """Return the first record extracted for identity, or None."""
+        index = self._first.get(identity)
+        if index is None:
+            return None
+        return self._record(index)
+
+    def content_hash(self, identity: str) -> Optional[str]:
+        """Content hash of the first record for identity, without reading spilled content."""
+        index = self._first.get(identity)
+        if index is None:
+            return None
+        record = self._records[index]
+        if "hash" not in record:
+            record["hash"] = Common.block_hash(self._record(index)["block"])
+        return record["hash"]
+
+    def path(self, identity: str) -> Optional[str]:
+        """Path of the first record for identity, without reading spilled content."""
+        index = self._first.get(identity)
+        if index is None:
+            return None
+        return self._records[index]["path"]
+
+    def _record(self, index: int) -> dict:
+        with self._lock:
+            record = self._records[index]
+            if index in self._resident:
+                self._resident.move_to_end(index)
+                return record
+            # Spilled: read the content back without making it resident again
+            (content,) = self._db.execute(
+                "SELECT content FROM blocks WHERE idx = ?", (index,)
+            ).fetchone()
+            self.spill_reads += 1
+            self.spill_read_bytes += len(content)
+            return {**record, "block": json.loads(content)}
+
+    def _evict(self):
+        if self.max_memory is None:
+            return
+        while self._resident_bytes > self.max_memory and self._resident:
+            index, size = self._resident.popitem(last=False)
+            record = self._records[index]
+            content = json.dumps(record.pop("block"))
+            self._connection().execute(
+                "INSERT OR REPLACE INTO blocks (idx, content) VALUES (?, ?)",
+                (index, content),
+            )
+            self._resident_bytes -= size
+            self.spilled_blocks += 1
+            self.spilled_bytes += len(content)
+
+    def _connection(self):
+        if self._db is None:
+            # Only runs that actually spill pay for importing sqlite3
+            import sqlite3
+            import tempfile
+
+            fd, self._db_path = tempfile.mkstemp(prefix="lineblock-", suffix=".sqlite")
+            os.close(fd)
+            self._db = sqlite3.connect(self._db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode = OFF")
+            self._db.execute("PRAGMA synchronous = OFF")
+            self._db.execute("CREATE TABLE blocks (idx INTEGER PRIMARY KEY, content TEXT)")
+        return self._db
+
+    def summary(self) -> str:
+        return (f"Block store: spilled {self.spilled_blocks} blocks "
+                f"({self.spilled_bytes} bytes) to disk, "
+                f"{self.spill_reads} reads ({self.spill_read_bytes} bytes)")
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+        if self._db_path is not None:
+            os.unlink(self._db_path)
+            self._db_path = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -2,9 +2,8 @@
 CLI entry point for the lineblock package.
 """
 
-from lineblock.block_extract import BlockExtract, block_extract
-from lineblock.block_insert import BlockInsert, block_insert
 from lineblock.exceptions import UnclosedBlockError, OrphanedExtractEndMarkerError
+from lineblock.shard import shard_type
 import argparse
 
 
@@ -13,15 +12,29 @@ def lineblock(action: str,
                prefix: str = None,
                output: str = None,
                clear: bool = False,
+               skip_fresh: bool = False,
+               pattern: list = None,
+               exclude: list = None,
+               exclude_file: str = None,
+               dirs: list = None,
+               jobs: int = 1,
                ):
     """
     Combined function for inserting or extracting code blocks.
+
+    For insert, source may be a directory; pattern, exclude, exclude_file,
+    dirs and jobs then select and process its files as the main lineblock
+    command does.
     """
 
     # Validate action
     if action not in ("insert", "extract"):
         raise ValueError(f'action must be "insert" or "extract", got "{action}"')
 
+    # Imported on use, so --help and the other subcommands start quickly
+    from lineblock.block_extract import block_extract
+    from lineblock.block_insert import block_insert
+
     try:
         if action == "insert":
             # Validate parameters for insert
@@ -34,6 +47,12 @@ def lineblock(action: str,
                 insert_directory_prefix=prefix,
                 output_directory=output,
                 clear_mode=clear,
+                skip_fresh=skip_fresh,
+                patterns=pattern,
+                excludes=exclude,
+                exclude_file=exclude_file,
+                dirs=dirs,
+                jobs=jobs,
             )
 
         else:  # action == "extract"
@@ -42,11 +61,14 @@ def lineblock(action: str,
                 raise ValueError('source and prefix must be specified for extract action')
             if any([output, clear]):
                 raise ValueError('output and clear parameters are not valid for extract action')
+            if any([pattern, exclude, exclude_file, dirs]) or jobs != 1:
+                raise ValueError('pattern, exclude, exclude_file, dirs and jobs parameters are not valid for extract action')
 
             # Call extract function
             block_extract(
                 source_path=source,
                 extract_directory_prefix=prefix,
+                skip_fresh=skip_fresh,
             )
 
     except (FileNotFoundError, NotADirectoryError, ValueError) as e:
@@ -83,13 +105,18 @@ def main():
         default=".",  # Set default prefix to "."
         help="Base path for block files (default: '.')."
     )
+    extract_parser.add_argument(
+        "--skip-fresh",
+        action="store_true",
+        help="Skip sources whose block files are all newer than the source (make-style)."
+    )
 
     # Insert subparser
     insert_parser = subparsers.add_parser('insert', help='Insert code blocks into source files')
     insert_parser.add_argument(
         "--source",
         required=True,
-        help="Source file to process."
+        help="Source file, or directory of files, to process."
     )
     insert_parser.add_argument(
         "--prefix",
@@ -105,9 +132,281 @@ def main():
         action="store_true",
         help="Clear blocks without insertion (insert action only)."
     )
+    insert_parser.add_argument(
+        "--skip-fresh",
+        action="store_true",
+        help="With --output, skip sources whose output is newer than the source and its block files (make-style)."
+    )
+    insert_parser.add_argument(
+        "-p", "--pattern",
+        action="append",
+        dest="patterns",
+        metavar="GLOB",
+        help="Glob pattern(s) of files to process when --source is a directory "
+             "(can be used multiple times). Default: '*.py' and '*.md'."
+    )
+    insert_parser.add_argument(
+        "-x", "--exclude",
+        action="append",
+        dest="excludes",
+        metavar="PATTERN",
+        help="Exclusion pattern(s), gitignore-style, when --source is a directory "
+             "(can be used multiple times)."
+    )
+    insert_parser.add_argument(
+        "--exclude-file",
+        metavar="FILE",
+        help="File containing exclusion patterns (one per line)."
+    )
+    insert_parser.add_argument(
+        "-d", "--dirs",
+        nargs="+",
+        metavar="SUBDIR",
+        help="List of sub-directories to traverse (default: all)."
+    )
+    insert_parser.add_argument(
+        "-j", "--jobs",
+        type=int,
+        default=1,
+        metavar="N",
+        help="Number of files processed concurrently (default: 1)."
+    )
+
+    # Daemon subparser
+    daemon_parser = subparsers.add_parser('daemon', help='Serve a tree from a persistent daemon')
+    daemon_parser.add_argument(
+        "path",
+        help="Root directory of the tree to serve."
+    )
+    daemon_parser.add_argument(
+        "--socket",
+        metavar="PATH",
+        help="Unix socket to listen on (default: PATH/.lineblock.sock)."
+    )
+    daemon_parser.add_argument(
+        "-p", "--pattern",
+        action="append",
+        dest="patterns",
+        metavar="GLOB",
+        help="Glob pattern(s) of files to process (can be used multiple times)."
+    )
+    daemon_parser.add_argument(
+        "-x", "--exclude",
+        action="append",
+        dest="excludes",
+        metavar="PATTERN",
+        help="Exclusion pattern(s), gitignore-style (can be used multiple times)."
+    )
+    daemon_parser.add_argument(
+        "--exclude-file",
+        metavar="FILE",
+        help="File containing exclusion patterns (one per line)."
+    )
+    daemon_parser.add_argument(
+        "-d", "--dirs",
+        nargs="+",
+        metavar="SUBDIR",
+        help="List of sub-directories to traverse (default: all)."
+    )
+    daemon_parser.add_argument(
+        "--cache-size",
+        default="256M",
+        metavar="SIZE",
+        help="Memory budget for parsed documents and formatted blocks, e.g. 64M (default: 256M)."
+    )
+
+    # Client subparser
+    client_parser = subparsers.add_parser('client', help='Send a request to a running daemon')
+    client_parser.add_argument(
+        "command",
+        choices=["sync", "check", "where", "ping", "shutdown"],
+        help="Request to send."
+    )
+    client_parser.add_argument(
+        "identity",
+        nargs="?",
+        help="Block identity (where only)."
+    )
+    client_parser.add_argument(
+        "--socket",
+        default=".lineblock.sock",
+        metavar="PATH",
+        help="Unix socket of the daemon (default: ./.lineblock.sock)."
+    )
+    client_parser.add_argument(
+        "--json",
+        action="store_true",
+        help="Print the daemon's response as JSON."
+    )
+
+    # Render subparser
+    render_parser = subparsers.add_parser('render', help='Render the insert regions of one buffer to stdout')
+    render_parser.add_argument(
+        "--stdin",
+        action="store_true",
+        required=True,
+        help="Read the buffer from stdin."
+    )
+    render_parser.add_argument(
+        "--filename",
+        default="<stdin>",
+        metavar="PATH",
+        help="Path of the buffer; its blocks on disk are replaced by those in the buffer."
+    )
+    render_parser.add_argument(
+        "--root",
+        default=".",
+        metavar="DIR",
+        help="Tree to take blocks from when no daemon is running (default: '.')."
+    )
+    render_parser.add_argument(
+        "--socket",
+        metavar="PATH",
+        help="Unix socket of a daemon serving the tree (default: ROOT/.lineblock.sock)."
+    )
+    render_parser.add_argument(
+        "--index",
+        metavar="FILE",
+        help="Take blocks from this block index (see 'index') instead of a daemon or scanning ROOT."
+    )
+    render_parser.add_argument(
+        "-p", "--pattern",
+        action="append",
+        dest="patterns",
+        metavar="GLOB",
+        help="Glob pattern(s) of files to take blocks from when scanning (can be used multiple times)."
+    )
+    render_parser.add_argument(
+        "-x", "--exclude",
+        action="append",
+        dest="excludes",
+        metavar="PATTERN",
+        help="Exclusion pattern(s), gitignore-style, when scanning (can be used multiple times)."
+    )
+    render_parser.add_argument(
+        "--exclude-file",
+        metavar="FILE",
+        help="File containing exclusion patterns (one per line), when scanning."
+    )
+    render_parser.add_argument(
+        "-d", "--dirs",
+        nargs="+",
+        metavar="SUBDIR",
+        help="List of sub-directories to scan (default: all)."
+    )
+
+    # Index subparser
+    index_parser = subparsers.add_parser('index', help='Save the blocks of a tree to a block index file')
+    index_parser.add_argument(
+        "path",
+        help="File or directory to extract blocks from."
+    )
+    index_parser.add_argument(
+        "--out",
+        required=True,
+        metavar="FILE",
+        help="Block index file to write."
+    )
+    index_parser.add_argument(
+        "-p", "--pattern",
+        action="append",
+        dest="patterns",
+        metavar="GLOB",
+        help="Glob pattern(s) of files to extract from (can be used multiple times)."
+    )
+    index_parser.add_argument(
+        "-x", "--exclude",
+        action="append",
+        dest="excludes",
+        metavar="PATTERN",
+        help="Exclusion pattern(s), gitignore-style (can be used multiple times)."
+    )
+    index_parser.add_argument(
+        "--exclude-file",
+        metavar="FILE",
+        help="File containing exclusion patterns (one per line)."
+    )
+    index_parser.add_argument(
+        "-d", "--dirs",
+        nargs="+",
+        metavar="SUBDIR",
+        help="List of sub-directories to traverse (default: all)."
+    )
+
+    # Apply subparser
+    apply_parser = subparsers.add_parser('apply', help='Update the insert regions of a tree from a block index')
+    apply_parser.add_argument(
+        "path",
+        help="File or directory to update."
+    )
+    apply_parser.add_argument(
+        "--index",
+        required=True,
+        metavar="FILE",
+        help="Block index file written by 'index'."
+    )
+    apply_parser.add_argument(
+        "-p", "--pattern",
+        action="append",
+        dest="patterns",
+        metavar="GLOB",
+        help="Glob pattern(s) of files to update (can be used multiple times)."
+    )
+    apply_parser.add_argument(
+        "-x", "--exclude",
+        action="append",
+        dest="excludes",
+        metavar="PATTERN",
+        help="Exclusion pattern(s), gitignore-style (can be used multiple times)."
+    )
+    apply_parser.add_argument(
+        "--exclude-file",
+        metavar="FILE",
+        help="File containing exclusion patterns (one per line)."
+    )
+    apply_parser.add_argument(
+        "-d", "--dirs",
+        nargs="+",
+        metavar="SUBDIR",
+        help="List of sub-directories to traverse (default: all)."
+    )
+    apply_parser.add_argument(
+        "-j", "--jobs",
+        type=int,
+        default=1,
+        metavar="N",
+        help="Number of files processed concurrently (default: 1)."
+    )
+    apply_parser.add_argument(
+        "-o", "--output",
+        metavar="DIR",
+        help="Render into DIR, mirroring the tree, instead of updating files in place."
+    )
+    apply_parser.add_argument(
+        "--check",
+        action="store_true",
+        help="Write nothing; list stale insert regions and exit 1 if there are any."
+    )
+    apply_parser.add_argument(
+        "--shard",
+        metavar="I/N",
+        type=shard_type,
+        help="Update only the files of shard I of N (e.g. 2/4)."
+    )
 
     args = parser.parse_args()
 
+    if args.action == 'index':
+        return run_index(args)
+    if args.action == 'apply':
+        return run_apply(args)
+    if args.action == 'render':
+        return run_render(args)
+    if args.action == 'daemon':
+        return run_daemon(args)
+    if args.action == 'client':
+        return run_client(args)
+
     try:
         # Call the unified function
         lineblock(
@@ -116,6 +415,12 @@ def main():
             prefix=args.prefix,
             output=getattr(args, 'output', None),
             clear=getattr(args, 'clear', False),
+            skip_fresh=args.skip_fresh,
+            pattern=getattr(args, 'patterns', None),
+            exclude=getattr(args, 'excludes', None),
+            exclude_file=getattr(args, 'exclude_file', None),
+            dirs=getattr(args, 'dirs', None),
+            jobs=getattr(args, 'jobs', 1),
         )
     except (UnclosedBlockError, OrphanedExtractEndMarkerError,
             FileNotFoundError, NotADirectoryError, ValueError) as e:
@@ -125,4 +430,151 @@ def main():
         print(f"Fatal error: {e}")
         exit(1)
 
-    return 0
\ No newline at end of file
+    return 0
+
+
+def run_daemon(args) -> int:
+    from lineblock.daemon import Daemon
+
+    daemon = Daemon(
+        args.path,
+        socket_path=args.socket,
+        pattern=args.patterns,
+        exclude=args.excludes,
+        exclude_file=args.exclude_file,
+        dirs=args.dirs,
+        cache_size=args.cache_size,
+    )
+    daemon.bind()
+    print(f"Listening on {daemon.socket_path}")
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def run_client(args) -> int:
+    import json
+    from lineblock.daemon import request
+
+    try:
+        response = request(args.socket, args.command, identity=args.identity)
+    except ConnectionError as e:
+        print(e)
+        exit(1)
+    if args.json:
+        print(json.dumps(response, indent=2))
+    elif not response["ok"]:
+        print(response["error"])
+    elif args.command == "sync":
+        for path in response["updated"]:
+            print(f"Updated file: {path}")
+    elif args.command == "check":
+        for region in response["stale"]:
+            print(f"{region['path']}:{region['line']}: stale insert region '{region['identity']}'")
+        print(f"{len(response['stale'])} stale insert region(s) found")
+    elif args.command == "where":
+        for block in response["extracts"]:
+            print(f"{block['path']}:{block['line']}: extract")
+        for region in response["inserts"]:
+            print(f"{region['path']}:{region['line']}: insert ({region['status']})")
+    elif args.command == "ping":
+        for key, value in response.items():
+            if key != "ok":
+                print(f"{key}: {value}")
+    if not response["ok"] or (args.command == "check" and response["stale"]):
+        exit(1)
+    return 0
+
+
+def run_index(args) -> int:
+    import sys
+    from pathlib import Path
+    from lineblock.index import save_index
+    from lineblock.lineblock import iter_blocks
+
+    root = Path(args.path).expanduser().resolve()
+    try:
+        blocks = list(iter_blocks(root, patterns=args.patterns, exclude=args.excludes,
+                                  exclude_file=args.exclude_file, dirs=args.dirs))
+        size = save_index(args.out, blocks, root if root.is_dir() else root.parent)
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        exit(1)
+    files = len({block["path"] for block in blocks})
+    print(f"Indexed {len(blocks)} block(s) from {files} file(s) into {args.out} ({size} bytes)")
+    return 0
+
+
+def run_apply(args) -> int:
+    import sys
+    from lineblock.lineblock import lineblock as run_lineblock
+
+    try:
+        return run_lineblock(
+            path=args.path,
+            pattern=args.patterns,
+            exclude=args.excludes,
+            exclude_file=args.exclude_file,
+            dirs=args.dirs,
+            jobs=args.jobs,
+            output=args.output,
+            check=args.check,
+            shard=args.shard,
+            index=args.index,
+        )
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        exit(1)
+
+
+def load_block_map(root: str, socket_path: str = None, pattern: list = None, exclude: list = None,
+                   index: str = None, exclude_file: str = None, dirs: list = None) -> list:
+    """
+    Block map of a tree: from a block index if given, else from its daemon if
+    one is listening, otherwise by scanning it.
+    """
+    import os
+    from lineblock.daemon import DEFAULT_SOCKET, request
+    from lineblock.lineblock import iter_blocks
+
+    if index is not None:
+        from lineblock.index import load_index
+        return [{**block, "path": str(block["path"])}
+                for block in load_index(index, os.path.realpath(root))]
+
+    socket_path = socket_path or os.path.join(root, DEFAULT_SOCKET)
+    if os.path.exists(socket_path):
+        try:
+            response = request(socket_path, "blocks", timeout=5)
+        except (ConnectionError, OSError):
+            response = {"ok": False}
+        if response["ok"]:
+            return response["blocks"]
+    return [{**block, "path": str(block["path"])}
+            for block in iter_blocks(root, patterns=pattern, exclude=exclude, exclude_file=exclude_file, dirs=dirs)]
+
+
+def run_render(args) -> int:
+    import os
+    import sys
+    from lineblock.api import extract_blocks, render
+
+    text = sys.stdin.read()
+    try:
+        block_map = load_block_map(args.root, args.socket, args.patterns, args.excludes, args.index,
+                                   args.exclude_file, args.dirs)
+        # The buffer's own blocks replace those of its saved version, in place
+        buffer_path = os.path.realpath(args.filename)
+        buffer_blocks = extract_blocks(text, filename=buffer_path)
+        index = next((i for i, block in enumerate(block_map) if block["path"] == buffer_path), len(block_map))
+        block_map = ([block for block in block_map[:index] if block["path"] != buffer_path]
+                     + buffer_blocks
+                     + [block for block in block_map[index:] if block["path"] != buffer_path])
+        result = render(text, block_map, filename=args.filename)
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        exit(1)
+    sys.stdout.write(result.text)
+    return 0
@@ -1,21 +1,167 @@
+import hashlib
+import os
+import re
+from functools import lru_cache
+
+
+@lru_cache(maxsize=None)
+def _dedent_pattern(width):
+    # A newline followed by up to `width` whitespace characters (as str.lstrip() sees them).
+    # Anchoring on "\n" rather than a MULTILINE "^" is considerably faster on large blocks.
+    return re.compile(r"\n[^\S\n]{1,%d}" % width)
+
+
 class Common:
 
     @staticmethod
     def indent_lines(lines, spaces):
+        """
+        Indent (or, for negative spaces, dedent) each line, ensuring each ends with a single newline.
+
+        Negative indents remove up to |spaces| leading whitespace characters, but
+        never beyond the first non-space character.
+        """
+        if spaces == 0:
+            # No-op fast path: only normalise the line ending
+            return [line if line[-1:] == "\n" and line[-2:-1] != "\n" else line.rstrip("\n") + "\n"
+                    for line in lines]
+
+        if spaces > 0:
+            prefix = " " * spaces
+            return [prefix + line.rstrip("\n") + "\n" for line in lines]
+
+        width = -spaces
+        pad = " " * width
         indented = []
         for line in lines:
             stripped = line.rstrip("\n")
-            if spaces >= 0:
-                # Positive indent: add spaces
-                indented_line = f"{' ' * spaces}{stripped}\n"
+            if stripped.startswith(pad):
+                # Common case: the whole dedent is available as plain spaces
+                indented.append(stripped[width:] + "\n")
             else:
-                # Negative indent: remove spaces from the beginning
-                # Remove up to |spaces| spaces, but not beyond the first non-space character
-                spaces_to_remove = -spaces
-                # Count leading spaces in the original line
                 leading_spaces = len(stripped) - len(stripped.lstrip())
-                # Remove spaces, but not more than what exists
-                remove_count = min(spaces_to_remove, leading_spaces)
-                indented_line = stripped[remove_count:] + "\n"
-            indented.append(indented_line)
+                indented.append(stripped[min(width, leading_spaces):] + "\n")
         return indented
+
+    @staticmethod
+    def indent_text(text, spaces):
+        """
+        Whole-block string form of indent_lines.
+
+        Equivalent to joining indent_lines() over the newline-terminated lines of
+        text, without allocating a list of lines.
+        """
+        if not text:
+            return ""
+        if not text.endswith("\n"):
+            text += "\n"
+        if spaces == 0:
+            return text
+        if spaces > 0:
+            prefix = " " * spaces
+            return prefix + text[:-1].replace("\n", "\n" + prefix) + "\n"
+        return _dedent_pattern(-spaces).sub("\n", "\n" + text)[1:]
+
+    @staticmethod
+    def split_lines(text):
+        """Split text into lines the way readlines() does for a text file (on "\\n" only)."""
+        lines = text.split("\n")
+        last = lines.pop()
+        lines = [line + "\n" for line in lines]
+        if last:
+            lines.append(last)
+        return lines
+
+    @staticmethod
+    def map_jobs(fn, items, jobs=1):
+        """
+        Apply fn to items, using a pool of `jobs` threads when jobs > 1.
+
+        Results come back in item order.  On error, items not yet started are
+        cancelled and the exception propagates.
+        """
+        if jobs is None or jobs <= 1:
+            return [fn(item) for item in items]
+        from concurrent.futures import ThreadPoolExecutor
+
+        executor = ThreadPoolExecutor(max_workers=jobs)
+        try:
+            return list(executor.map(fn, items))
+        finally:
+            executor.shutdown(cancel_futures=True)
+
+    @staticmethod
+    def imap_jobs(fn, items, jobs=1):
+        """
+        Lazily apply fn to items, using a pool of `jobs` threads when jobs > 1.
+
+        Results are yielded in item order as they complete, with at most
+        2 * jobs items in flight, so a slow consumer bounds the results held
+        in memory.  On error, or when the generator is closed early, items
+        not yet started are cancelled.
+        """
+        if jobs is None or jobs <= 1:
+            for item in items:
+                yield fn(item)
+            return
+        from collections import deque
+        from concurrent.futures import ThreadPoolExecutor
+
+        executor = ThreadPoolExecutor(max_workers=jobs)
+        pending = deque()
+        try:
+            for item in items:
+                if len(pending) >= 2 * jobs:
+                    yield pending.popleft().result()
+                pending.append(executor.submit(fn, item))
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown()
+
+    @staticmethod
+    def write_if_changed(path, text):
+        """
+        Write text to path unless the file already holds exactly that content.
+
+        Skipping identical writes keeps mtimes stable, so downstream tools that
+        rebuild on modification (make, mkdocs, Sphinx) are not triggered.
+
+        Returns:
+            bool: True if the file was written
+        """
+        expected = text.replace("\n", os.linesep) if os.linesep != "\n" else text
+        try:
+            if os.path.getsize(path) >= len(expected):
+                with open(path, "r", newline="") as f:
+                    if f.read() == expected:
+                        return False
+        except FileNotFoundError:
+            pass
+        with open(path, "w") as f:
+            f.write(text)
+        return True
+
+    @staticmethod
+    def is_fresh(outputs, prerequisites):
+        """
+        Make-style freshness check: every output exists and is at least as new as every prerequisite.
+        """
+        try:
+            oldest_output = min(os.path.getmtime(p) for p in outputs)
+        except (FileNotFoundError, ValueError):
+            return False
+        try:
+            newest_prerequisite = max(os.path.getmtime(p) for p in prerequisites)
+        except FileNotFoundError:
+            return False
+        except ValueError:
+            return True
+        return oldest_output >= newest_prerequisite
+
+    @staticmethod
+    def block_hash(lines):
+        """Content hash of a block, used to key caches and detect changes."""
+        return hashlib.blake2b("".join(lines).encode("utf-8"), digest_size=16).hexdigest()
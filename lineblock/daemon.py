@@ -0,0 +1,331 @@
+"""
+Persistent daemon.
+
+Keeps a tree warm between runs: the discovered file list, and each file's
+text and extracted blocks, stay in memory and are revalidated by stat()
+instead of being rescanned.  Clients talk to the daemon over a Unix socket
+with one JSON object per line in each direction.
+"""
+
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Optional, Union
+
+from lineblock.api import extract_blocks, render
+from lineblock.block_store import block_lookup, block_size, parse_size
+from lineblock.format_cache import FormatCache
+from lineblock.lineblock import discover_files, load_exclude_patterns, _normalize_to_list
+from lineblock.writer import AtomicWriter
+
+DEFAULT_SOCKET = ".lineblock.sock"
+DEFAULT_CACHE_SIZE = "256M"
+COMMANDS = ("sync", "check", "where", "blocks", "ping", "shutdown")
+
+
+def _signature(path: Path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+class DocumentCache:
+    """
+    Parsed documents, least recently used first out.
+
+    Maps a path to its text and extracted blocks.  An entry is valid while
+    the file's (mtime, size) is unchanged; the total size of the held
+    documents is kept below ``max_bytes``.
+    """
+
+    def __init__(self, max_bytes: Union[int, str] = DEFAULT_CACHE_SIZE):
+        self.max_bytes = parse_size(max_bytes)
+        self._entries = OrderedDict()  # path -> (signature, text, blocks, size)
+        self._bytes = 0
+
+        # Instrumentation
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def bytes(self) -> int:
+        return self._bytes
+
+    def get(self, path: Path):
+        """Return (text, blocks) for path, re-reading it only if it changed."""
+        signature = _signature(path)
+        entry = self._entries.get(path)
+        if entry is not None and entry[0] == signature:
+            self._entries.move_to_end(path)
+            self.hits += 1
+            return entry[1], entry[2]
+        self.misses += 1
+        with open(path, "r") as f:
+            text = f.read()
+        blocks = extract_blocks(text, filename=str(path))
+        self.put(path, text, blocks, signature)
+        return text, blocks
+
+    def put(self, path: Path, text: str, blocks: List[dict], signature=None):
+        self.discard(path)
+        size = sys.getsizeof(text) + sum(block_size(block["block"]) for block in blocks)
+        self._entries[path] = (signature or _signature(path), text, blocks, size)
+        self._bytes += size
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            _, (_, _, _, evicted) = self._entries.popitem(last=False)
+            self._bytes -= evicted
+            self.evictions += 1
+
+    def discard(self, path: Path):
+        entry = self._entries.pop(path, None)
+        if entry is not None:
+            self._bytes -= entry[3]
+
+
+class TreeIndex:
+    """
+    Discovered files of a tree.
+
+    Rediscovers only when a directory seen by the last walk has changed
+    (an entry added, removed or renamed) or disappeared.
+    """
+
+    def __init__(self, root: Path, patterns, subdirs, exclude_patterns):
+        self.root = root
+        self.patterns = patterns
+        self.subdirs = subdirs
+        self.exclude_patterns = exclude_patterns
+        self.files = []
+        self._directories = {}
+        self.walks = 0
+
+    def _stale(self) -> bool:
+        if self.walks == 0:
+            return True
+        for directory, mtime in self._directories.items():
+            try:
+                if os.stat(directory).st_mtime_ns != mtime:
+                    return True
+            except FileNotFoundError:
+                return True
+        return False
+
+    def refresh(self) -> List[Path]:
+        if self._stale():
+            self.files = list(discover_files(self.root, self.patterns, self.subdirs, self.exclude_patterns))
+            self._directories = {}
+            for directory, _, _ in os.walk(self.root):
+                self._directories[directory] = os.stat(directory).st_mtime_ns
+            self.walks += 1
+        return self.files
+
+
+class Daemon:
+    """
+    Serves sync, check and where requests for one tree over a Unix socket.
+
+    Requests are handled one at a time, so a sync never races another
+    request over the same files.
+    """
+
+    def __init__(
+            self,
+            path: Union[str, Path],
+            socket_path: Optional[Union[str, Path]] = None,
+            pattern: Optional[Union[str, List[str]]] = None,
+            exclude: Optional[Union[str, List[str]]] = None,
+            exclude_file: Optional[str] = None,
+            dirs: Optional[Union[str, List[str]]] = None,
+            cache_size: Union[int, str] = DEFAULT_CACHE_SIZE,
+    ):
+        self.root = Path(path).expanduser().resolve()
+        if not self.root.is_dir():
+            raise NotADirectoryError(f"Daemon root is not a directory: {self.root}")
+        self.socket_path = Path(socket_path) if socket_path else self.root / DEFAULT_SOCKET
+        exclude_patterns = _normalize_to_list(exclude) or []
+        if exclude_file:
+            exclude_patterns.extend(load_exclude_patterns(exclude_file))
+        self.tree = TreeIndex(self.root, _normalize_to_list(pattern), _normalize_to_list(dirs), exclude_patterns)
+        # The cache budget is shared: three quarters for documents, the rest
+        # for formatted blocks, which gain a key with every edit
+        cache_bytes = parse_size(cache_size)
+        self.documents = DocumentCache(cache_bytes - cache_bytes // 4)
+        self.format_cache = FormatCache(max_bytes=cache_bytes // 4)
+        self.writer = AtomicWriter()
+        self._server = None
+        self._stopped = threading.Event()
+
+    # Commands
+
+    def _scan(self):
+        """Return [(path, text)] for the tree and its block map, in file order."""
+        documents = []
+        block_map = []
+        for file_path in self.tree.refresh():
+            try:
+                text, blocks = self.documents.get(file_path)
+            except FileNotFoundError:
+                self.documents.discard(file_path)
+                continue
+            documents.append((file_path, text))
+            block_map.extend(blocks)
+        return documents, block_map
+
+    def _render_all(self, write: bool):
+        documents, block_map = self._scan()
+        lookup = block_lookup(block_map)
+        updated = []
+        regions = []
+        for file_path, text in documents:
+            result = render(text, lookup, filename=str(file_path), format_cache=self.format_cache)
+            regions.extend(result.regions)
+            if result.changed:
+                updated.append(str(file_path))
+                if write:
+                    self.writer.write(file_path, result.text)
+                    self.documents.put(file_path, result.text, extract_blocks(result.text, filename=str(file_path)))
+        return documents, block_map, updated, regions
+
+    def sync(self) -> dict:
+        documents, _, updated, _ = self._render_all(write=True)
+        return {"files": len(documents), "updated": updated}
+
+    def check(self) -> dict:
+        documents, _, updated, regions = self._render_all(write=False)
+        stale = [region for region in regions if region["status"] == "updated"]
+        return {"files": len(documents), "updated": updated, "stale": stale}
+
+    def where(self, identity: str) -> dict:
+        _, block_map, _, regions = self._render_all(write=False)
+        return {
+            "identity": identity,
+            "extracts": [{"path": block["path"], "line": block["start_line"]}
+                         for block in block_map if block["identity"] == identity],
+            "inserts": [region for region in regions if region["identity"] == identity],
+        }
+
+    def blocks(self) -> dict:
+        _, block_map = self._scan()
+        return {"blocks": block_map}
+
+    def ping(self) -> dict:
+        return {
+            "root": str(self.root),
+            "files": len(self.tree.files),
+            "walks": self.tree.walks,
+            "documents": len(self.documents),
+            "cache_bytes": self.documents.bytes,
+            "cache_hits": self.documents.hits,
+            "cache_misses": self.documents.misses,
+            "format_cache_bytes": self.format_cache.bytes,
+            "format_cache_entries": len(self.format_cache),
+        }
+
+    def handle(self, request) -> dict:
+        """Run one request (a decoded JSON object) and return its response."""
+        try:
+            if not isinstance(request, dict):
+                raise ValueError("Invalid request: expected a JSON object")
+            command = request.get("command")
+            if command == "sync":
+                result = self.sync()
+            elif command == "check":
+                result = self.check()
+            elif command == "where":
+                if not request.get("identity"):
+                    raise ValueError("where requires an identity")
+                result = self.where(request["identity"])
+            elif command == "blocks":
+                result = self.blocks()
+            elif command == "ping":
+                result = self.ping()
+            elif command == "shutdown":
+                self._stopped.set()
+                result = {}
+            else:
+                raise ValueError(f"Unknown command '{command}'")
+        except Exception as e:
+            return {"ok": False, "error": f"{type(e).__name__}: {e}"}
+        return {"ok": True, **result}
+
+    # Server
+
+    def bind(self):
+        """Create the listening socket, replacing a stale socket file."""
+        if self.socket_path.exists():
+            if _alive(self.socket_path):
+                raise RuntimeError(f"A daemon is already listening on {self.socket_path}")
+            self.socket_path.unlink()
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    try:
+                        response = daemon.handle(json.loads(line))
+                    except json.JSONDecodeError as e:
+                        response = {"ok": False, "error": f"Invalid request: {e}"}
+                    self.wfile.write((json.dumps(response, default=str) + "\n").encode("utf-8"))
+                    self.wfile.flush()
+                    if daemon._stopped.is_set():
+                        return
+
+        self._server = socketserver.UnixStreamServer(str(self.socket_path), Handler)
+        self._server.timeout = 0.2
+
+    def serve_forever(self):
+        """Handle requests until a shutdown request or stop()."""
+        if self._server is None:
+            self.bind()
+        try:
+            while not self._stopped.is_set():
+                self._server.handle_request()
+        finally:
+            self._server.server_close()
+            self._server = None
+            self.writer.flush()
+            try:
+                self.socket_path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def stop(self):
+        self._stopped.set()
+
+
+def _alive(socket_path: Path) -> bool:
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(str(socket_path))
+        except OSError:
+            return False
+    return True
+
+
+def request(socket_path: Union[str, Path], command: str, timeout: Optional[float] = None, **fields) -> dict:
+    """
+    Send one request to a daemon and return its response.
+
+    Raises:
+        ConnectionError: No daemon is listening on socket_path
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        try:
+            sock.connect(str(socket_path))
+        except (FileNotFoundError, ConnectionRefusedError) as e:
+            raise ConnectionError(f"No lineblock daemon listening on {socket_path}") from e
+        sock.sendall((json.dumps({"command": command, **fields}) + "\n").encode("utf-8"))
+        with sock.makefile("rb") as stream:
+            line = stream.readline()
+    if not line:
+        raise ConnectionError(f"Daemon on {socket_path} closed the connection")
+    return json.loads(line)
@@ -0,0 +1,107 @@
+"""
+Build-system dependency output.
+
+A depfile lists, for each sink file (a file with insert regions), the
+producer files whose blocks it includes, in the make syntax that ninja
+also reads (``depfile =`` / ``deps = gcc``).  The optional ninja fragment
+has one edge per sink file, so ninja re-renders exactly the sinks whose
+producers changed.
+"""
+
+import os
+import shlex
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Union
+
+
+def escape_make(path: Union[str, Path]) -> str:
+    """Escape a path for a make/ninja depfile."""
+    text = str(path)
+    text = text.replace("\\", "\\\\").replace(" ", "\\ ").replace("#", "\\#")
+    return text.replace("$", "$$")
+
+
+def escape_ninja(path: Union[str, Path]) -> str:
+    """Escape a path for a ninja build statement."""
+    return str(path).replace("$", "$$").replace(" ", "$ ").replace(":", "$:")
+
+
+def ninja_shell_value(path: Union[str, Path]) -> str:
+    """Shell-quote a path for a ninja variable expanded into a rule's command."""
+    return shlex.quote(str(path)).replace("$", "$$")
+
+
+def depfile_text(dependencies: Dict[Path, Iterable[Path]]) -> str:
+    """
+    One make rule per target: ``target: producer ...``.
+
+    Args:
+        dependencies: Target path -> producer paths
+    """
+    rules = []
+    for target in sorted(dependencies):
+        producers = sorted(set(dependencies[target]))
+        rule = escape_make(target) + ":"
+        for producer in producers:
+            rule += " \\\n  " + escape_make(producer)
+        rules.append(rule + "\n")
+    return "".join(rules)
+
+
+def ninja_text(
+        dependencies: Dict[Path, Iterable[Path]],
+        root: Path,
+        outputs: Optional[Dict[Path, Path]] = None,
+        command: str = "lineblock",
+        selection: Iterable[str] = (),
+) -> str:
+    """
+    A ninja fragment with one edge per sink file.
+
+    Each edge renders its sink with ``lineblock render --stdin``, which reads
+    the tree's blocks from a running daemon or by scanning root for the files
+    the run selected (its pattern, exclude and dirs options).  With
+    outputs (sink -> output path, in output-directory mode) the edge builds
+    the output file.  Otherwise the sink is updated in place when it
+    changes, and the edge's output is a stamp holding the rendered text.
+    The root, selection and src variables are shell-quoted, since ninja
+    expands them into the commands verbatim.
+
+    Args:
+        dependencies: Sink path -> producer paths
+        root: Tree the blocks come from
+        outputs: Sink path -> rendered output path, in output mode
+        command: How to invoke lineblock
+        selection: render arguments selecting the files blocks come from
+    """
+    render = f"{command} render --stdin --root $root $selection --filename $src < $src"
+    lines = [
+        "# Generated by lineblock --ninja",
+        f"root = {ninja_shell_value(root)}",
+        "selection = " + " ".join(ninja_shell_value(arg) for arg in selection),
+        "stampdir = .lineblock-stamps",
+        "",
+        "rule lineblock_render",
+        f"  command = {render} > $out.tmp && mv $out.tmp $out",
+        "  description = lineblock $src",
+        "",
+        "rule lineblock_update",
+        f"  command = {render} > $out.tmp && (cmp -s $out.tmp $src || cp $out.tmp $src) && mv $out.tmp $out",
+        "  description = lineblock $src",
+        "",
+    ]
+    targets = []
+    for sink in sorted(dependencies):
+        producers = sorted(set(dependencies[sink]) - {sink})
+        if outputs is not None:
+            target, rule = escape_ninja(outputs[sink]), "lineblock_render"
+        else:
+            relative = os.path.relpath(sink, root)
+            target, rule = "$stampdir/" + escape_ninja(relative) + ".stamp", "lineblock_update"
+        targets.append(target)
+        implicit = " | " + " ".join(escape_ninja(p) for p in producers) if producers else ""
+        lines.append(f"build {target}: {rule} {escape_ninja(sink)}{implicit}")
+        lines.append(f"  src = {ninja_shell_value(sink)}")
+    lines.append("")
+    lines.append("build lineblock: phony " + " ".join(targets))
+    return "\n".join(lines) + "\n"
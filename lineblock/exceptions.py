@@ -50,6 +50,28 @@ class OrphanedInsertEndMarkerError(Exception):
                    f"No corresponding block insert marker found.")
         super().__init__(message)
 
+class StaleRegionError(Exception):
+    """Exception raised in fail-fast check mode when an insert region is out of date."""
+
+    def __init__(self, source_file, line_number, identity=""):
+        self.source_file = source_file
+        self.line_number = line_number
+        self.identity = identity
+        message = (f"Stale insert region '{identity}' at line {line_number} "
+                   f"in file '{source_file}'.")
+        super().__init__(message)
+
+class MissingIdentityError(ValueError):
+    """Exception raised when an insert marker names an identity that no extract block defines."""
+
+    def __init__(self, source_file, line_number, identity=""):
+        self.source_file = source_file
+        self.line_number = line_number
+        self.identity = identity
+        message = (f"Identity '{identity}' not found in block map "
+                   f"(insert marker at line {line_number} in file '{source_file}').")
+        super().__init__(message)
+
 class IncompatibleOptionsError(Exception):
     """Raised when incompatible options are provided."""
     pass
@@ -58,3 +80,13 @@ class IncompatibleOptionsError(Exception):
 class NotAFileError(Exception):
     """Raised when a file is expected but not found."""
     pass
+
+
+class RunCancelledError(Exception):
+    """Raised when a run is cancelled through its hooks."""
+    pass
+
+
+class InvalidIndexError(Exception):
+    """Raised when a block index file is not valid or has an unsupported version."""
+    pass
@@ -0,0 +1,43 @@
+import os
+import threading
+from pathlib import Path
+from typing import List, Union
+
+
+class BlockFileCache:
+    """
+    Per-run cache of block file contents.
+
+    Entries are keyed by path and validated against the file's (mtime, size),
+    so a block file referenced by many markers, dialect passes and source
+    files is read once per run, and re-read only if it changes.
+    """
+
+    def __init__(self):
+        self._cache = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def read(self, path: Union[str, Path]) -> List[str]:
+        """
+        Return the lines of a block file.
+
+        Raises:
+            FileNotFoundError: If the block file does not exist
+        """
+        key = os.fspath(path)
+        st = os.stat(key)
+        signature = (st.st_mtime_ns, st.st_size)
+        entry = self._cache.get(key)
+        if entry is not None and entry[0] == signature:
+            with self._lock:
+                self.hits += 1
+            return entry[1]
+
+        with open(key, "r") as f:
+            lines = f.readlines()
+        with self._lock:
+            self.misses += 1
+            self._cache[key] = (signature, lines)
+        return lines
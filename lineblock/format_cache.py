@@ -0,0 +1,68 @@
+import threading
+from collections import OrderedDict
+from typing import Optional, Union
+
+from lineblock.block_store import block_size, parse_size
+from lineblock.common import Common
+
+
+class FormatCache:
+    """
+    Per-run cache of formatted (indented) blocks.
+
+    Keyed by (identity, content hash, indent) so that a block inserted at the
+    same indent into many files is formatted only once per run.  With
+    ``max_bytes``, the least recently used entries are dropped to keep the
+    formatted blocks held below that size (for long-lived callers such as
+    the daemon, where every edit adds a key).
+    """
+
+    def __init__(self, max_bytes: Optional[Union[int, str]] = None):
+        self.max_bytes = parse_size(max_bytes) if max_bytes is not None else None
+        self._cache = OrderedDict()  # key -> (formatted lines, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, identity: str, block, content_hash: str, indent: int) -> list:
+        """
+        Return the formatted lines of block, formatting it on the first request.
+
+        block may be a callable returning the lines, called only on a miss.
+        """
+        key = (identity, content_hash, indent)
+        entry = self._cache.get(key)
+        if entry is None:
+            formatted = Common.indent_lines(block() if callable(block) else block, indent)
+            with self._lock:
+                self.misses += 1
+                entry = self._cache.get(key)
+                if entry is None:
+                    entry = (formatted, block_size(formatted) if self.max_bytes is not None else 0)
+                    self._cache[key] = entry
+                    self._bytes += entry[1]
+                    self._evict()
+        else:
+            with self._lock:
+                self.hits += 1
+                if self.max_bytes is not None and key in self._cache:
+                    self._cache.move_to_end(key)
+        return entry[0]
+
+    def _evict(self):
+        if self.max_bytes is None:
+            return
+        while self._bytes > self.max_bytes and len(self._cache) > 1:
+            _, (_, size) = self._cache.popitem(last=False)
+            self._bytes -= size
+            self.evictions += 1
+
+    @property
+    def bytes(self) -> int:
+        """Approximate size of the formatted blocks held (counted only with max_bytes)."""
+        return self._bytes
+
+    def __len__(self):
+        return len(self._cache)
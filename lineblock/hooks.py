@@ -0,0 +1,72 @@
+import threading
+from typing import Callable
+
+from lineblock.exceptions import RunCancelledError
+
+EVENTS = ("file_discovered", "file_scanned", "block_extracted", "region_updated", "file_written", "error")
+
+
+class Hooks:
+    """
+    Callbacks observing a run.
+
+    Register a callback for an event with ``register()`` or the ``on()``
+    decorator.  Each callback is called with a dict holding the event name
+    under "event" and the event's fields:
+
+        file_discovered  path
+        file_scanned     path, blocks (number extracted)
+        block_extracted  block (the block record)
+        region_updated   path, line, identity (in check mode: a stale region)
+        file_written     path, method ("write", or how an unchanged file was
+                         linked into the output directory)
+        error            path, error (the exception, raised again afterwards)
+
+    With several jobs, callbacks are called from worker threads.
+
+    ``cancel()`` (callable from a callback or another thread) stops the run
+    before its next file with RunCancelledError; a callback may also raise
+    RunCancelledError itself.  Events without callbacks cost one attribute
+    check, and a run without hooks does not check at all.
+    """
+
+    def __init__(self):
+        self._callbacks = {event: [] for event in EVENTS}
+        self._cancelled = threading.Event()
+
+    def register(self, event: str, callback: Callable[[dict], None]) -> Callable[[dict], None]:
+        """Call callback on each event; returns callback."""
+        if event not in self._callbacks:
+            raise ValueError(f"Unknown event '{event}', expected one of: {', '.join(EVENTS)}")
+        self._callbacks[event].append(callback)
+        return callback
+
+    def unregister(self, event: str, callback: Callable[[dict], None]) -> None:
+        self._callbacks[event].remove(callback)
+
+    def on(self, event: str):
+        """Decorator form of register()."""
+        return lambda callback: self.register(event, callback)
+
+    def wants(self, event: str) -> bool:
+        """True if event has callbacks; lets callers skip building the event."""
+        return bool(self._callbacks[event])
+
+    def emit(self, event: str, **fields) -> None:
+        callbacks = self._callbacks[event]
+        if callbacks:
+            payload = {"event": event, **fields}
+            for callback in list(callbacks):
+                callback(payload)
+
+    def cancel(self) -> None:
+        """Ask the run to stop before its next file."""
+        self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def check_cancelled(self) -> None:
+        if self._cancelled.is_set():
+            raise RunCancelledError("Run cancelled")
@@ -0,0 +1,146 @@
+"""
+Block index: the extracted block map saved as a file.
+
+The index is written once after the extract phase and loaded by later runs
+(on other machines, or by the shards of one run) instead of scanning the
+tree again.  Paths are stored relative to the tree's root, so an index made
+in one checkout loads into another.
+
+Format (integers little-endian)::
+
+    header   magic "LBIX", version u16, flags u16, payload length u32
+    payload  zlib-compressed:
+             path count u32, then each path: length u32, UTF-8
+             block count u32, then each block:
+                 path index u32, start_line u32, end_line u32, indent i32,
+                 head u32, tail u32, hash (16 bytes), identity length u16,
+                 content length u32, identity UTF-8, content UTF-8
+"""
+
+import struct
+import zlib
+from pathlib import Path
+from typing import Iterable, List, Union
+
+from lineblock.common import Common
+from lineblock.exceptions import InvalidIndexError
+from lineblock.writer import AtomicWriter
+
+MAGIC = b"LBIX"
+VERSION = 1
+
+_HEADER = struct.Struct("<4sHHI")
+_COUNT = struct.Struct("<I")
+_BLOCK = struct.Struct("<IIIiII16sHI")
+
+
+def _relative(path: Path, root: Path) -> str:
+    try:
+        return Path(path).relative_to(root).as_posix()
+    except ValueError:
+        return str(path)
+
+
+def dumps(blocks: Iterable[dict], root: Union[str, Path]) -> bytes:
+    """Serialise block records, with their paths made relative to root."""
+    root = Path(root)
+    paths = {}
+    body = []
+    for block in blocks:
+        path_index = paths.setdefault(_relative(block["path"], root), len(paths))
+        identity = block["identity"].encode("utf-8")
+        content = "".join(block["block"]).encode("utf-8")
+        body.append(_BLOCK.pack(path_index, block["start_line"], block["end_line"], block["indent"],
+                                block["head"], block["tail"], bytes.fromhex(block["hash"]),
+                                len(identity), len(content)))
+        body.append(identity)
+        body.append(content)
+
+    table = [_COUNT.pack(len(paths))]
+    for path in paths:
+        encoded = path.encode("utf-8")
+        table.append(_COUNT.pack(len(encoded)))
+        table.append(encoded)
+    table.append(_COUNT.pack(len(body) // 3))
+    payload = zlib.compress(b"".join(table + body), 1)
+    return _HEADER.pack(MAGIC, VERSION, 0, len(payload)) + payload
+
+
+def loads(data: bytes, root: Union[str, Path]) -> List[dict]:
+    """
+    Deserialise an index into block records, with their paths under root.
+
+    Each block's content is checked against its stored hash.
+    """
+    root = Path(root)
+    if len(data) < _HEADER.size:
+        raise InvalidIndexError("Block index is truncated")
+    magic, version, _flags, length = _HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise InvalidIndexError("Not a block index")
+    if version != VERSION:
+        raise InvalidIndexError(f"Unsupported block index version {version} (expected {VERSION})")
+    try:
+        payload = zlib.decompress(data[_HEADER.size:_HEADER.size + length])
+    except zlib.error as e:
+        raise InvalidIndexError(f"Block index is corrupt: {e}") from e
+
+    try:
+        (count,) = _COUNT.unpack_from(payload, 0)
+        offset = _COUNT.size
+        paths = []
+        for _ in range(count):
+            (size,) = _COUNT.unpack_from(payload, offset)
+            offset += _COUNT.size
+            paths.append(root / payload[offset:offset + size].decode("utf-8"))
+            offset += size
+
+        (count,) = _COUNT.unpack_from(payload, offset)
+        offset += _COUNT.size
+        blocks = []
+        for _ in range(count):
+            (path_index, start_line, end_line, indent, head, tail, digest,
+             identity_size, content_size) = _BLOCK.unpack_from(payload, offset)
+            offset += _BLOCK.size
+            identity = payload[offset:offset + identity_size].decode("utf-8")
+            offset += identity_size
+            content = payload[offset:offset + content_size].decode("utf-8")
+            offset += content_size
+            block = Common.split_lines(content)
+            if Common.block_hash(block) != digest.hex():
+                raise InvalidIndexError(f"Block index is corrupt: content hash mismatch for '{identity}'")
+            blocks.append({
+                "path": paths[path_index],
+                "identity": identity,
+                "start_line": start_line,
+                "end_line": end_line,
+                "indent": indent,
+                "head": head,
+                "tail": tail,
+                "block": block,
+                "hash": digest.hex(),
+            })
+    except (struct.error, IndexError, UnicodeDecodeError) as e:
+        raise InvalidIndexError(f"Block index is corrupt: {e}") from e
+    return blocks
+
+
+def save_index(path: Union[str, Path], blocks: Iterable[dict], root: Union[str, Path]) -> int:
+    """
+    Write the block index atomically.
+
+    Returns:
+        int: Number of bytes written
+    """
+    data = dumps(blocks, root)
+    AtomicWriter().write(path, data)
+    return len(data)
+
+
+def load_index(path: Union[str, Path], root: Union[str, Path]) -> List[dict]:
+    """Read a block index written by ``save_index()``."""
+    try:
+        data = Path(path).read_bytes()
+    except FileNotFoundError as e:
+        raise FileNotFoundError(f"Block index '{path}' not found.") from e
+    return loads(data, root)
@@ -5,17 +5,23 @@ For directories: supports glob matching, inclusion/exclusion lists.
 For files: prints the absolute path of the specified file.
 """
 
-import argparse
 import fnmatch
+import json
 import os
 import sys
-import traceback
 from pathlib import Path
-from typing import List, Optional, Union
+from typing import Iterator, List, Optional, Union
 
 
-from lineblock.exceptions import OrphanedExtractEndMarkerError, UnclosedBlockError, NotAFileError, IncompatibleOptionsError
-from lineblock.process import process, process_inserts
+from lineblock.exceptions import OrphanedExtractEndMarkerError, UnclosedBlockError, NotAFileError, IncompatibleOptionsError, StaleRegionError, RunCancelledError
+from lineblock.hooks import Hooks
+from lineblock.process import process
+from lineblock.profiler import Profiler
+from lineblock.run import Run
+from lineblock.shard import parse_shard
+from lineblock.stats import RunStats
+from lineblock.tracer import Tracer
+from lineblock.writer import AtomicWriter
 
 
 
@@ -41,6 +47,7 @@ def should_exclude(path: Path, exclude_patterns: List[str], root: Path) -> bool:
     - glob patterns (e.g., "*.pyc", "temp.*")
     - directory patterns (e.g., "build/", "*.egg-info/")
     - path patterns (e.g., "docs/_build")
+    - root-anchored patterns (e.g., "/out", which excludes out/ at root only)
     """
     # Get path relative to root for matching
     try:
@@ -63,6 +70,13 @@ def should_exclude(path: Path, exclude_patterns: List[str], root: Path) -> bool:
             if not path.is_dir():
                 continue
 
+        # A leading / anchors the pattern to root
+        if pattern.startswith('/'):
+            pattern = pattern[1:]
+            if any(fnmatch.fnmatch('/'.join(path_parts[:i + 1]), pattern) for i in range(len(path_parts))):
+                return True
+            continue
+
         # Check if pattern matches any component or the full path
         if pattern in path_parts:
             return True
@@ -108,19 +122,20 @@ def matches_patterns(path: Path, patterns: Optional[List[str]]) -> bool:
     return any(fnmatch.fnmatch(path.name, p) for p in patterns)
 
 
-def traverse_directory1(
+def discover_files(
         root: Path,
-        patterns: Optional[List[str]],
-        subdirs: Optional[List[str]],
-        exclude_patterns: List[str]
-) -> None:
-    """
-    Traverse directory and print matching file absolute paths.
+        patterns: Optional[List[str]] = None,
+        subdirs: Optional[List[str]] = None,
+        exclude_patterns: Optional[List[str]] = None,
+        stats: Optional[RunStats] = None
+) -> Iterator[Path]:
     """
-    target_dirs = get_target_dirs(root, subdirs)
+    Yield the resolved paths of files under root that match patterns and are not excluded.
 
-    block_map = []
-    for start_dir in target_dirs:
+    Discovered and excluded files are counted in stats, if given.
+    """
+    exclude_patterns = exclude_patterns or []
+    for start_dir in get_target_dirs(root, subdirs):
         if not start_dir.exists():
             raise FileNotFoundError(f"Directory does not exist: {start_dir}")
 
@@ -131,6 +146,8 @@ def traverse_directory1(
         for path in start_dir.rglob('*'):
             # Skip if excluded
             if should_exclude(path, exclude_patterns, root):
+                if stats is not None and path.is_file():
+                    stats.add("files_excluded")
                 continue
 
             # Skip directories (we only print files)
@@ -139,27 +156,90 @@ def traverse_directory1(
 
             # Check pattern match
             if matches_patterns(path, patterns):
-                block_map.extend(process(file_path=path.resolve()))
+                if stats is not None:
+                    stats.add("files_discovered")
+                yield path.resolve()
 
-        # Again for insert
-    for start_dir in target_dirs:
-        # Use rglob for recursive traversal
-        for path in start_dir.rglob('*'):
-            # Skip if excluded
-            if should_exclude(path, exclude_patterns, root):
-                continue
 
-            # Skip directories (we only print files)
-            if not path.is_file():
-                continue
+def iter_blocks(
+        root: Union[str, Path],
+        patterns: Optional[Union[str, List[str]]] = None,
+        exclude: Optional[Union[str, List[str]]] = None,
+        exclude_file: Optional[str] = None,
+        dirs: Optional[Union[str, List[str]]] = None
+) -> Iterator[dict]:
+    """
+    Yield block records as they are discovered under root.
 
-            # Check pattern match
-            if matches_patterns(path, patterns):
-                process_inserts(block_map=block_map, file_path=path.resolve())
+    Files are discovered lazily and scanned one at a time, so consumers can
+    start work before discovery finishes and memory stays bounded by the
+    largest single file.
+
+    Args:
+        root: File or directory to scan
+        patterns: Pattern(s) to match (directory only)
+        exclude: Pattern(s) to exclude (directory only)
+        exclude_file: File containing exclusion patterns (directory only)
+        dirs: Specific subdirectories to scan (directory only)
+
+    Yields:
+        dict: Block records with path, identity, start_line, end_line, indent,
+        head, tail, block and hash
+    """
+    root = Path(root).expanduser().resolve()
+    if not root.exists():
+        raise FileNotFoundError(f"Path does not exist: {root}")
+    if root.is_file():
+        files = iter([root])
+    else:
+        exclude_patterns = _normalize_to_list(exclude) or []
+        if exclude_file:
+            exclude_patterns.extend(load_exclude_patterns(exclude_file))
+        files = discover_files(root, _normalize_to_list(patterns), _normalize_to_list(dirs), exclude_patterns)
+    for path in files:
+        yield from process(file_path=path)
+
+
+def block_to_json(record: dict) -> str:
+    """Serialise a block record as one line of NDJSON."""
+    return json.dumps({**record, "path": str(record["path"])})
+
+
+def traverse_directory1(
+        root: Path,
+        patterns: Optional[List[str]],
+        subdirs: Optional[List[str]],
+        exclude_patterns: List[str],
+        run: Optional[Run] = None
+) -> None:
+    """
+    Traverse directory and print matching file absolute paths.
+    """
+    run = run if run is not None else Run()
+    run.source_root = root
+
+    try:
+        with run.phase("discover"), run.measure("discover"):
+            files = []
+            for path in discover_files(root, patterns, subdirs, exclude_patterns, run.stats):
+                if not run.in_output(path):
+                    files.append(path)
+                    run.discovered(path)
+        with run.phase("extract"):
+            if run.index is not None:
+                run.load_index()
+            else:
+                run.extract_all(files)
+            run.save_index()
+        # Again for insert, over this run's shard
+        with run.phase("insert"):
+            run.insert_all([path for path in files if run.in_shard(path)])
+    finally:
+        run.close()
     return
 
 
-def handle_single_file1(target_path: Path) -> None:
+def handle_single_file1(target_path: Path, run: Optional[Run] = None) -> None:
     """
     Handle case when positional argument is a single file.
     Prints the absolute path of the file.
@@ -170,10 +250,23 @@ def handle_single_file1(target_path: Path) -> None:
     if not target_path.is_file():
         raise NotAFileError(f"Not a file: {target_path}")
 
-    block_map = []
-    block_map.extend(process(file_path=target_path.resolve())) # todo: what to do here?
-    print(block_map)
-    process_inserts(block_map=block_map, file_path=target_path.resolve())
+    run = run if run is not None else Run()
+    run.source_root = target_path.resolve().parent
+    run.stats.add("files_discovered")
+    run.discovered(target_path.resolve())
+    try:
+        with run.phase("extract"):
+            if run.index is not None:
+                run.load_index()
+            else:
+                run.extract(target_path.resolve()) # todo: what to do here?
+            run.save_index()
+        # A count, not the records: printing a BlockStore would read back every spilled block
+        print(f"Extracted {len(run.block_map)} block(s)", file=run.progress)
+        with run.phase("insert"):
+            run.insert(target_path.resolve())
+    finally:
+        run.close()
     return
 
 
@@ -201,36 +294,66 @@ def load_exclude_patterns(exclude_file: str) -> List[str]:
     return patterns
 
 
-def handle_single_file(target_path: Path) -> None:
+def handle_single_file(target_path: Path, run: Optional[Run] = None) -> None:
     """Process a single file."""
     # Implementation placeholder
-    print(f"Processing single file: {target_path}")
-    handle_single_file1(target_path=target_path)
+    run = run if run is not None else Run()
+    print(f"Processing single file: {target_path}", file=run.progress)
+    handle_single_file1(target_path=target_path, run=run)
 
 
 def traverse_directory(
         root: Path,
         patterns: Optional[List[str]] = None,
         subdirs: Optional[List[str]] = None,
-        exclude_patterns: Optional[List[str]] = None
+        exclude_patterns: Optional[List[str]] = None,
+        run: Optional[Run] = None
 ) -> None:
     """Traverse directory with given patterns."""
     # Implementation placeholder
-    print(f"Traversing directory: {root}")
+    run = run if run is not None else Run()
+    print(f"Traversing directory: {root}", file=run.progress)
     if patterns:
-        print(f"  Patterns: {patterns}")
+        print(f"  Patterns: {patterns}", file=run.progress)
     if subdirs:
-        print(f"  Subdirs: {subdirs}")
+        print(f"  Subdirs: {subdirs}", file=run.progress)
     if exclude_patterns:
-        print(f"  Excludes: {exclude_patterns}")
-    traverse_directory1(root=root, patterns=patterns, subdirs=subdirs, exclude_patterns=exclude_patterns)
+        print(f"  Excludes: {exclude_patterns}", file=run.progress)
+    traverse_directory1(root=root, patterns=patterns, subdirs=subdirs, exclude_patterns=exclude_patterns,
+                        run=run)
 
 def lineblock(
         path: Union[str, Path],
         pattern: Optional[Union[str, List[str]]] = None,
         exclude: Optional[Union[str, List[str]]] = None,
         exclude_file: Optional[str] = None,
-        dirs: Optional[Union[str, List[str]]] = None
+        dirs: Optional[Union[str, List[str]]] = None,
+        max_memory: Optional[Union[int, str]] = None,
+        stamp: bool = False,
+        fsync: bool = False,
+        check: bool = False,
+        fail_fast: bool = False,
+        jobs: int = 1,
+        output: Optional[Union[str, Path]] = None,
+        link_mode: str = "auto",
+        ndjson: Optional[Union[str, Path]] = None,
+        profile: Optional[Union[str, Path]] = None,
+        profile_top: int = 10,
+        profile_pstats: Optional[Union[str, Path]] = None,
+        stats: Optional[RunStats] = None,
+        stats_format: Optional[str] = None,
+        prometheus: Optional[Union[str, Path]] = None,
+        trace: Optional[Union[str, Path]] = None,
+        hooks: Optional[Hooks] = None,
+        memory_report: Optional[Union[str, Path]] = None,
+        memory_top: int = 10,
+        depfile: Optional[Union[str, Path]] = None,
+        ninja: Optional[Union[str, Path]] = None,
+        shard: Optional[str] = None,
+        index: Optional[Union[str, Path]] = None,
+        index_out: Optional[Union[str, Path]] = None,
+        keep_going: bool = False,
+        error_format: str = "text"
 ) -> int:
     """
     Process files with line blocking logic.
@@ -241,9 +364,77 @@ def lineblock(
         exclude: Pattern(s) to exclude (directory only)
         exclude_file: File containing exclusion patterns (directory only)
         dirs: Specific subdirectories to process (directory only)
+        max_memory: Memory budget for extracted block content, in bytes or with a
+            K/M/G suffix (e.g. "256M"). Blocks beyond the budget are spilled to a
+            temporary on-disk store and read back during insertion. A quarter of
+            the budget bounds the cache of formatted (indented) blocks.
+        stamp: Write end markers carrying a digest of the region and its source
+            block (e.g. "<!-- end insert h=ab12cd34 -->"), so that current
+            regions are recognised by digest on later runs.
+        fsync: Sync updated files to disk before replacing them. Files are
+            always replaced atomically, so an interrupted run never leaves a
+            truncated file.
+        check: Extract and compare in memory without writing any file. Stale
+            insert regions are listed and 1 is returned if there are any.
+        fail_fast: In check mode, stop at the first stale insert region.
+        jobs: Number of files processed concurrently in each phase.
+        output: Render into this directory, mirroring the target's tree, instead
+            of updating files in place. Files without changed insert regions
+            are linked rather than rewritten.
+        link_mode: How unchanged files are mirrored into output: "auto"
+            (reflink, else hardlink, else copy), "reflink", "hardlink" or "copy".
+        ndjson: Stream each extracted block record, as NDJSON, to this file
+            ("-" for stdout) while the extract phase runs. When a report is
+            written to stdout, progress messages and check results go to
+            stderr instead.
+        profile: Write a JSON profile of the run to this file ("-" for stdout):
+            wall and CPU time per phase (discover, extract, insert, write) and
+            per file. A short report is also printed to stderr.
+        profile_top: Number of slowest files listed in the profile.
+        profile_pstats: Also run each phase under cProfile and write
+            <phase>.pstats files to this directory (single job only).
+        stats: A RunStats filled in with the run's counters (files, bytes,
+            markers per dialect, regions, cache hits), for Python callers.
+        stats_format: Print the counters to stderr as "text" or "json".
+        prometheus: Write the counters to this file in the Prometheus text
+            format, atomically, for the node exporter's textfile collector.
+        trace: Write a Chrome trace-event JSON timeline of the run to this file
+            (view it in Perfetto or chrome://tracing): a span for discovery and
+            for each file's extract, insert and write, on its worker's track.
+        hooks: Hooks called as files are discovered, scanned and written, as
+            blocks are extracted and regions updated, and on errors. A run
+            cancelled through its hooks stops before its next file.
+        memory_report: Trace Python allocations with tracemalloc and write a
+            JSON report to this file ("-" for stdout): heap in use at the start
+            of each phase, its peak and what it retains, with the allocation
+            sites that grew most. A short report is also printed to stderr.
+        memory_top: Number of allocation sites listed per phase.
+        depfile: Write a make/ninja depfile to this file: for each file with
+            insert regions (or its rendering, with output), the producer files
+            whose blocks it includes.
+        ninja: Write a ninja fragment to this file with one edge per file with
+            insert regions, rendering it with `lineblock render --stdin`, and
+            the producer files as implicit inputs.
+        shard: "i/n": update only the files of shard i of n (directory only).
+            Files are assigned to shards by a stable hash of their path
+            relative to the target, so n runs with shards 1/n to n/n together
+            do what a single run does. Pair with index to skip scanning the
+            whole tree on every shard.
+        index: Load the blocks from this block index (see index_out) instead
+            of scanning the files for them.
+        index_out: Write the extracted blocks to this block index: a compact,
+            versioned binary file with paths relative to the target.
+        keep_going: Do not stop at the first structural error (an unclosed,
+            nested or orphaned marker, or an insert of an unknown identity):
+            collect them all, process every file without errors, and report
+            the errors to stderr at the end, sorted by file and line. Every
+            unknown identity is reported; an unclosed, nested or orphaned
+            marker ends the scan of its file, since the markers after it
+            cannot be paired reliably, so a file reports at most one of those.
+        error_format: Report the collected errors as "text" or "json".
 
     Returns:
-        0 on success, 1 on error
+        0 on success, 1 on error (or, in check mode, when a region is stale)
 
     Raises:
         IncompatibleOptionsError: If incompatible options provided for file target
@@ -277,14 +468,157 @@ def lineblock(
             incompatible_options.append("exclude_file")
         if subdirs is not None:
             incompatible_options.append("dirs")
+        if shard is not None:
+            incompatible_options.append("shard")
 
         if incompatible_options:
             raise IncompatibleOptionsError(
                 f"Options {', '.join(incompatible_options)} not allowed when target is a file"
             )
 
+    if fail_fast and not check:
+        raise IncompatibleOptionsError("Option fail_fast requires check")
+
+    if output is not None:
+        output_path = Path(output).expanduser().resolve()
+        if check:
+            raise IncompatibleOptionsError("Options check and output cannot be used together")
+        if target_path == output_path or target_path.is_relative_to(output_path):
+            raise IncompatibleOptionsError(
+                f"Output directory '{output_path}' must not contain the target path '{target_path}'"
+            )
+        if output_path.exists() and not output_path.is_dir():
+            raise NotADirectoryError(f"Output path is not a directory: {output_path}")
+        output_path.mkdir(parents=True, exist_ok=True)
+
+    if index is not None and index_out is not None:
+        raise IncompatibleOptionsError("Options index and index_out cannot be used together")
+    shard_range = parse_shard(shard) if shard is not None else None
+
+    stdout_reports = [name for name, value in (("ndjson", ndjson), ("profile", profile),
+                                               ("memory_report", memory_report)) if str(value) == "-"]
+    if len(stdout_reports) > 1:
+        raise IncompatibleOptionsError(f"Options {', '.join(stdout_reports)} cannot all write to stdout")
+
+    if error_format not in ("text", "json"):
+        raise ValueError(f'error_format must be "text" or "json", got "{error_format}"')
+    if stats_format not in (None, "text", "json"):
+        raise ValueError(f'stats_format must be "text" or "json", got "{stats_format}"')
+
+    profiler = None
+    if profile is not None or profile_pstats is not None:
+        if profile_pstats is not None and jobs > 1:
+            raise IncompatibleOptionsError("Options profile_pstats and jobs > 1 cannot be used together")
+        profiler = Profiler(pstats_dir=profile_pstats)
+
+    tracer = Tracer() if trace is not None else None
+    # Started before the Run, so the block map and caches are traced too
+    memory = None
+    if memory_report is not None:
+        # Imported here: tracemalloc and pickle are only needed for the report
+        from lineblock.memory import MemoryReport
+        memory = MemoryReport(top=memory_top)
+
+    run = Run(max_memory=max_memory, stamp=stamp, fsync=fsync, check=check, fail_fast=fail_fast, jobs=jobs,
+              output=output, link_mode=link_mode, profiler=profiler, tracer=tracer, stats=stats, hooks=hooks, memory=memory,
+              track_dependencies=depfile is not None or ninja is not None, shard=shard_range,
+              index=index, index_out=index_out, keep_going=keep_going,
+              quiet_stdout=bool(stdout_reports))
+
+    ndjson_file = None
+    if ndjson is not None:
+        ndjson_file = sys.stdout if str(ndjson) == "-" else open(ndjson, "w")
+        run.on_blocks = lambda blocks: _write_ndjson(ndjson_file, blocks)
+
+    try:
+        _dispatch(target_path, is_file_target, patterns, excludes, exclude_file, subdirs, run)
+    except StaleRegionError as e:
+        print(f"{e.source_file}:{e.line_number}: stale insert region '{e.identity}'", file=run.progress)
+        return 1
+    except RunCancelledError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    finally:
+        if ndjson_file is not None and ndjson_file is not sys.stdout:
+            ndjson_file.close()
+        if profiler is not None:
+            profiler.report(profile, top=profile_top)
+        if tracer is not None:
+            tracer.write(trace)
+        if memory is not None:
+            memory.report(memory_report)
+            memory.close()
+        if stats_format == "json":
+            print(run.stats.to_json(), file=sys.stderr)
+        elif stats_format == "text":
+            print(run.stats.to_text(), file=sys.stderr)
+        if prometheus is not None:
+            AtomicWriter().write(prometheus, run.stats.to_prometheus())
+
+    if run.dependencies is not None:
+        root = target_path if not is_file_target else target_path.parent
+        selection = _selection_args(root, patterns, excludes, exclude_file, subdirs, run.output)
+        _write_dependencies(run, root, depfile, ninja, selection)
+
+    status = run.report_errors(error_format) if keep_going else 0
+    if check:
+        return max(status, run.report_stale())
+    return status
+
+
+def _selection_args(root: Path, patterns: Optional[List[str]], excludes: Optional[List[str]],
+                    exclude_file: Optional[str], subdirs: Optional[List[str]],
+                    output: Optional[Path]) -> List[str]:
+    """
+    Command-line arguments selecting the files a run scanned, so that a later
+    ``lineblock render`` takes its blocks from the same files.
+    """
+    args = []
+    for pattern in patterns or []:
+        args += ["-p", pattern]
+    for exclude in excludes or []:
+        args += ["-x", exclude]
+    if exclude_file is not None:
+        args += ["--exclude-file", str(Path(exclude_file).resolve())]
+    for subdir in subdirs or []:
+        args += ["-d", subdir]
+    if output is not None and output.is_relative_to(root):
+        # The run skips its own output directory
+        args += ["-x", "/" + output.relative_to(root).as_posix()]
+    return args
+
+
+def _write_dependencies(run: Run, root: Path, depfile: Optional[Union[str, Path]],
+                        ninja: Optional[Union[str, Path]], selection: Optional[List[str]] = None) -> None:
+    """Write the depfile and ninja fragment of a run."""
+    from lineblock.depfile import depfile_text, ninja_text
+
+    writer = AtomicWriter()
+    outputs = None
+    if run.output is not None:
+        outputs = {sink: run.output_path(sink) for sink in run.dependencies}
+    if depfile is not None:
+        targets = {
+            (outputs[sink] if outputs is not None else sink): producers - {sink}
+            for sink, producers in run.dependencies.items()
+        }
+        writer.write(depfile, depfile_text(targets))
+    if ninja is not None:
+        writer.write(ninja, ninja_text(run.dependencies, root, outputs, selection=selection))
+
+
+def _dispatch(
+        target_path: Path,
+        is_file_target: bool,
+        patterns: Optional[List[str]],
+        excludes: Optional[List[str]],
+        exclude_file: Optional[str],
+        subdirs: Optional[List[str]],
+        run: Run
+) -> None:
+    """Run the single file or directory traversal for target_path."""
     if is_file_target:
-        handle_single_file(target_path)
+        handle_single_file(target_path, run=run)
     else:
         # Treat as directory traversal
         if not target_path.is_dir():
@@ -299,10 +633,15 @@ def lineblock(
             root=target_path,
             patterns=patterns,
             subdirs=subdirs,
-            exclude_patterns=exclude_patterns
+            exclude_patterns=exclude_patterns,
+            run=run
         )
 
-    return 0
+
+def _write_ndjson(stream, blocks: List[dict]) -> None:
+    for record in blocks:
+        stream.write(block_to_json(record) + "\n")
+    stream.flush()
 
 
 def _normalize_to_list(value: Optional[Union[str, List[str]]]) -> Optional[List[str]]:
@@ -1,3 +1,7 @@
+import hashlib
+import re
+
+
 class Markers:
     """
     Default values for command line parameters.
@@ -6,6 +10,7 @@ class Markers:
     _data = [
         {
             "type": "HTML",
+            "Comment": '<!--',
             "Extract": {
                 "Begin": r'(\s*)<!--\s*block extract\s+(?:"([^"]*)"|\'([^\']*)\'|(\S+))(?:\s+(-?\d+))?(?:\s+(\d+))?(?:\s+(\d+))?\s*-->.*',
                 "End": r"<!--\s*end extract.*?\s*-->.*",
@@ -18,6 +23,7 @@ class Markers:
         },
         {
             "type": "Python",
+            "Comment": '#',
             "Extract": {
                 "Begin": r'(\s*)#\s*block extract\s+(?:"([^"]*)"|\'([^\']*)\'|(\S+))(?:\s+(-?\d+))?(?:\s+(\d+))?(?:\s+(\d+))?\s*.*',
                 "End": r"#\s*end extract.*?\s*.*",
@@ -30,6 +36,7 @@ class Markers:
         },
         {
             "type": "C",
+            "Comment": '//',
             "Extract": {
                 "Begin": r'(\s*)//\s*block extract\s+(?:"([^"]*)"|\'([^\']*)\'|(\S+))(?:\s+(-?\d+))?(?:\s+(\d+))?(?:\s+(\d+))?\s*.*',
                 "End": r"//\s*end extract.*?\s*.*",
@@ -42,6 +49,7 @@ class Markers:
         },
         {
             "type": "Assembly",
+            "Comment": ';',
             "Extract": {
                 "Begin": r'(\s*);\s*block extract\s+(?:"([^"]*)"|\'([^\']*)\'|(\S+))(?:\s+(-?\d+))?(?:\s+(\d+))?(?:\s+(\d+))?\s*.*',
                 "End": r";\s*end extract.*?\s*.*",
@@ -54,6 +62,7 @@ class Markers:
         },
         {
             "type": "SQL",
+            "Comment": '--',
             "Extract": {
                 "Begin": r'(\s*)--\s*block extract\s+(?:"([^"]*)"|\'([^\']*)\'|(\S+))(?:\s+(-?\d+))?(?:\s+(\d+))?(?:\s+(\d+))?\s*.*',
                 "End": r"--\s*end extract.*?\s*.*",
@@ -66,6 +75,7 @@ class Markers:
         },
         {
             "type": "C Multi-Line",
+            "Comment": '/*',
             "Extract": {
                 "Begin": r'(\s*)/\*\s*block extract\s+(?:"([^"]*)"|\'([^\']*)\'|(\S+))(?:\s+(-?\d+))?(?:\s+(\d+))?(?:\s+(\d+))?\s*\*/.*',
                 "End": r"/\*\s*end extract.*?\s*\*/.*",
@@ -78,6 +88,7 @@ class Markers:
         },
         {
             "type": "Ruby",
+            "Comment": '=begin',
             "Extract": {
                 "Begin": r'(\s*)=begin\s*block extract\s+(?:"([^"]*)"|\'([^\']*)\'|(\S+))(?:\s+(-?\d+))?(?:\s+(\d+))?(?:\s+(\d+))?\s*=end.*',
                 "End": r"=begin\s*end extract.*?\s*=end.*",
@@ -90,6 +101,7 @@ class Markers:
         },
         {
             "type": "Visual Basic",
+            "Comment": "'",
             "Extract": {
                 "Begin": r"(\s*)'\s*block extract\s+(?:\"([^\"]*)\"|'([^']*)'|(\S+))(?:\s+(-?\d+))?(?:\s+(\d+))?(?:\s+(\d+))?\s*.*",
                 "End": r"'\s*end extract.*?\s*.*",
@@ -112,3 +124,89 @@ class Markers:
         """
         for marker_data in cls._data:
             yield marker_data
+
+    # Compiled Begin/End patterns, by dialect type, built on first use
+    _compiled = {}
+
+    @classmethod
+    def compiled(cls, markers):
+        """
+        Compiled patterns of a dialect, shaped like its configuration.
+
+        Args:
+            markers: A marker configuration dictionary from _data
+
+        Returns:
+            dict: {"Extract": {"Begin": Pattern, "End": Pattern}, "Insert": {...}}
+        """
+        patterns = cls._compiled.get(markers["type"])
+        if patterns is None:
+            patterns = {
+                section: {key: re.compile(markers[section][key]) for key in ("Begin", "End")}
+                for section in ("Extract", "Insert")
+            }
+            cls._compiled[markers["type"]] = patterns
+        return patterns
+
+    @staticmethod
+    def may_contain(markers, text, section):
+        """
+        Cheap prefilter: False if text cannot hold any of a dialect's markers.
+
+        Every Begin and End marker of a section contains the dialect's comment
+        token and the section keyword ("extract" or "insert"), so a text
+        lacking either needs no line-by-line scan.
+        """
+        return section.lower() in text and markers["Comment"] in text
+
+    @classmethod
+    def get(cls, dialect):
+        """
+        Marker configuration for a dialect, by its type name (case-insensitive).
+
+        Args:
+            dialect: A dialect type name such as "HTML" or "Python"
+
+        Raises:
+            ValueError: If there is no such dialect
+        """
+        for marker_data in cls._data:
+            if marker_data["type"].lower() == dialect.lower():
+                return marker_data
+        names = ", ".join(marker_data["type"] for marker_data in cls._data)
+        raise ValueError(f"Unknown dialect '{dialect}', expected one of: {names}")
+
+    # Digest carried by stamped end markers, e.g. "<!-- end insert h=ab12cd34 -->"
+    _stamp_pattern = re.compile(r"end insert\s+h=([0-9a-f]+)")
+
+    @staticmethod
+    def stamped_marker(marker, digest):
+        """
+        Insert end marker carrying a region digest.
+
+        Args:
+            marker: The plain end marker of a dialect, e.g. "<!-- end insert -->"
+            digest: The region digest
+
+        Returns:
+            str: The stamped marker, e.g. "<!-- end insert h=ab12cd34 -->"
+        """
+        return marker.replace("end insert", f"end insert h={digest}", 1)
+
+    @classmethod
+    def read_stamp(cls, line):
+        """
+        Digest carried by an insert end marker line, or None if it is not stamped.
+        """
+        match = cls._stamp_pattern.search(line)
+        return match.group(1) if match else None
+
+    @staticmethod
+    def region_digest(key, region_lines):
+        """
+        Short (8 hex digit) digest of a region's lines, salted with key.
+        """
+        h = hashlib.blake2b(key.encode("utf-8"), digest_size=4)
+        for line in region_lines:
+            h.update(line.encode("utf-8"))
+        return h.hexdigest()
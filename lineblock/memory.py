@@ -0,0 +1,115 @@
+import json
+import sys
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional, Union
+
+
+def max_rss() -> Optional[int]:
+    """Peak resident set size of this process in bytes, or None where unavailable."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class MemoryReport:
+    """
+    Python heap usage per phase, from tracemalloc.
+
+    For each phase measured (discover, extract, insert) the report records
+    the heap in use at its start, its peak during the phase, what is still
+    retained at its end, and the allocation sites (file:line) that grew the
+    most.  Tracing slows a run down noticeably; use it to investigate, not
+    routinely.
+    """
+
+    _FILTERS = (
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        tracemalloc.Filter(False, "<unknown>"),
+    )
+
+    def __init__(self, top: int = 10):
+        self.top = top
+        self.phases = []
+        self._started = not tracemalloc.is_tracing()
+        if self._started:
+            tracemalloc.start()
+
+    def _snapshot(self):
+        return tracemalloc.take_snapshot().filter_traces(self._FILTERS)
+
+    @contextmanager
+    def measure(self, phase: str, path=None):
+        """Record the heap usage of the with-block as phase."""
+        before = self._snapshot()
+        start, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        try:
+            yield
+        finally:
+            current, peak = tracemalloc.get_traced_memory()
+            after = self._snapshot()
+            self.phases.append({
+                "phase": phase,
+                "start": start,
+                "peak": peak,
+                "retained": current,
+                "growth": current - start,
+                "max_rss": max_rss(),
+                "top": [
+                    {
+                        "site": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                        "size": stat.size,
+                        "size_diff": stat.size_diff,
+                        "count_diff": stat.count_diff,
+                    }
+                    for stat in after.compare_to(before, "lineno")[:self.top]
+                ],
+            })
+
+    def close(self) -> None:
+        """Stop tracing, if this report started it."""
+        if self._started and tracemalloc.is_tracing():
+            tracemalloc.stop()
+            self._started = False
+
+    def summary(self) -> dict:
+        return {
+            "peak": max((phase["peak"] for phase in self.phases), default=0),
+            "max_rss": max_rss(),
+            "phases": self.phases,
+        }
+
+    def report(self, destination: Optional[Union[str, Path]]) -> dict:
+        """
+        Write the JSON summary to destination ("-" for stdout) and a short
+        text report to stderr.
+        """
+        summary = self.summary()
+        if destination is not None:
+            text = json.dumps(summary, indent=2) + "\n"
+            if str(destination) == "-":
+                sys.stdout.write(text)
+            else:
+                Path(destination).write_text(text)
+
+        rss = summary["max_rss"]
+        print(f"Memory: peak {_mib(summary['peak'])} traced"
+              + (f", max RSS {_mib(rss)}" if rss is not None else ""), file=sys.stderr)
+        for phase in self.phases:
+            print(f"  {phase['phase']:<10} peak {_mib(phase['peak']):>10}  retained {_mib(phase['retained']):>10}"
+                  f"  growth {_mib(phase['growth']):>10}", file=sys.stderr)
+            for site in phase["top"][:3]:
+                print(f"    {_mib(site['size_diff']):>10}  {site['site']}", file=sys.stderr)
+        return summary
+
+
+def _mib(size: int) -> str:
+    return f"{size / (1024 * 1024):.2f} MiB"
@@ -1,18 +1,102 @@
+import os
+import stat
+import sys
+
 from lineblock.source import Source
-from lineblock.sink import Sink
+from lineblock.sink import insert_regions
 from pathlib import Path
+from lineblock.common import Common
 from lineblock.markers import Markers
+from lineblock.stats import RunStats
+from lineblock.format_cache import FormatCache
+from lineblock.writer import AtomicWriter
+
+def read_text(file_path: Path, stats: RunStats = None) -> str:
+    try:
+        with open(file_path, "r") as f:
+            if stats is not None:
+                stats.add("bytes_read", os.fstat(f.fileno()).st_size)
+            return f.read()
+    except FileNotFoundError as e:
+        raise FileNotFoundError(f"Source file '{file_path}' not found.") from e
+
 
-def process(file_path: Path = None):
+def process(file_path: Path = None, stats: RunStats = None):
+    """
+    Extract the blocks of every dialect from a file, reading it once.
+
+    Dialects whose markers cannot occur in the file are skipped.
+    """
+    text = read_text(file_path, stats)
+    lines = Common.split_lines(text)
     block_map = []
+    scanned = False
     for markers in Markers.markers():
+        if not Markers.may_contain(markers, text, "Extract"):
+            continue
         s = Source(path=file_path, markers=markers)
-        s.process_file()
+        s.process_lines(lines)
         block_map.extend(s.block_map)
+        scanned = True
+        if stats is not None:
+            stats.add_markers(markers["type"], "extract", len(s.block_map))
+    if stats is not None:
+        stats.add("files_scanned")
+        if not scanned:
+            stats.add("extract_prefiltered")
     return block_map
 
 
-def process_inserts(block_map: dict = None, file_path: Path = None):
-    for markers in Markers.markers():
-        s = Sink(source_file=file_path, markers=markers,block_map=block_map)
-        s.process_file()
+def process_inserts(block_map: dict = None, file_path: Path = None, format_cache: FormatCache = None,
+                    stamp: bool = False, writer: AtomicWriter = None, check: bool = False,
+                    fail_fast: bool = False, output_path: Path = None, stats: RunStats = None,
+                    regions: list = None, progress=None, errors: list = None):
+    """
+    Apply the insert markers of every dialect to a file.
+
+    The file is read once, every dialect pass runs in memory, and the result
+    is written once, atomically, if anything changed.  In check mode nothing
+    is written.
+
+    With output_path, the file is rendered there instead of in place; an
+    unchanged file is linked (or copied) to output_path rather than rewritten.
+
+    Marker and region counts are added to stats, if given, and every insert
+    region found (current or updated) is appended to regions, if given.
+    Written files are reported on progress (default: stdout).
+
+    With errors, each insert of an unknown identity is appended to it as a
+    MissingIdentityError instead of raising the first, and a file with such
+    errors is not written.
+
+    Returns:
+        list: The stale insert regions found, as dicts with path, line and identity
+    """
+    if format_cache is None:
+        format_cache = FormatCache()
+    text = read_text(file_path, stats)
+    lines, changed, file_regions, scanned = insert_regions(
+        text, block_map, stats=stats, source_file=file_path, format_cache=format_cache,
+        stamp=stamp, fail_fast=fail_fast, check=check, errors=errors)
+    stale_regions = [region for region in file_regions if region["status"] == "updated"]
+    if regions is not None:
+        regions.extend(file_regions)
+    if stats is not None and not scanned:
+        stats.add("insert_prefiltered")
+
+    if check or errors:
+        return stale_regions
+
+    writer = writer or AtomicWriter()
+    if output_path is None:
+        if changed:
+            writer.write(file_path, "".join(lines))
+            print(f"Updated file: {file_path}", file=progress or sys.stdout)
+    elif changed:
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        mode = stat.S_IMODE(os.stat(file_path).st_mode)
+        if writer.write(output_path, "".join(lines), mode=mode, if_changed=True):
+            print(f"Created file: {output_path}", file=progress or sys.stdout)
+    else:
+        writer.link(file_path, output_path)
+    return stale_regions
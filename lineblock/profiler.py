@@ -0,0 +1,170 @@
+import json
+import sys
+import threading
+import time
+from contextlib import ExitStack, contextmanager, nullcontext
+from pathlib import Path
+from typing import Optional, Union
+
+
+def measure(instrument, phase: str, path=None):
+    """instrument.measure(phase, path), or a no-op context when instrument is None."""
+    if instrument is None:
+        return nullcontext()
+    return instrument.measure(phase, path)
+
+
+class Instruments:
+    """Several instruments (e.g. a Profiler and a Tracer) measuring the same spans."""
+
+    def __init__(self, *instruments):
+        self.instruments = instruments
+
+    @contextmanager
+    def measure(self, phase: str, path=None):
+        with ExitStack() as stack:
+            for instrument in self.instruments:
+                stack.enter_context(instrument.measure(phase, path))
+            yield
+
+
+def combine(*instruments):
+    """One instrument measuring for all the given ones (None entries are ignored), or None."""
+    instruments = [instrument for instrument in instruments if instrument is not None]
+    if not instruments:
+        return None
+    if len(instruments) == 1:
+        return instruments[0]
+    return Instruments(*instruments)
+
+
+class Profiler:
+    """
+    Wall and CPU time per phase and per file.
+
+    Phases nest ("insert" contains "write"): each measurement is charged to
+    its phase exclusive of the phases nested in it, so phase times add up to
+    the run's time.  CPU time is per thread, and with several jobs the phase
+    times are summed over the workers.
+
+    With ``pstats_dir``, each phase is also run under its own cProfile
+    profiler and its stats are dumped to ``<pstats_dir>/<phase>.pstats`` by
+    ``dump_pstats()``.  cProfile follows only the calling thread, so this
+    needs a single job.
+    """
+
+    def __init__(self, pstats_dir: Optional[Union[str, Path]] = None):
+        self.pstats_dir = Path(pstats_dir) if pstats_dir is not None else None
+        self.phases = {}  # phase -> {"wall", "cpu", "calls"}
+        self.files = {}  # path -> {phase -> {"wall", "cpu"}}
+        self._profiles = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._start_wall = time.perf_counter()
+        self._start_cpu = time.process_time()
+
+    def _stack(self) -> list:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _profile(self, phase: str):
+        if self.pstats_dir is None:
+            return None
+        if phase not in self._profiles:
+            import cProfile
+            self._profiles[phase] = cProfile.Profile()
+        return self._profiles[phase]
+
+    @contextmanager
+    def measure(self, phase: str, path=None):
+        """Charge the time spent in the with-block to phase (and to path, if given)."""
+        stack = self._stack()
+        # [phase, wall at start, cpu at start, nested wall, nested cpu]
+        frame = [phase, time.perf_counter(), time.thread_time(), 0.0, 0.0]
+        profile = self._profile(phase)
+        if profile is not None:
+            if stack:
+                self._profile(stack[-1][0]).disable()
+            profile.enable()
+        stack.append(frame)
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - frame[1]
+            cpu = time.thread_time() - frame[2]
+            stack.pop()
+            if profile is not None:
+                profile.disable()
+                if stack:
+                    self._profile(stack[-1][0]).enable()
+            if stack:
+                stack[-1][3] += wall
+                stack[-1][4] += cpu
+            self._record(phase, path, wall - frame[3], cpu - frame[4])
+
+    def _record(self, phase: str, path, wall: float, cpu: float):
+        with self._lock:
+            totals = self.phases.setdefault(phase, {"wall": 0.0, "cpu": 0.0, "calls": 0})
+            totals["wall"] += wall
+            totals["cpu"] += cpu
+            totals["calls"] += 1
+            if path is not None:
+                file_phases = self.files.setdefault(str(path), {})
+                times = file_phases.setdefault(phase, {"wall": 0.0, "cpu": 0.0})
+                times["wall"] += wall
+                times["cpu"] += cpu
+
+    def summary(self, top: int = 10) -> dict:
+        """The profile as a JSON-serialisable dict, with the `top` slowest files."""
+        files = [
+            {
+                "path": path,
+                "wall": sum(times["wall"] for times in phases.values()),
+                "cpu": sum(times["cpu"] for times in phases.values()),
+                "phases": phases,
+            }
+            for path, phases in self.files.items()
+        ]
+        files.sort(key=lambda record: record["wall"], reverse=True)
+        return {
+            "wall": time.perf_counter() - self._start_wall,
+            "cpu": time.process_time() - self._start_cpu,
+            "phases": self.phases,
+            "files": len(files),
+            "slowest_files": files[:top],
+        }
+
+    def dump_pstats(self) -> None:
+        """Write the cProfile stats of each phase to pstats_dir."""
+        if self.pstats_dir is None:
+            return
+        self.pstats_dir.mkdir(parents=True, exist_ok=True)
+        for phase, profile in self._profiles.items():
+            profile.dump_stats(self.pstats_dir / f"{phase}.pstats")
+
+    def report(self, destination: Optional[Union[str, Path]], top: int = 10) -> dict:
+        """
+        Write the JSON summary to destination ("-" for stdout) and a short
+        text report to stderr.
+        """
+        summary = self.summary(top)
+        self.dump_pstats()
+        if destination is not None:
+            text = json.dumps(summary, indent=2) + "\n"
+            if str(destination) == "-":
+                sys.stdout.write(text)
+            else:
+                Path(destination).write_text(text)
+
+        print(f"Profile: {summary['wall']:.3f}s wall, {summary['cpu']:.3f}s CPU, "
+              f"{summary['files']} files", file=sys.stderr)
+        for phase, totals in summary["phases"].items():
+            print(f"  {phase:<10} {totals['wall']:>9.3f}s wall {totals['cpu']:>9.3f}s CPU "
+                  f"{totals['calls']:>7} calls", file=sys.stderr)
+        if summary["slowest_files"]:
+            print("  Slowest files:", file=sys.stderr)
+            for record in summary["slowest_files"]:
+                print(f"  {record['wall']:>9.3f}s  {record['path']}", file=sys.stderr)
+        return summary
@@ -0,0 +1,318 @@
+import json
+import sys
+import threading
+from pathlib import Path
+from typing import List, Optional, Tuple, Union
+
+from lineblock.block_store import BlockStore, block_lookup, parse_size
+from lineblock.common import Common
+from lineblock.exceptions import (MissingIdentityError, NestedExtractBeginMarkerError, OrphanedExtractEndMarkerError,
+                                  OrphanedInsertEndMarkerError, UnclosedBlockError)
+from lineblock.format_cache import FormatCache
+from lineblock.hooks import Hooks
+from lineblock.index import load_index, save_index
+from lineblock.process import process, process_inserts
+from lineblock.profiler import combine, measure
+from lineblock.shard import shard_of
+from lineblock.stats import RunStats
+from lineblock.writer import AtomicWriter
+
+# Errors in the markers of a file, collected rather than raised in keep-going mode
+STRUCTURAL_ERRORS = (UnclosedBlockError, NestedExtractBeginMarkerError, OrphanedExtractEndMarkerError,
+                     OrphanedInsertEndMarkerError, MissingIdentityError)
+
+
+class Run:
+    """
+    State shared by the extract and insert phases of one lineblock run.
+
+    Args:
+        max_memory: Memory budget for extracted block content; when set the
+            block map is a BlockStore that spills to disk, and a quarter of the
+            budget bounds the format cache
+        stamp: Write hash-stamped insert end markers
+        fsync: Sync written files to disk (directory syncs are batched)
+        check: Compare in memory only; never write. Stale regions are collected
+            in ``stale_regions``
+        fail_fast: Raise StaleRegionError at the first stale region
+        jobs: Number of files processed concurrently by extract_all() and insert_all()
+        output: Render into this directory, mirroring the tree under
+            ``source_root``, instead of updating files in place
+        link_mode: How unchanged files are mirrored into ``output``: "auto"
+            (reflink, else hardlink, else copy), "reflink", "hardlink" or "copy"
+        profiler: Profiler charged with the time of each phase and file
+        tracer: Tracer recording a timeline span for each phase and file
+        stats: RunStats to count the run in; a new one if None
+        hooks: Hooks called as files are discovered, scanned and written
+        memory: MemoryReport recording heap usage per phase
+        track_dependencies: Record in ``dependencies`` the producer files of
+            each file with insert regions
+        shard: (i, n): insert only into the files of shard i of n (see
+            lineblock.shard); the extract phase still covers the whole tree
+        index: Block index to load instead of scanning files in the extract phase
+        index_out: Write the block map to this block index after the extract phase
+        quiet_stdout: Print progress messages and check results to stderr,
+            leaving stdout to a report written there (e.g. NDJSON)
+        keep_going: Collect structural errors (see STRUCTURAL_ERRORS) in
+            ``errors`` instead of raising the first; a file with an error is
+            left out of the rest of the run. Every insert of an unknown
+            identity in a file is reported; a malformed marker ends the scan
+            of its file, since the regions after it cannot be delimited
+    """
+
+    def __init__(
+            self,
+            max_memory: Optional[Union[int, str]] = None,
+            stamp: bool = False,
+            fsync: bool = False,
+            check: bool = False,
+            fail_fast: bool = False,
+            jobs: int = 1,
+            output: Optional[Union[str, Path]] = None,
+            link_mode: str = "auto",
+            profiler=None,
+            tracer=None,
+            stats: Optional[RunStats] = None,
+            hooks: Optional[Hooks] = None,
+            memory=None,
+            track_dependencies: bool = False,
+            shard: Optional[Tuple[int, int]] = None,
+            index: Optional[Union[str, Path]] = None,
+            index_out: Optional[Union[str, Path]] = None,
+            keep_going: bool = False,
+            quiet_stdout: bool = False,
+    ):
+        if max_memory is None:
+            self.block_map = []
+            self.format_cache = FormatCache()
+        else:
+            # Formatted blocks count against the budget too: a quarter of it
+            # bounds the format cache, the rest the block store
+            budget = parse_size(max_memory)
+            self.block_map = BlockStore(max_memory=budget - budget // 4)
+            self.format_cache = FormatCache(max_bytes=budget // 4)
+        self.profiler = profiler
+        self.tracer = tracer
+        self.instrument = combine(profiler, tracer)
+        self.writer = AtomicWriter(fsync=fsync, link_mode=link_mode, instrument=self.instrument)
+        self.hooks = hooks
+        self.memory = memory
+        # Sink file -> producer files whose blocks it includes
+        self.dependencies = {} if track_dependencies else None
+        self._lookup = None
+        self._lock = threading.Lock()
+        if hooks is not None:
+            self.writer.on_write = lambda path, method: hooks.emit("file_written", path=Path(path), method=method)
+        self.stamp = stamp
+        self.check = check
+        self.fail_fast = fail_fast
+        self.stale_regions = []
+        self.jobs = max(1, jobs or 1)
+        self.output = Path(output).expanduser().resolve() if output is not None else None
+        self.source_root = None
+        self.shard = shard
+        self.index = index
+        self.index_out = index_out
+        self.keep_going = keep_going
+        self.quiet_stdout = quiet_stdout
+        self.errors = []
+        self._failed = set()
+        self.stats = stats if stats is not None else RunStats()
+
+        # Called with each file's blocks as the extract phase produces them
+        self.on_blocks = None
+
+    @property
+    def progress(self):
+        """Stream for progress messages: stdout, unless a report is written there."""
+        return sys.stderr if self.quiet_stdout else sys.stdout
+
+    def measure(self, phase: str, path: Optional[Path] = None):
+        """Context measuring its time as phase in the run's profile and trace, if any."""
+        return measure(self.instrument, phase, path)
+
+    def phase(self, name: str):
+        """Context around a whole phase (discover, extract or insert), for the memory report."""
+        return measure(self.memory, name)
+
+    def discovered(self, file_path: Path) -> None:
+        """Announce a file found by discovery to the hooks."""
+        if self.hooks is not None:
+            self.hooks.emit("file_discovered", path=file_path)
+
+    def scan(self, file_path: Path) -> List[dict]:
+        """Extract the blocks of a file."""
+        hooks = self.hooks
+        if hooks is not None:
+            hooks.check_cancelled()
+        with self.measure("extract", file_path):
+            try:
+                blocks = process(file_path=file_path, stats=self.stats)
+            except Exception as e:
+                if hooks is not None:
+                    hooks.emit("error", path=file_path, error=e)
+                if not self.collect_error(file_path, e):
+                    raise
+                return []
+        if hooks is not None:
+            hooks.emit("file_scanned", path=file_path, blocks=len(blocks))
+        return blocks
+
+    def extract(self, file_path: Path) -> None:
+        """Extract phase: add the blocks of a file to the block map."""
+        self._add_blocks(self.scan(file_path))
+
+    def extract_all(self, file_paths: List[Path]) -> None:
+        """
+        Extract phase over many files; blocks are added in file order.
+
+        Results are consumed lazily, so each file's blocks reach the block
+        map (and its memory budget) as soon as the files before it are done.
+        """
+        for blocks in Common.imap_jobs(self.scan, file_paths, self.jobs):
+            self._add_blocks(blocks)
+
+    def load_index(self) -> None:
+        """Extract phase from the block index: add its blocks to the block map."""
+        with self.measure("extract", self.index):
+            blocks = load_index(self.index, self.source_root)
+        self._add_blocks(blocks)
+
+    def save_index(self) -> None:
+        """Write the block map to ``index_out``, if set."""
+        if self.index_out is not None:
+            save_index(self.index_out, self.block_map, self.source_root)
+
+    def in_shard(self, file_path: Path) -> bool:
+        """True if file_path belongs to this run's shard (always, without sharding)."""
+        if self.shard is None:
+            return True
+        index, count = self.shard
+        return shard_of(file_path.relative_to(self.source_root), count) == index
+
+    def _add_blocks(self, blocks: List[dict]) -> None:
+        self.block_map.extend(blocks)
+        if self.on_blocks is not None and blocks:
+            self.on_blocks(blocks)
+        if self.hooks is not None and self.hooks.wants("block_extracted"):
+            for block in blocks:
+                self.hooks.emit("block_extracted", block=block)
+
+    def insert_all(self, file_paths: List[Path]) -> None:
+        """Insert phase over many files."""
+        Common.map_jobs(self.insert, file_paths, self.jobs)
+
+    def insert(self, file_path: Path) -> None:
+        """Insert phase: update the insert regions of a file."""
+        hooks = self.hooks
+        if hooks is not None:
+            hooks.check_cancelled()
+        if file_path in self._failed:
+            return
+        regions = [] if self.dependencies is not None else None
+        errors = [] if self.keep_going else None
+        with self.measure("insert", file_path):
+            try:
+                updated = process_inserts(
+                    block_map=self.lookup,
+                    file_path=file_path,
+                    format_cache=self.format_cache,
+                    stamp=self.stamp,
+                    writer=self.writer,
+                    check=self.check,
+                    fail_fast=self.fail_fast,
+                    output_path=self.output_path(file_path),
+                    stats=self.stats,
+                    regions=regions,
+                    progress=self.progress,
+                    errors=errors,
+                )
+            except Exception as e:
+                if hooks is not None:
+                    hooks.emit("error", path=file_path, error=e)
+                if not self.collect_error(file_path, e):
+                    raise
+                return
+        if errors:
+            for error in errors:
+                if hooks is not None:
+                    hooks.emit("error", path=file_path, error=error)
+                self.collect_error(file_path, error)
+            return
+        self.stale_regions.extend(updated)
+        if regions:
+            producers = {self.producer(region["identity"]) for region in regions}
+            with self._lock:
+                self.dependencies[file_path] = producers
+        if hooks is not None and hooks.wants("region_updated"):
+            for region in updated:
+                hooks.emit("region_updated", path=region["path"], line=region["line"],
+                           identity=region["identity"])
+
+    def collect_error(self, file_path: Path, error: Exception) -> bool:
+        """In keep-going mode, record a structural error of file_path; False if it must be raised."""
+        if not self.keep_going or not isinstance(error, STRUCTURAL_ERRORS):
+            return False
+        with self._lock:
+            self._failed.add(file_path)
+            self.errors.append({
+                "path": str(error.source_file),
+                "line": error.line_number,
+                "error": type(error).__name__,
+                "message": str(error),
+            })
+        return True
+
+    def report_errors(self, error_format: str = "text") -> int:
+        """Print the collected errors to stderr, sorted by file and line; return the exit status."""
+        errors = sorted(self.errors, key=lambda error: (error["path"], error["line"] or 0))
+        if error_format == "json":
+            print(json.dumps({"errors": errors}, indent=2), file=sys.stderr)
+        else:
+            for error in errors:
+                print(f"{error['path']}:{error['line']}: {error['error']}: {error['message']}", file=sys.stderr)
+            if errors:
+                print(f"{len(errors)} error(s) found", file=sys.stderr)
+        return 1 if errors else 0
+
+    @property
+    def lookup(self):
+        """The block map searchable by identity, built once, after the extract phase."""
+        if self._lookup is None:
+            with self._lock:
+                if self._lookup is None:
+                    self._lookup = block_lookup(self.block_map)
+        return self._lookup
+
+    def producer(self, identity: str) -> Path:
+        """The file the block inserted for identity comes from."""
+        return Path(self.lookup.path(identity))
+
+    def output_path(self, file_path: Path) -> Optional[Path]:
+        """Where file_path is rendered in output mode, or None when updating in place."""
+        if self.output is None:
+            return None
+        source_root = self.source_root if self.source_root is not None else file_path.parent
+        return self.output / file_path.relative_to(source_root)
+
+    def in_output(self, file_path: Path) -> bool:
+        """True if file_path lies inside the output directory (and must not be processed)."""
+        return self.output is not None and file_path.is_relative_to(self.output)
+
+    def report_stale(self) -> int:
+        """Print the stale regions found in check mode; return the exit status."""
+        for region in self.stale_regions:
+            print(f"{region['path']}:{region['line']}: stale insert region '{region['identity']}'", file=self.progress)
+        if self.stale_regions:
+            print(f"{len(self.stale_regions)} stale insert region(s) found", file=self.progress)
+            return 1
+        return 0
+
+    def close(self) -> None:
+        """Finish the run: flush pending syncs, complete the stats and release the block store."""
+        self.writer.flush()
+        self.stats.finish(block_map=self.block_map, writer=self.writer, format_cache=self.format_cache)
+        if isinstance(self.block_map, BlockStore):
+            if self.block_map.spilled_blocks:
+                print(self.block_map.summary(), file=self.progress)
+            self.block_map.close()
@@ -0,0 +1,40 @@
+"""
+Partitioning of a tree's files across the shards of a run.
+
+A file belongs to shard ``i`` of ``n`` (1-based) when a stable hash of its
+path relative to the tree's root, modulo n, is ``i - 1``.  The assignment
+depends only on the relative path, so every node of a CI job computes the
+same partition from its own checkout.
+"""
+
+import hashlib
+from pathlib import Path
+from typing import Tuple
+
+
+def parse_shard(value: str) -> Tuple[int, int]:
+    """Parse "i/n" into (i, n), with 1 <= i <= n."""
+    try:
+        index, count = (int(part) for part in str(value).split("/"))
+    except ValueError:
+        raise ValueError(f'shard must be "i/n", e.g. "1/4", got "{value}"') from None
+    if not 1 <= index <= count:
+        raise ValueError(f'shard index must be between 1 and {count}, got "{value}"')
+    return index, count
+
+
+def shard_type(value: str) -> str:
+    """Validate a --shard value ("i/n"), as an argparse type."""
+    # Imported here: shard is imported by every run, argparse only by the CLIs
+    import argparse
+    try:
+        parse_shard(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e)) from None
+    return value
+
+
+def shard_of(relative_path: Path, count: int) -> int:
+    """The shard (1-based) of a file, from its path relative to the tree's root."""
+    digest = hashlib.blake2b(Path(relative_path).as_posix().encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little") % count + 1
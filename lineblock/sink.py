@@ -1,9 +1,11 @@
-import re
 from pathlib import Path
 
+from lineblock.block_store import block_lookup
 from lineblock.common import Common
-from lineblock.exceptions import OrphanedInsertEndMarkerError
+from lineblock.format_cache import FormatCache
+from lineblock.exceptions import MissingIdentityError, OrphanedInsertEndMarkerError, StaleRegionError
 from lineblock.markers import Markers
+from lineblock.writer import AtomicWriter
 
 class Sink(Common):
     def __init__(
@@ -11,24 +13,125 @@ class Sink(Common):
         source_file: Path = None,
         markers: dict = None,
         block_map: list = None,
+        format_cache: FormatCache = None,
+        stamp: bool = False,
+        fail_fast: bool = False,
+        source_name: str = None,
+        check: bool = False,
+        errors: list = None,
+        line_map: list = None,
     ):
         self.source_file = source_file
         self.markers = markers
-        self.block_map = block_map
+        self.patterns = Markers.compiled(markers)
+        # Searched by identity; build the lookup once per run and pass it in
+        self.block_map = block_lookup(block_map)
+        self.format_cache = format_cache if format_cache is not None else FormatCache()
+        self.stamp = stamp
+        self.fail_fast = fail_fast
+        self.check = check
+        # When a list, unknown identities are appended to it (as
+        # MissingIdentityError) and their regions left as they are
+        self.errors = errors
+        self.source_name = source_name
+        # Line number in the original file of each input line, when an earlier
+        # dialect pass has rewritten the text; None while the two coincide
+        self.line_map = line_map
+        # Original line number of each output line, set by process_lines()
+        self.output_line_map = None
+        self.stale_regions = []
+        self.regions = []
+        # Line of the insert marker being processed, for error reports
+        self.line_number = None
 
 
         self.clear_mode=False
 
     def is_end_marker(self, line):
         s = line.strip()
-        if re.fullmatch(self.markers["Insert"]["End"], s):
+        if self.patterns["Insert"]["End"].fullmatch(s):
             return True
         return False
 
 
+    def find_block(self, identity):
+        item = self.block_map.find(identity)
+        if item is None:
+            raise MissingIdentityError(str(self.location()), self.line_number, identity)
+        return item
+
+    def content_hash(self, identity):
+        content_hash = self.block_map.content_hash(identity)
+        if content_hash is None:
+            raise MissingIdentityError(str(self.location()), self.line_number, identity)
+        return content_hash
+
+    def formatted_block(self, identity, total_indent):
+        """Return the block for identity indented by total_indent, memoised per run."""
+        return self.format_cache.get(identity, lambda: self.find_block(identity)["block"],
+                                     self.content_hash(identity), total_indent)
+
+    def source_line(self, i):
+        """Line number in the original file of input line i (0-based)."""
+        return self.line_map[i] if self.line_map is not None else i + 1
+
+    def location(self):
+        """Path reported in errors and region records."""
+        if self.source_name is not None:
+            return self.source_name
+        path = Path(self.source_file)
+        return path if path.is_absolute() else path.resolve()
+
+    def mark_stale(self, line_number, identity):
+        """Record an out-of-date insert region; in fail-fast check mode stop at the first one."""
+        if self.fail_fast and self.check:
+            raise StaleRegionError(str(self.location()), line_number, identity)
+        region = {
+            "path": self.location(),
+            "line": line_number,
+            "identity": identity,
+            "status": "updated",
+        }
+        self.stale_regions.append(region)
+        self.regions.append(region)
+
+    def mark_current(self, line_number, identity):
+        """Record an insert region that is already up to date."""
+        self.regions.append({
+            "path": self.location(),
+            "line": line_number,
+            "identity": identity,
+            "status": "current",
+        })
+
+    def region_stamp(self, identity, total_indent, head, tail, region_lines):
+        """
+        Short digest of an insert region, written into stamped end markers.
+
+        Covers the source block (through its content hash), the formatting
+        parameters and the lines between the markers, so that a change to the
+        source block or a hand edit inside the region changes the digest.
+        """
+        content_hash = self.content_hash(identity)
+        return Markers.region_digest(
+            f"{identity}\0{content_hash}\0{total_indent}\0{head}\0{tail}\0", region_lines
+        )
+
+    def end_tag(self, orig_indent, line, digest=None):
+        """End marker for a region, stamped with digest when given."""
+        marker = self.markers["Insert"]["Marker"]
+        if digest is not None:
+            marker = Markers.stamped_marker(marker, digest)
+        block_end_tag = f"{' ' * orig_indent}{marker}"
+
+        # Add newline to the block end tag only if the original marker line had a newline
+        if line.endswith("\n"):
+            return block_end_tag + "\n"
+        return block_end_tag
+
     def extract_block_info(self, line):
         # Pattern: leading_ws + prefixmarker + identity + [optional indent] + [optional head] + [optional tail] + suffixmarker + [anything]
-        match = re.match(self.markers["Insert"]["Begin"], line)
+        match = self.patterns["Insert"]["Begin"].match(line)
         if match:
             leading_ws = match.group(1)
 
@@ -45,32 +148,47 @@ class Sink(Common):
         return False, None, 0, 0, 0, 0  # Return consistent tuple
 
 
-    def process_file(self):
+    def process_file(self, writer: AtomicWriter = None):
         try:
             with open(self.source_file, "r") as f:
                 original_lines = f.readlines()
         except FileNotFoundError as e:
-            raise FileNotFoundError(f"Source file '{self.path}' not found.") from e
+            raise FileNotFoundError(f"Source file '{self.source_file}' not found.") from e
+
+        output = self.process_lines(original_lines)
+
+        # Write output if changed
+        if output != original_lines:
+            output_path = Path(self.source_file).resolve()
+            (writer or AtomicWriter()).write(output_path, "".join(output))
+            print(f"Updated file: {output_path}")
 
+    def process_lines(self, original_lines):
+        """
+        Apply this dialect's insert markers to the lines of a file.
+
+        Returns:
+            list: The output lines; equal to original_lines when nothing changed
+        """
         output = []
+        # Input index each output piece came from (see output_line_map)
+        origins = []
         i = 0
         changed = False
-        source_file_path = Path(self.source_file).resolve()
 
         # Track if we're inside a block (to detect orphaned end markers)
         inside_block = False
 
-        output_path = source_file_path
-
         while i < len(original_lines):
             line = original_lines[i]
+            start_i, start_output = i, len(output)
 
             # Check if this is an end marker without a start marker
             if self.is_end_marker(line) and not inside_block:
                 # This is an orphaned end marker
                 raise OrphanedInsertEndMarkerError(
-                    source_file=str(source_file_path),
-                    line_number=i + 1,
+                    source_file=str(self.location()),
+                    line_number=self.source_line(i),
                     line_content=line.strip(),
                 )
 
@@ -78,6 +196,7 @@ class Sink(Common):
 
             if info[0]:
                 _, identity, orig_indent, total_indent, head, tail = info
+                self.line_number = self.source_line(i)
 
                 # Find end marker
                 end_i = None
@@ -137,10 +256,26 @@ class Sink(Common):
                         i = next_i
 
                     changed = True
+                elif self.errors is not None and self.block_map.content_hash(identity) is None:
+                    # Report the unknown identity and carry on with the next region
+                    self.errors.append(MissingIdentityError(str(self.location()), self.line_number, identity))
+                    output.extend(original_lines[i:next_i])
+                    i = next_i
                 else:
                     # Check if the block is already inserted by comparing content between markers
                     block_already_inserted = False
-                    if end_i is not None:
+                    # Looked up once per region, for the comparison and the insertion
+                    expected_formatted_block = None
+                    stamp_current = False
+                    if end_i is not None and self.stamp:
+                        # A matching stamp proves the region is current without formatting the block
+                        stamp = Markers.read_stamp(original_lines[end_i])
+                        if stamp is not None and stamp == self.region_stamp(
+                                identity, total_indent, actual_head, actual_tail, original_lines[i + 1:end_i]):
+                            block_already_inserted = True
+                            stamp_current = True
+
+                    if end_i is not None and not block_already_inserted:
                         # Get the content between the marker and end marker that should contain the block
                         # This content should be: head lines + block content + tail lines
                         start_content_idx = i + 1
@@ -150,19 +285,8 @@ class Sink(Common):
                         between_content = original_lines[start_content_idx:end_content_idx]
 
                         try:
-                            for item in self.block_map:
-                                if item["identity"] == identity:
-                                    expected_block_content = item["block"]
-                                    break
-                            else:
-                                raise ValueError(f"Identity '{identity}' not found in block map")
-
-                            # Apply indentation to expected block content
-                            expected_indented_block = self.indent_lines(expected_block_content, total_indent)
-                            expected_formatted_block = []
-                            for indented_line in expected_indented_block:
-                                stripped_line = indented_line.rstrip("\n")
-                                expected_formatted_block.append(stripped_line + "\n")
+                            # Indented expected block content, shared with the insertion below
+                            expected_formatted_block = self.formatted_block(identity, total_indent)
 
                             # Check if the between_content matches the expected pattern:
                             # [head lines] + [expected block content] + [tail lines]
@@ -183,41 +307,41 @@ class Sink(Common):
                             # If block file doesn't exist, we can't check if already inserted
                             pass
 
-                    if block_already_inserted:
+                    if block_already_inserted and self.stamp and not stamp_current:
+                        # Content is current but the end marker's stamp is missing or stale
+                        self.mark_stale(self.line_number, identity)
+                        output.extend(original_lines[i:end_i])
+                        digest = self.region_stamp(
+                            identity, total_indent, actual_head, actual_tail, original_lines[i + 1:end_i])
+                        output.append(self.end_tag(orig_indent, line, digest))
+                        changed = True
+                    elif block_already_inserted:
                         # Block is already inserted, just copy the whole section as-is
+                        self.mark_current(self.line_number, identity)
                         for idx in range(i, next_i):
                             output.append(original_lines[idx])
                     else:
                         # Block is not inserted yet, proceed with insertion
+                        self.mark_stale(self.line_number, identity)
+
                         # Always add the marker line as-is initially
                         replacement = [line]
 
-                        for item in self.block_map:
-                            if item["identity"] == identity:
-                                block_content = item["block"]
-                                break
-                        else:
-                            raise ValueError(f"Identity '{identity}' not found in block map")
-
                         # If the original marker line doesn't end with \n,
                         # we need to add a newline before the block content for proper formatting
                         if not line.endswith("\n"):
                             replacement.append("\n")
 
+                        region_start = len(replacement)
+
                         # Apply head: insert original lines before the block
                         for j in range(i + 1, i + 1 + actual_head):
                             replacement.append(original_lines[j])
 
-                        # Process the block content with proper indentation
-                        indented_block = self.indent_lines(block_content, total_indent)
-
-                        # Ensure each line of inserted content ends with newline
-                        formatted_indented_block = []
-                        for indented_line in indented_block:
-                            stripped_line = indented_line.rstrip("\n")
-                            formatted_indented_block.append(stripped_line + "\n")
-
-                        replacement.extend(formatted_indented_block)
+                        # Block content with proper indentation, each line ending with a newline
+                        if expected_formatted_block is None:
+                            expected_formatted_block = self.formatted_block(identity, total_indent)
+                        replacement.extend(expected_formatted_block)
 
                         # Apply tail: insert original lines after the block but before end marker
                         for j in range(after_head_idx, after_head_idx + actual_tail):
@@ -227,13 +351,11 @@ class Sink(Common):
                         # We don't add them to replacement as they'll be handled by the main loop
                         # We just need to make sure the main loop index is updated correctly later
 
-                        block_end_tag = f"{' ' * orig_indent}{self.markers["Insert"]["Marker"]}"
-
-                        # Add newline to the block end tag only if the original marker line had a newline
-                        if line.endswith("\n"):
-                            replacement.append(block_end_tag + "\n")
-                        else:
-                            replacement.append(block_end_tag)
+                        digest = None
+                        if self.stamp:
+                            digest = self.region_stamp(
+                                identity, total_indent, actual_head, actual_tail, replacement[region_start:])
+                        replacement.append(self.end_tag(orig_indent, line, digest))
 
                         output.extend(replacement)
                         changed = True
@@ -256,8 +378,65 @@ class Sink(Common):
                     output.append(line)
                 i += 1
 
-        # Write output if changed
-        if output != original_lines:
-            with open(output_path, "w") as f:
-                f.writelines(output)
-            print(f"Updated file: {output_path}")
\ No newline at end of file
+            # The marker line keeps its own line; the rest of a rewritten region
+            # is attributed to the input lines it replaced
+            last_i = max(i - 1, start_i)
+            origins.extend(min(start_i + k, last_i) for k in range(len(output) - start_output))
+
+        self.output_line_map = self.lines_map(output, origins)
+        return output
+
+    def lines_map(self, output, origins):
+        """Original line number of each line of "".join(output)."""
+        line_map = []
+        pending = None
+        for piece, origin in zip(output, origins):
+            if not piece:
+                continue
+            if pending is None:
+                pending = origin
+            if piece.endswith("\n"):
+                line_map.append(self.source_line(pending))
+                pending = None
+        if pending is not None:
+            line_map.append(self.source_line(pending))
+        return line_map
+
+def insert_regions(text, block_map, dialects=None, stats=None, **sink_options):
+    """
+    Apply the insert markers of every dialect (or of dialects) to text, in memory.
+
+    Shared by process_inserts() and render().  Dialects whose insert markers
+    cannot occur in the text are skipped, and each pass sees the lines a
+    re-read of the previous pass's output would give; regions and errors
+    report line numbers in text as given.  Marker and region
+    counts are added to stats, if given; sink_options are passed to each Sink.
+
+    Returns:
+        tuple: (lines, changed, regions, scanned): the output lines, whether
+        they differ from text, every insert region found, and whether any
+        dialect was scanned
+    """
+    block_map = block_lookup(block_map)
+    original_lines = Common.split_lines(text)
+    lines = original_lines
+    # Maps the lines of rewritten text back to the original, so that every
+    # pass reports the lines of the file as read
+    line_map = None
+    regions = []
+    scanned = False
+    for markers in (Markers.markers() if dialects is None else dialects):
+        if not Markers.may_contain(markers, text, "Insert"):
+            continue
+        sink = Sink(markers=markers, block_map=block_map, line_map=line_map, **sink_options)
+        output = sink.process_lines(lines)
+        regions.extend(sink.regions)
+        scanned = True
+        if stats is not None:
+            stats.add_markers(markers["type"], "insert", len(sink.regions))
+            stats.add_regions(sink.regions)
+        if output != lines:
+            text = "".join(output)
+            lines = Common.split_lines(text)
+            line_map = sink.output_line_map
+    return lines, lines != original_lines, regions, scanned
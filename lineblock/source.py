@@ -1,7 +1,7 @@
-import re
 from pathlib import Path
 
 from lineblock.common import Common
+from lineblock.markers import Markers
 from lineblock.exceptions import OrphanedExtractEndMarkerError, UnclosedBlockError, NestedExtractBeginMarkerError
 
 
@@ -13,17 +13,18 @@ class Source(Common):
     ):
         self.path = path
         self.markers = markers
+        self.patterns = Markers.compiled(markers)
         self.block_map = []
 
     def is_end_marker(self, line):
         s = line.strip()
-        if re.fullmatch(self.markers["Extract"]["End"], s):
+        if self.patterns["Extract"]["End"].fullmatch(s):
             return True
         return False
 
     # Pattern: leading_ws + prefixmarker + identity + [optional indent] + [optional head] + [optional tail] + suffixmarker + [anything]
     def extract_block_info(self, line):
-        match = re.match(self.markers["Extract"]["Begin"], line)
+        match = self.patterns["Extract"]["Begin"].match(line)
         if match:
             leading_ws = match.group(1)
 
@@ -47,6 +48,10 @@ class Source(Common):
         except FileNotFoundError as e:
             raise FileNotFoundError(f"Source file '{self.path}' not found.") from e
 
+        self.process_lines(original_lines)
+
+    def process_lines(self, original_lines):
+        """Extract this dialect's blocks from the lines of a file into block_map."""
         i = 0
         in_block = False  # Track if we're currently processing a block
         while i < len(original_lines):
@@ -115,7 +120,8 @@ class Source(Common):
                         "indent": total_indent,
                         "head": head,
                         "tail": tail,
-                        "block": trimmed_lines
+                        "block": trimmed_lines,
+                        "hash": self.block_hash(trimmed_lines)
                     })
 
             i += 1
@@ -0,0 +1,116 @@
+import json
+import threading
+from typing import Optional
+
+
+class RunStats:
+    """
+    Counters of one lineblock run.
+
+    Filled in while the run progresses (see Run) and completed by
+    ``finish()`` with the writer, cache and block map totals.
+
+    Counters:
+        files_discovered: Files matched by discovery (or the single target file)
+        files_excluded: Files skipped by an exclusion pattern
+        files_scanned: Files read by the extract phase
+        extract_prefiltered: Files the extract phase skipped entirely because
+            no dialect's extract markers could occur in them
+        insert_prefiltered: Files the insert phase skipped entirely because
+            no dialect's insert markers could occur in them
+        files_written: Files rewritten (or created in the output directory)
+        files_linked: Unchanged files linked or copied into the output directory
+        bytes_read: Bytes read by both phases
+        bytes_written: Bytes written
+        blocks: Blocks extracted
+        identities: Distinct block identities
+        insert_sites: Insert regions found
+        regions_current: Insert regions already up to date
+        regions_updated: Insert regions rewritten (or stale, in check mode)
+        format_cache_hits, format_cache_misses: Formatted-block cache lookups
+        markers: Marker lines matched per dialect, as {"extract": n, "insert": n}
+    """
+
+    COUNTERS = (
+        "files_discovered", "files_excluded", "files_scanned",
+        "extract_prefiltered", "insert_prefiltered",
+        "files_written", "files_linked", "bytes_read", "bytes_written",
+        "blocks", "identities", "insert_sites", "regions_current", "regions_updated",
+        "format_cache_hits", "format_cache_misses",
+    )
+
+    def __init__(self):
+        for name in self.COUNTERS:
+            setattr(self, name, 0)
+        self.markers = {}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, count: int = 1) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + count)
+
+    def add_markers(self, dialect: str, section: str, count: int) -> None:
+        """Count marker lines of a dialect; section is "extract" or "insert"."""
+        if not count:
+            return
+        with self._lock:
+            counts = self.markers.setdefault(dialect, {"extract": 0, "insert": 0})
+            counts[section] += count
+
+    def add_regions(self, regions) -> None:
+        """Count the insert regions reported by a Sink."""
+        updated = sum(1 for region in regions if region["status"] == "updated")
+        with self._lock:
+            self.insert_sites += len(regions)
+            self.regions_updated += updated
+            self.regions_current += len(regions) - updated
+
+    def finish(self, block_map=None, writer=None, format_cache=None) -> "RunStats":
+        """Take the totals kept by the run's block map, writer and format cache."""
+        if block_map is not None:
+            self.blocks = len(block_map)
+            identities = getattr(block_map, "identities", None)
+            if identities is None:
+                identities = {block["identity"] for block in block_map}
+            self.identities = len(identities)
+        if writer is not None:
+            self.files_written = writer.files_written
+            self.bytes_written = writer.bytes_written
+            self.files_linked = sum(writer.files_linked.values())
+        if format_cache is not None:
+            self.format_cache_hits = format_cache.hits
+            self.format_cache_misses = format_cache.misses
+        return self
+
+    def as_dict(self) -> dict:
+        return {**{name: getattr(self, name) for name in self.COUNTERS}, "markers": self.markers}
+
+    def to_json(self) -> str:
+        return json.dumps(self.as_dict(), indent=2)
+
+    def to_text(self) -> str:
+        lines = [f"{name.replace('_', ' ')}: {getattr(self, name)}" for name in self.COUNTERS]
+        for dialect, counts in self.markers.items():
+            lines.append(f"markers {dialect}: {counts['extract']} extract, {counts['insert']} insert")
+        return "\n".join(lines)
+
+    def to_prometheus(self, prefix: str = "lineblock", labels: Optional[dict] = None) -> str:
+        """The counters in the Prometheus text exposition format (for the textfile collector)."""
+        label_text = ",".join(f'{key}="{value}"' for key, value in (labels or {}).items())
+
+        def sample(name, value, extra=""):
+            all_labels = ",".join(filter(None, (label_text, extra)))
+            return f"{prefix}_{name}{{{all_labels}}} {value}" if all_labels else f"{prefix}_{name} {value}"
+
+        lines = []
+        for name in self.COUNTERS:
+            lines.append(f"# TYPE {prefix}_{name} gauge")
+            lines.append(sample(name, getattr(self, name)))
+        lines.append(f"# TYPE {prefix}_marker_lines gauge")
+        for dialect, counts in self.markers.items():
+            for section, value in counts.items():
+                lines.append(sample("marker_lines", value, f'dialect="{dialect}",section="{section}"'))
+        return "\n".join(lines) + "\n"
+
+    def __repr__(self):
+        return f"RunStats({', '.join(f'{name}={getattr(self, name)}' for name in self.COUNTERS)})"
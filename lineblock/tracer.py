@@ -0,0 +1,72 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Union
+
+
+class Tracer:
+    """
+    Timeline of a run in the Chrome trace-event format.
+
+    Each measured span (discover, and extract, insert and write per file)
+    becomes a complete ("X") event on the track of the worker thread that ran
+    it, with the file's path and size as arguments.  The file written by
+    ``write()`` opens in Perfetto (ui.perfetto.dev) or chrome://tracing.
+    """
+
+    def __init__(self):
+        self.events = []
+        self._workers = {}  # thread ident -> worker id
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._start = time.perf_counter_ns()
+
+    def _worker(self) -> int:
+        ident = threading.get_ident()
+        worker = self._workers.get(ident)
+        if worker is None:
+            with self._lock:
+                worker = self._workers.setdefault(ident, len(self._workers))
+                if worker == len(self._workers) - 1:
+                    name = "main" if threading.current_thread() is threading.main_thread() else f"worker {worker}"
+                    self.events.append({"name": "thread_name", "ph": "M", "pid": self._pid, "tid": worker,
+                                        "args": {"name": name}})
+        return worker
+
+    @contextmanager
+    def measure(self, phase: str, path=None):
+        """Record the with-block as a span of phase (on path, if given)."""
+        worker = self._worker()
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            end = time.perf_counter_ns()
+            event = {
+                "name": phase if path is None else f"{phase} {Path(path).name}",
+                "cat": phase,
+                "ph": "X",
+                "ts": (start - self._start) / 1000,
+                "dur": (end - start) / 1000,
+                "pid": self._pid,
+                "tid": worker,
+            }
+            if path is not None:
+                try:
+                    size = os.stat(path).st_size
+                except OSError:
+                    size = None
+                event["args"] = {"path": str(path), "size": size, "worker": worker}
+            else:
+                event["args"] = {"worker": worker}
+            with self._lock:
+                self.events.append(event)
+
+    def write(self, path: Union[str, Path]) -> None:
+        """Write the trace-event JSON file."""
+        with self._lock:
+            events = list(self.events)
+        Path(path).write_text(json.dumps({"traceEvents": events, "displayTimeUnit": "ms"}))
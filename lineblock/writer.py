@@ -0,0 +1,204 @@
+import errno
+import os
+import shutil
+import stat
+import tempfile
+import threading
+from pathlib import Path
+from typing import Optional, Union
+
+from lineblock.profiler import measure
+
+_umask = None
+
+# Linux ioctl that clones (reflinks) one file's extents into another
+_FICLONE = 0x40049409
+
+LINK_MODES = ("auto", "reflink", "hardlink", "copy")
+
+# Errors meaning "this kind of link is not possible here"; anything else is a real failure
+_LINK_UNSUPPORTED = {errno.EXDEV, errno.EPERM, errno.EMLINK, errno.EINVAL, errno.ENOTTY,
+                     errno.EOPNOTSUPP, errno.ENOSYS, errno.EBADF}
+
+
+def _default_mode() -> int:
+    """Mode given to newly created files, honouring the process umask."""
+    global _umask
+    if _umask is None:
+        _umask = os.umask(0)
+        os.umask(_umask)
+    return 0o666 & ~_umask
+
+
+class AtomicWriter:
+    """
+    Writes files atomically.
+
+    Each file is written to a temporary file in the same directory, which then
+    replaces the target with ``os.replace``, so an interrupted run never
+    leaves a truncated file behind.  The mode of an existing target is
+    preserved.
+
+    With ``fsync`` enabled, file data is synced before each replace and the
+    directory entries are synced in one batch, once per directory, by
+    ``flush()``.
+
+    Writes and links are measured as the "write" phase by ``instrument``
+    (a Profiler or Tracer), if given.
+    """
+
+    def __init__(self, fsync: bool = False, link_mode: str = "auto", instrument=None):
+        if link_mode not in LINK_MODES:
+            raise ValueError(f"link_mode must be one of {', '.join(LINK_MODES)}, got '{link_mode}'")
+        self.fsync = fsync
+        self.instrument = instrument
+        # Called with (path, method) after each file written ("write") or linked
+        self.on_write = None
+        self._pending_dirs = set()
+        self._lock = threading.Lock()
+        self.files_written = 0
+        self.bytes_written = 0
+
+        # Link strategies still worth trying; unsupported ones are dropped on first failure
+        self._link_methods = {
+            "auto": ["reflink", "hardlink", "copy"],
+            "reflink": ["reflink", "copy"],
+            "hardlink": ["hardlink", "copy"],
+            "copy": ["copy"],
+        }[link_mode]
+        self.files_linked = {"reflink": 0, "hardlink": 0, "copy": 0}
+
+    def write(self, path: Union[str, Path], text: Union[str, bytes], mode: Optional[int] = None,
+              if_changed: bool = False) -> bool:
+        """
+        Write text to path atomically.
+
+        Args:
+            path: Target file
+            text: New content (bytes are written as is)
+            mode: File mode; defaults to the mode of the existing target
+            if_changed: Leave the target untouched if it already holds text
+
+        Returns:
+            bool: True if the file was written
+        """
+        with measure(self.instrument, "write", path):
+            written = self._write(Path(path), text, mode, if_changed)
+        if written and self.on_write is not None:
+            self.on_write(path, "write")
+        return written
+
+    def _write(self, path: Path, text: Union[str, bytes], mode: Optional[int], if_changed: bool) -> bool:
+        binary = isinstance(text, bytes)
+        if if_changed:
+            try:
+                with open(path, "rb" if binary else "r", newline=None if binary else "") as f:
+                    if f.read() == (text if binary else text.replace("\n", os.linesep)):
+                        return False
+            except FileNotFoundError:
+                pass
+        if mode is None:
+            try:
+                mode = stat.S_IMODE(os.stat(path).st_mode)
+            except FileNotFoundError:
+                mode = _default_mode()
+
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+        try:
+            with open(fd, "wb" if binary else "w") as f:
+                f.write(text)
+                f.flush()
+                # Bytes on disk, after encoding and newline translation
+                size = os.fstat(f.fileno()).st_size
+                if self.fsync:
+                    os.fsync(f.fileno())
+            os.chmod(tmp_path, mode)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+
+        with self._lock:
+            self.files_written += 1
+            self.bytes_written += size
+            if self.fsync:
+                self._pending_dirs.add(path.parent)
+        return True
+
+    def link(self, source: Union[str, Path], path: Union[str, Path]) -> str:
+        """
+        Make path an unchanged copy of source as cheaply as possible.
+
+        Tries a reflink (copy-on-write clone), then a hardlink, then falls
+        back to a plain copy, according to the writer's link mode.  The target
+        is replaced atomically; a target that already is the same file is left
+        alone.
+
+        Returns:
+            str: The method used ("reflink", "hardlink" or "copy"), or "" if path
+            was already linked to source
+        """
+        with measure(self.instrument, "write", path):
+            method = self._link(Path(source), Path(path))
+        if method and self.on_write is not None:
+            self.on_write(path, method)
+        return method
+
+    def _link(self, source: Path, path: Path) -> str:
+        try:
+            if os.path.samefile(source, path):
+                return ""
+        except FileNotFoundError:
+            pass
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        for method in list(self._link_methods):
+            tmp_path = path.parent / f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                if method == "reflink":
+                    self._reflink(source, tmp_path)
+                elif method == "hardlink":
+                    os.link(source, tmp_path)
+                else:
+                    shutil.copy2(source, tmp_path)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                try:
+                    os.unlink(tmp_path)
+                except FileNotFoundError:
+                    pass
+                if method == "copy" or e.errno not in _LINK_UNSUPPORTED:
+                    raise
+                # Not supported on this filesystem: don't try it again this run
+                with self._lock:
+                    if method in self._link_methods:
+                        self._link_methods.remove(method)
+                continue
+            with self._lock:
+                self.files_linked[method] += 1
+                if self.fsync:
+                    self._pending_dirs.add(path.parent)
+            return method
+
+    @staticmethod
+    def _reflink(source: Path, path: Path) -> None:
+        try:
+            import fcntl
+        except ImportError:
+            raise OSError(errno.ENOSYS, "reflinks are not supported on this platform")
+        with open(source, "rb") as src, open(path, "wb") as dst:
+            fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+        shutil.copystat(source, path)
+
+    def flush(self) -> None:
+        """Sync the directories of all files written since the last flush."""
+        for directory in sorted(self._pending_dirs):
+            fd = os.open(directory, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        self._pending_dirs.clear()
@@ -6,16 +6,12 @@ For files: prints the absolute path of the specified file.
 """
 
 import argparse
-import fnmatch
-import os
 import sys
-import traceback
-from pathlib import Path
-from typing import List, Optional, Union
 
 
-from lineblock.exceptions import OrphanedInsertEndMarkerError, OrphanedExtractEndMarkerError, UnclosedBlockError, NotAFileError, IncompatibleOptionsError, NestedExtractBeginMarkerError
-from lineblock.lineblock import lineblock
+from lineblock.shard import shard_type
+from lineblock.exceptions import OrphanedInsertEndMarkerError, OrphanedExtractEndMarkerError, UnclosedBlockError, NotAFileError, IncompatibleOptionsError, NestedExtractBeginMarkerError, InvalidIndexError, MissingIdentityError
+
 
 def parse_args() -> argparse.Namespace:
     """Parse command line arguments."""
@@ -74,6 +70,167 @@ Examples:
              "Not allowed when target is a file."
     )
 
+    parser.add_argument(
+        "-j", "--jobs",
+        type=int,
+        default=1,
+        metavar="N",
+        help="Number of files processed concurrently (default: 1)."
+    )
+
+    parser.add_argument(
+        "-o", "--output",
+        metavar="DIR",
+        help="Render into DIR, mirroring the target's tree, instead of updating files in place. "
+             "Unchanged files are reflinked or hardlinked (falling back to a copy)."
+    )
+
+    parser.add_argument(
+        "--link",
+        choices=["auto", "reflink", "hardlink", "copy"],
+        default="auto",
+        dest="link_mode",
+        help="How --output mirrors unchanged files (default: auto, i.e. reflink, else hardlink, else copy)."
+    )
+
+    parser.add_argument(
+        "--ndjson",
+        metavar="FILE",
+        help="Stream extracted block records as NDJSON to FILE ('-' for stdout) "
+             "while the tree is scanned."
+    )
+
+    parser.add_argument(
+        "--max-memory",
+        metavar="SIZE",
+        help="Memory budget for extracted and formatted blocks (e.g. 256M). Blocks beyond the "
+             "budget are spilled to a temporary on-disk store."
+    )
+
+    parser.add_argument(
+        "--hash-stamps",
+        action="store_true",
+        help="Write end markers carrying a digest of the inserted region "
+             "(e.g. '<!-- end insert h=ab12cd34 -->') for fast drift detection."
+    )
+
+    parser.add_argument(
+        "--fsync",
+        action="store_true",
+        help="Sync updated files to disk before replacing them."
+    )
+
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="Check that all insert regions are up to date without writing any file. "
+             "Lists stale regions and exits non-zero if there are any."
+    )
+
+    parser.add_argument(
+        "--fail-fast",
+        action="store_true",
+        help="With --check, stop at the first stale region."
+    )
+
+    parser.add_argument(
+        "--profile",
+        metavar="FILE",
+        help="Write a JSON profile of the run to FILE ('-' for stdout): wall and CPU time "
+             "per phase and per file, and the slowest files. A summary is printed to stderr."
+    )
+    parser.add_argument(
+        "--profile-top",
+        type=int,
+        default=10,
+        metavar="N",
+        help="Number of slowest files listed in the profile (default: 10)."
+    )
+    parser.add_argument(
+        "--profile-pstats",
+        metavar="DIR",
+        help="Also run each phase under cProfile and write DIR/<phase>.pstats (needs --jobs 1)."
+    )
+
+    parser.add_argument(
+        "--stats",
+        choices=["text", "json"],
+        help="Print run statistics to stderr: files discovered, excluded, scanned and written, "
+             "bytes, marker lines per dialect, regions and cache hits."
+    )
+    parser.add_argument(
+        "--prometheus",
+        metavar="FILE",
+        help="Write run statistics to FILE in the Prometheus text format "
+             "(for the node exporter textfile collector; use a .prom name)."
+    )
+
+    parser.add_argument(
+        "--trace",
+        metavar="FILE",
+        help="Write a Chrome trace-event JSON timeline to FILE (open in Perfetto or "
+             "chrome://tracing): spans for discovery and each file's scan and write, per worker."
+    )
+
+    parser.add_argument(
+        "--memory-report",
+        metavar="FILE",
+        help="Trace allocations with tracemalloc and write a JSON report to FILE ('-' for stdout): "
+             "peak and retained memory per phase and the top allocation sites. "
+             "A summary is printed to stderr."
+    )
+    parser.add_argument(
+        "--memory-top",
+        type=int,
+        default=10,
+        metavar="N",
+        help="Number of allocation sites listed per phase (default: 10)."
+    )
+
+    parser.add_argument(
+        "--depfile",
+        metavar="FILE",
+        help="Write a make/ninja depfile to FILE listing, for each file with insert regions, "
+             "the producer files whose blocks it includes."
+    )
+    parser.add_argument(
+        "--ninja",
+        metavar="FILE",
+        help="Write a ninja fragment to FILE with one edge per file with insert regions, "
+             "depending on exactly its producer files."
+    )
+
+    parser.add_argument(
+        "-k", "--keep-going",
+        action="store_true",
+        help="Collect all marker errors instead of stopping at the first, process every file without "
+             "errors, and report the errors at the end, sorted by file and line (exit status 1)."
+    )
+    parser.add_argument(
+        "--error-format",
+        choices=["text", "json"],
+        default="text",
+        help="Format of the --keep-going error report on stderr (default: text)."
+    )
+
+    parser.add_argument(
+        "--shard",
+        type=shard_type,
+        metavar="I/N",
+        help="Update only the files of shard I of N (e.g. 2/4), assigned by a stable hash of their "
+             "relative path; N runs with shards 1/N..N/N together do what one run does."
+    )
+    parser.add_argument(
+        "--write-index",
+        metavar="FILE",
+        help="Write the extracted blocks to the block index FILE, to be loaded with --index."
+    )
+    parser.add_argument(
+        "--index",
+        metavar="FILE",
+        help="Load the blocks from the block index FILE instead of scanning the tree for them."
+    )
+
     return parser.parse_args()
 
 
@@ -81,29 +238,59 @@ def main() -> int:
     """Main entry point."""
     args = parse_args()
 
+    # Imported after parsing, so --help and usage errors skip loading the engine
+    from lineblock.lineblock import lineblock
+
     try:
         return lineblock(
             path=args.path,
             pattern=args.patterns,
             exclude=args.excludes,
             exclude_file=args.exclude_file,
-            dirs=args.dirs
+            dirs=args.dirs,
+            max_memory=args.max_memory,
+            stamp=args.hash_stamps,
+            fsync=args.fsync,
+            check=args.check,
+            fail_fast=args.fail_fast,
+            jobs=args.jobs,
+            output=args.output,
+            link_mode=args.link_mode,
+            ndjson=args.ndjson,
+            profile=args.profile,
+            profile_top=args.profile_top,
+            profile_pstats=args.profile_pstats,
+            stats_format=args.stats,
+            prometheus=args.prometheus,
+            trace=args.trace,
+            memory_report=args.memory_report,
+            memory_top=args.memory_top,
+            depfile=args.depfile,
+            ninja=args.ninja,
+            shard=args.shard,
+            index=args.index,
+            index_out=args.write_index,
+            keep_going=args.keep_going,
+            error_format=args.error_format
         )
 
     except (
             NestedExtractBeginMarkerError,
             OrphanedInsertEndMarkerError,
             OrphanedExtractEndMarkerError,
+            MissingIdentityError,
             UnclosedBlockError,
             FileNotFoundError,
             NotADirectoryError,
             NotAFileError,
-            IncompatibleOptionsError
+            IncompatibleOptionsError,
+            InvalidIndexError
     ) as e:
         print(f"Error: {e}", file=sys.stderr)
         return 1
     except Exception as e:
         print(f"Fatal error: {e}", file=sys.stderr)
+        import traceback
         print("Traceback (most recent call last):", file=sys.stderr)
         traceback.print_exception(type(e), e, e.__traceback__)
         return 1
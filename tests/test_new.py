@@ -1,5 +1,6 @@
 import pytest
 from pathlib import Path
+import re
 import tempfile
 
 from lineblock.exceptions import OrphanedInsertEndMarkerError, OrphanedExtractEndMarkerError, UnclosedBlockError, NotAFileError, IncompatibleOptionsError
@@ -816,3 +817,1033 @@ line 3
 
         """
         assert (new_content.replace('\r\n', '\n').strip() == expected_content.replace('\r\n', '\n').strip())
+
+
+def test_max_memory_spill(capsys):
+    original_content = """
+
+<!-- block extract "block A" 0 0 0-->
+line A
+<!-- end extract -->
+<!-- block extract blockB 0 0 0-->
+line B
+<!-- end extract -->
+
+    <!-- block insert "block A" 0 0 0 -->
+    <!-- block insert blockB 0 0 0 -->
+
+        """
+    results = []
+    for max_memory in (None, 1):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            original_file = Path(tmp_dir) / "basic.md"
+            original_file.write_text(original_content)
+            result = lineblock(tmp_dir, max_memory=max_memory)
+            assert (result == 0)
+            results.append(original_file.read_text())
+    assert (results[0] == results[1])
+    assert ("spilled 2 blocks" in capsys.readouterr().out)
+
+    # A single file target reads back only the block it inserts
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        original_file = Path(tmp_dir) / "basic.md"
+        original_file.write_text(original_content)
+        assert (lineblock(original_file, max_memory=1) == 0)
+        out = capsys.readouterr().out
+        assert ("Extracted 2 block(s)" in out and "2 reads" in out)
+
+    # Formatted blocks are held within a quarter of the budget
+    from lineblock.run import Run
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        root = Path(tmp_dir)
+        body = "x" * 99 + "\n"
+        for n in range(50):
+            (root / f"p{n}.py").write_text(f'# block extract "b{n}"\n' + body * 10 + "# end extract\n")
+            (root / f"d{n}.md").write_text(f'<!-- block insert "b{n}" 4 -->\n')
+        run = Run(max_memory="20K")
+        run.source_root = root
+        run.extract_all(sorted(root.glob("*.py")))
+        run.insert_all(sorted(root.glob("*.md")))
+        assert (run.block_map.spilled_blocks > 0)
+        assert (run.format_cache.max_bytes == 5 * 1024)
+        assert (0 < run.format_cache.bytes <= 5 * 1024 and run.format_cache.evictions > 0)
+        assert ((root / "d49.md").read_text().count("    " + body) == 10)
+        run.close()
+
+
+def test_imap_jobs_bounds_results_in_flight():
+    import threading
+    import time
+    from lineblock.common import Common
+
+    started = []
+    lock = threading.Lock()
+
+    def work(item):
+        with lock:
+            started.append(item)
+        return item * 2
+
+    results = Common.imap_jobs(work, range(100), jobs=2)
+    assert (next(results) == 0)
+    time.sleep(0.05)
+    # The first result was consumed; at most 2 * jobs more items were started
+    assert (len(started) <= 5)
+    assert (list(results) == [n * 2 for n in range(1, 100)])
+
+    # Blocks still reach the block map in file order with several jobs
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for n in range(20):
+            (Path(tmp_dir) / f"f{n:02}.py").write_text(f'# block extract "b{n}"\nline {n}\n# end extract\n')
+        from lineblock.run import Run
+        run = Run(jobs=4, max_memory=1)
+        run.source_root = Path(tmp_dir)
+        run.extract_all(sorted(Path(tmp_dir).iterdir()))
+        assert ([block["identity"] for block in run.block_map] == [f"b{n}" for n in range(20)])
+        run.close()
+
+
+def test_format_cache_hits():
+    from lineblock.format_cache import FormatCache
+    from lineblock.process import process, process_inserts
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source_file = Path(tmp_dir) / "source.md"
+        source_file.write_text('<!-- block extract "basic" -->\nline 1\n<!-- end extract -->\n')
+        sink_files = []
+        for n in range(3):
+            sink_file = Path(tmp_dir) / f"sink{n}.md"
+            sink_file.write_text('<!-- block insert "basic" 4 -->\n')
+            sink_files.append(sink_file)
+        block_map = process(file_path=source_file)
+        format_cache = FormatCache()
+        for sink_file in sink_files:
+            process_inserts(block_map=block_map, file_path=sink_file, format_cache=format_cache)
+        assert (format_cache.misses == 1)
+        assert (format_cache.hits == 2)
+        for sink_file in sink_files:
+            assert (sink_file.read_text() == '<!-- block insert "basic" 4 -->\n    line 1\n<!-- end insert -->\n')
+
+
+def test_block_lookup():
+    from lineblock.block_store import BlockLookup, BlockStore
+    from lineblock.format_cache import FormatCache
+    from lineblock.process import process, process_inserts
+
+    lookup = BlockLookup([{"identity": "a", "block": ["1\n"]}, {"identity": "a", "block": ["2\n"]}])
+    assert (lookup.find("a")["block"] == ["1\n"] and lookup.find("b") is None)
+    assert (len(lookup.content_hash("a")) == 32)
+
+    # A spilled block is read back once, on the format cache miss, not per region
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source_file = Path(tmp_dir) / "source.md"
+        source_file.write_text('<!-- block extract "basic" -->\nline 1\n<!-- end extract -->\n')
+        block_map = BlockStore(max_memory=1)
+        block_map.extend(process(file_path=source_file))
+        format_cache = FormatCache()
+        for n in range(3):
+            sink_file = Path(tmp_dir) / f"sink{n}.md"
+            sink_file.write_text('<!-- block insert "basic" -->\n<!-- block insert "basic" -->\n')
+            process_inserts(block_map=block_map, file_path=sink_file, format_cache=format_cache)
+            assert (sink_file.read_text().count("line 1\n") == 2)
+        assert (block_map.spill_reads == 1)
+        assert (block_map.path("basic") == source_file and block_map.spill_reads == 1)
+        block_map.close()
+
+    # Tracking dependencies reads no spilled block content
+    from lineblock.run import Run
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        root = Path(tmp_dir)
+        for n in range(5):
+            (root / f"p{n}.py").write_text(f'# block extract "b{n}"\nline {n}\n# end extract\n')
+            (root / f"d{n}.md").write_text(f'<!-- block insert "b{n}" -->\n')
+        spill_reads = []
+        for track_dependencies in (False, True):
+            run = Run(max_memory=1, check=True, track_dependencies=track_dependencies)
+            run.source_root = root
+            run.extract_all(sorted(root.glob("*.py")))
+            run.insert_all(sorted(root.glob("*.md")))
+            spill_reads.append(run.block_map.spill_reads)
+            run.close()
+        assert (spill_reads == [5, 5])
+        assert (run.dependencies[(root / "d3.md").resolve()] == {(root / "p3.py").resolve()})
+
+
+def test_format_cache_bounded():
+    from lineblock.format_cache import FormatCache
+
+    format_cache = FormatCache(max_bytes=2000)
+    for n in range(200):
+        lines = [f"line {n}\n"] * 5
+        assert (format_cache.get(f"b{n}", lines, f"hash{n}", 4) == [f"    line {n}\n"] * 5)
+        assert (format_cache.bytes <= 2000)
+    assert (0 < len(format_cache) < 200 and format_cache.evictions == 200 - len(format_cache))
+    # The most recent entries are kept
+    assert (format_cache.get("b199", lambda: 1 / 0, "hash199", 4) == ["    line 199\n"] * 5)
+
+
+def test_indent_engine_matches_reference():
+    from lineblock.common import Common
+
+    def reference(lines, spaces):
+        indented = []
+        for line in lines:
+            stripped = line.rstrip("\n")
+            if spaces >= 0:
+                indented.append(f"{' ' * spaces}{stripped}\n")
+            else:
+                leading_spaces = len(stripped) - len(stripped.lstrip())
+                indented.append(stripped[min(-spaces, leading_spaces):] + "\n")
+        return indented
+
+    lines = ["line 1\n", "    line 2\n", "\tline 3\n", "  \n", "\n", "", "  x", "      deep\n", "\x0c y\n"]
+    for spaces in (-8, -4, -2, -1, 0, 1, 4):
+        assert (Common.indent_lines(lines, spaces) == reference(lines, spaces))
+        text = "".join(line for line in lines if line.endswith("\n")) + "last"
+        text_lines = re.findall(r"[^\n]*\n|[^\n]+$", text)
+        assert (Common.indent_text(text, spaces) == "".join(reference(text_lines, spaces)))
+    assert (Common.indent_text("", 4) == "")
+
+
+def test_hash_stamps():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        original_file = Path(tmp_dir) / "basic.md"
+        original_file.write_text("""<!-- block extract "basic" -->
+line 1
+<!-- end extract -->
+<!-- block insert "basic" -->
+""")
+        assert (lineblock(tmp_dir, stamp=True) == 0)
+        stamped = original_file.read_text()
+        assert (re.search(r"<!-- block insert \"basic\" -->\nline 1\n<!-- end insert h=[0-9a-f]{8} -->\n$", stamped))
+
+        # Up-to-date regions are left alone
+        assert (lineblock(tmp_dir, stamp=True) == 0)
+        assert (original_file.read_text() == stamped)
+
+        # Hand edits inside the region are detected and repaired
+        original_file.write_text(stamped.replace("-->\nline 1\n<!-- end insert", "-->\nline edited\n<!-- end insert"))
+        assert (lineblock(tmp_dir, stamp=True) == 0)
+        assert (original_file.read_text() == stamped)
+
+        # Without stamps the stamped end marker is still recognised
+        assert (lineblock(tmp_dir) == 0)
+        assert (original_file.read_text() == stamped)
+
+        # Changing the source block invalidates the stamp
+        original_file.write_text(stamped.replace("-->\nline 1\n<!-- end extract", "-->\nline 2\n<!-- end extract"))
+        assert (lineblock(tmp_dir, stamp=True) == 0)
+        assert (re.search(r"-->\nline 2\n<!-- end insert h=[0-9a-f]{8} -->\n$", original_file.read_text()))
+
+
+def test_combined_atomic_write(capsys):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        original_file = Path(tmp_dir) / "mixed.md"
+        original_file.write_text("""<!-- block extract "html" -->
+line 1
+<!-- end extract -->
+# block extract "python"
+line 2
+# end extract
+<!-- block insert "html" -->
+# block insert "python"
+""")
+        original_file.chmod(0o640)
+        result = lineblock(tmp_dir, fsync=True)
+        assert (result == 0)
+        assert (original_file.read_text().endswith("""<!-- block insert "html" -->
+line 1
+<!-- end insert -->
+# block insert "python"
+line 2
+# end insert
+"""))
+        assert (capsys.readouterr().out.count("Updated file") == 1)
+        assert ((original_file.stat().st_mode & 0o777) == 0o640)
+        assert ([p.name for p in Path(tmp_dir).iterdir()] == ["mixed.md"])
+
+
+def test_check_mode(capsys):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        original_file = Path(tmp_dir) / "basic.md"
+        original_content = """<!-- block extract "basic" -->
+line 1
+<!-- end extract -->
+<!-- block insert "basic" -->
+<!-- block insert "basic" -->
+"""
+        original_file.write_text(original_content)
+        assert (lineblock(tmp_dir, check=True) == 1)
+        assert (original_file.read_text() == original_content)
+        out = capsys.readouterr().out
+        assert (":4: stale insert region 'basic'" in out)
+        assert (":5: stale insert region 'basic'" in out)
+        assert ("2 stale insert region(s) found" in out)
+
+        assert (lineblock(tmp_dir, check=True, fail_fast=True) == 1)
+        out = capsys.readouterr().out
+        assert (":4: stale insert region 'basic'" in out)
+        assert (":5: stale" not in out)
+
+        # fail_fast only applies to check mode
+        with pytest.raises(IncompatibleOptionsError):
+            lineblock(tmp_dir, fail_fast=True, check=False)
+        assert (original_file.read_text() == original_content)
+
+        assert (lineblock(tmp_dir) == 0)
+        assert (lineblock(tmp_dir, check=True) == 0)
+
+
+def test_check_mode_mixed_dialects(capsys):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        root = Path(tmp_dir)
+        (root / "h.py").write_text('# block extract "h"\nh1\nh2\nh3\n# end extract\n')
+        (root / "p.py").write_text('# block extract "p"\np1\n# end extract\n')
+        (root / "doc.md").write_text('<!-- block insert "h" -->\n# block insert "p"\n')
+
+        # The second dialect's marker is reported on its line in the file as read,
+        # not in the text the first dialect's pass rewrote
+        assert (lineblock(tmp_dir, check=True) == 1)
+        out = capsys.readouterr().out
+        assert (":1: stale insert region 'h'" in out)
+        assert (":2: stale insert region 'p'" in out)
+
+
+def test_legacy_skips_unchanged_outputs():
+    import os
+    from lineblock.block_extract import block_extract
+    from lineblock.block_insert import block_insert
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source_file = Path(tmp_dir) / "source.py"
+        source_file.write_text('# block extract "block.md" 0 1 0\nhead\nx = 1\n# end extract\n')
+        doc_file = Path(tmp_dir) / "doc.md"
+        doc_file.write_text('<!-- block insert "block.md" -->\n')
+        block_file = Path(tmp_dir) / "block.md"
+
+        block_extract(str(source_file), tmp_dir)
+        block_insert(str(doc_file), tmp_dir)
+        assert (block_file.read_text() == "x = 1\n")
+        assert (doc_file.read_text() == '<!-- block insert "block.md" -->\nx = 1\n<!-- end insert -->\n')
+
+        # Identical outputs are not rewritten
+        os.utime(block_file, (1000, 1000))
+        os.utime(doc_file, (1000, 1000))
+        block_extract(str(source_file), tmp_dir)
+        block_insert(str(doc_file), tmp_dir)
+        assert (block_file.stat().st_mtime == 1000)
+        assert (doc_file.stat().st_mtime == 1000)
+
+        # Sources older than their outputs are skipped entirely
+        os.utime(source_file, (500, 500))
+        source_file.write_text(source_file.read_text().replace("x = 1", "x = 2"))
+        os.utime(source_file, (500, 500))
+        block_extract(str(source_file), tmp_dir, skip_fresh=True)
+        assert (block_file.read_text() == "x = 1\n")
+        block_extract(str(source_file), tmp_dir)
+        assert (block_file.read_text() == "x = 2\n")
+
+        # A separate output newer than the doc and its block files is skipped
+        output_dir = Path(tmp_dir) / "out"
+        output_dir.mkdir()
+        block_insert(str(doc_file), tmp_dir, output_directory=str(output_dir))
+        output_file = output_dir / "doc.md"
+        block_file.write_text("x = 3\n")
+        os.utime(block_file, (1500, 1500))
+        os.utime(doc_file, (1500, 1500))
+        os.utime(output_file, (2000, 2000))
+        block_insert(str(doc_file), tmp_dir, output_directory=str(output_dir), skip_fresh=True)
+        assert ("x = 2" in output_file.read_text())
+        os.utime(output_file, (500, 500))
+        block_insert(str(doc_file), tmp_dir, output_directory=str(output_dir), skip_fresh=True)
+        assert ("x = 3" in output_file.read_text())
+
+        # In place, the doc is always rendered, however new it is
+        os.utime(doc_file, (2000, 2000))
+        block_insert(str(doc_file), tmp_dir, skip_fresh=True)
+        assert ("x = 3" in doc_file.read_text())
+        doc_file.write_text(doc_file.read_text() + '<!-- block insert "block.md" -->\n')
+        os.utime(doc_file, (3000, 3000))
+        block_insert(str(doc_file), tmp_dir, skip_fresh=True)
+        assert (doc_file.read_text().count("x = 3") == 2)
+
+
+def test_legacy_insert_directory_mode():
+    from lineblock.block_insert import BlockInsert
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        root = Path(tmp_dir)
+        (root / "blocks").mkdir()
+        (root / "blocks" / "block.md").write_text("x = 1\n")
+        (root / "docs" / "api").mkdir(parents=True)
+        (root / "docs" / "build").mkdir()
+        doc_files = [root / "docs" / "a.md", root / "docs" / "api" / "b.md", root / "docs" / "build" / "c.md"]
+        for doc_file in doc_files:
+            doc_file.write_text('<!-- block insert "block.md" -->\n<!-- block insert "block.md" -->\n')
+
+        inserter = BlockInsert(
+            source_file=str(root / "docs"),
+            insert_directory_prefix=str(root / "blocks"),
+            excludes=["build"],
+            jobs=2,
+        )
+        inserter.process()
+        expected = '<!-- block insert "block.md" -->\nx = 1\n<!-- end insert -->\n' * 2
+        assert (doc_files[0].read_text() == expected)
+        assert (doc_files[1].read_text() == expected)
+        assert ("x = 1" not in doc_files[2].read_text())
+        # The block file is read once and served from the cache thereafter
+        assert (inserter.block_cache.misses == 1)
+        assert (inserter.block_cache.hits > 0)
+
+
+def test_output_directory():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        root = Path(tmp_dir) / "docs"
+        (root / "sub").mkdir(parents=True)
+        output = Path(tmp_dir) / "build"
+        changed_file = root / "sub" / "changed.md"
+        original_content = '<!-- block extract "basic" -->\nline 1\n<!-- end extract -->\n<!-- block insert "basic" -->\n'
+        changed_file.write_text(original_content)
+        unchanged_file = root / "unchanged.md"
+        unchanged_file.write_text("no markers\n")
+
+        assert (lineblock(root, output=output, link_mode="hardlink") == 0)
+        assert (changed_file.read_text() == original_content)
+        assert ((output / "sub" / "changed.md").read_text() == original_content + "line 1\n<!-- end insert -->\n")
+        assert ((output / "unchanged.md").read_text() == "no markers\n")
+        assert ((output / "unchanged.md").stat().st_ino == unchanged_file.stat().st_ino)
+
+        # Re-running leaves the mirror in place
+        assert (lineblock(root, output=output, link_mode="copy") == 0)
+        assert ((output / "unchanged.md").stat().st_ino == unchanged_file.stat().st_ino)
+
+        with pytest.raises(IncompatibleOptionsError):
+            lineblock(root, output=root)
+
+
+def test_in_memory_api():
+    from lineblock import extract_blocks, render
+
+    source = '# block extract "basic" -4\n    line 1\n# end extract\n'
+    blocks = extract_blocks(source, dialect="python", filename="source.py")
+    assert ([(b["identity"], b["path"], b["block"]) for b in blocks] == [("basic", "source.py", ["line 1\n"])])
+    assert (extract_blocks(source, dialect="HTML") == [])
+
+    document = '<!-- block insert "other" -->\nold\n<!-- end insert -->\n<!-- block insert "basic" 2 -->\n'
+    result = render(document, blocks + extract_blocks('<!-- block extract other -->\nold\n<!-- end extract -->\n'),
+                    filename="doc.md")
+    assert (result.text == '<!-- block insert "other" -->\nold\n<!-- end insert -->\n'
+                           '<!-- block insert "basic" 2 -->\n  line 1\n<!-- end insert -->\n')
+    assert (result.changed)
+    assert ([(r["path"], r["line"], r["identity"], r["status"]) for r in result.regions]
+            == [("doc.md", 1, "other", "current"), ("doc.md", 4, "basic", "updated")])
+
+    rendered = result.text.encode("utf-8")
+    result = render(rendered, {"basic": "line 1\n", "other": ["old\n"]})
+    assert (result.text == rendered)
+    assert (not result.changed)
+
+    with pytest.raises(ValueError):
+        render(document, {})
+
+    # Regions of every dialect are reported on their line in the given text
+    result = render('<!-- block insert "h" -->\n# block insert "p"\n', {"h": "1\n2\n3\n", "p": "p\n"})
+    assert ([(r["line"], r["identity"]) for r in result.regions] == [(1, "h"), (2, "p")])
+
+
+def test_iter_blocks_and_ndjson():
+    import json
+    from lineblock import iter_blocks
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        root = Path(tmp_dir)
+        (root / "a.py").write_text('# block extract "a"\nline a\n# end extract\n')
+        (root / "b.md").write_text('<!-- block extract "b" -->\nline b\n<!-- end extract -->\n<!-- block insert "a" -->\n')
+        (root / "c.txt").write_text('<!-- block extract "c" -->\nline c\n<!-- end extract -->\n')
+
+        blocks = iter_blocks(root, patterns=["*.py", "*.md"])
+        assert (next(blocks)["identity"] in ("a", "b"))
+        assert (sorted(b["identity"] for b in iter_blocks(root, exclude="*.txt")) == ["a", "b"])
+        assert ([b["block"] for b in iter_blocks(root / "c.txt")] == [["line c\n"]])
+
+        ndjson_file = Path(tmp_dir) / "blocks.ndjson"
+        assert (lineblock(root, pattern="*.py", ndjson=ndjson_file) == 0)
+        records = [json.loads(line) for line in ndjson_file.read_text().splitlines()]
+        assert ([(r["identity"], r["path"], r["block"]) for r in records] == [("a", str(root.resolve() / "a.py"), ["line a\n"])])
+
+
+def test_stdout_reports_stay_parseable(capsys):
+    import json
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        root = Path(tmp_dir).resolve()
+        (root / "a.py").write_text('# block extract "a"\nline a\n# end extract\n')
+        (root / "doc.md").write_text('<!-- block insert "a" -->\n')
+
+        # Progress messages ("Traversing directory", "Updated file") go to stderr
+        assert (lineblock(root, pattern=["*.py", "*.md"], ndjson="-") == 0)
+        captured = capsys.readouterr()
+        records = [json.loads(line) for line in captured.out.splitlines()]
+        assert ([record["identity"] for record in records] == ["a"])
+        assert ("Updated file:" in captured.err and "Patterns:" in captured.err)
+
+        # Single file: "Processing single file" and the block map go to stderr
+        assert (lineblock(root / "a.py", ndjson="-") == 0)
+        captured = capsys.readouterr()
+        assert ([json.loads(line)["identity"] for line in captured.out.splitlines()] == ["a"])
+        assert ("Processing single file:" in captured.err)
+
+        (root / "doc.md").write_text('<!-- block insert "a" -->\n')
+        assert (lineblock(root, check=True, profile="-") == 1)
+        captured = capsys.readouterr()
+        assert (json.loads(captured.out)["files"] == 2)
+        assert ("stale insert region" in captured.err)
+
+        assert (lineblock(root, memory_report="-") == 0)
+        assert ([phase["phase"] for phase in json.loads(capsys.readouterr().out)["phases"]]
+                == ["discover", "extract", "insert"])
+
+        with pytest.raises(IncompatibleOptionsError):
+            lineblock(root, ndjson="-", profile="-")
+
+
+def test_async_api():
+    import asyncio
+    from lineblock import async_render, async_sync_tree
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        root = Path(tmp_dir)
+        (root / "a.py").write_text('# block extract "a"\nline a\n# end extract\n')
+        doc_files = [root / f"doc{n}.md" for n in range(4)]
+        for doc_file in doc_files:
+            doc_file.write_text('<!-- block insert "a" -->\n')
+        events = []
+
+        async def progress(event):
+            events.append(event["event"])
+
+        report = asyncio.run(async_sync_tree(root, check=True, concurrency=2, progress=progress))
+        assert (len(report["updated"]) == 4)
+        assert (doc_files[0].read_text() == '<!-- block insert "a" -->\n')
+
+        report = asyncio.run(async_sync_tree(root, concurrency=2, progress=progress))
+        assert (sorted(report["updated"]) == doc_files)
+        assert (all(f.read_text() == '<!-- block insert "a" -->\nline a\n<!-- end insert -->\n' for f in doc_files))
+        assert (events.count("written") == 4)
+        assert (events[-1] == "done")
+
+        report = asyncio.run(async_sync_tree(root))
+        assert (report["updated"] == [])
+        assert ({r["status"] for r in report["regions"]} == {"current"})
+
+        result = asyncio.run(async_render('<!-- block insert "a" -->\n', {"a": "x\n"}))
+        assert (result.text == '<!-- block insert "a" -->\nx\n<!-- end insert -->\n')
+
+    # A failing file cancels the rest of the run: later files stay unwritten
+    from lineblock.exceptions import MissingIdentityError
+    from lineblock.lineblock import discover_files
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        root = Path(tmp_dir).resolve()
+        for n in range(6):
+            (root / f"doc{n}.md").write_text('<!-- block insert "a" -->\n')
+        files = list(discover_files(root))
+        files[1].write_text('<!-- block insert "missing" -->\n')
+
+        async def caller():
+            with pytest.raises(MissingIdentityError):
+                await async_sync_tree(root, concurrency=1, blocks={"a": "x\n"})
+            # The loop keeps running after the caller has seen the error
+            await asyncio.sleep(0.2)
+
+        asyncio.run(caller())
+        assert (all(f.read_text() == '<!-- block insert "a" -->\n' for f in files[2:]))
+
+
+def test_daemon():
+    import threading
+    from lineblock.daemon import Daemon, request
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        root = Path(tmp_dir).resolve()
+        source_file = root / "a.py"
+        source_file.write_text('# block extract "a"\nline a\n# end extract\n')
+        doc_file = root / "doc.md"
+        doc_file.write_text('<!-- block insert "a" -->\n')
+        socket_path = root / "d.sock"
+        daemon = Daemon(root, socket_path=socket_path)
+        daemon.bind()
+        thread = threading.Thread(target=daemon.serve_forever)
+        thread.start()
+        try:
+            response = request(socket_path, "check", timeout=10)
+            assert (response["ok"] and response["updated"] == [str(doc_file)])
+            assert (doc_file.read_text() == '<!-- block insert "a" -->\n')
+
+            response = request(socket_path, "sync", timeout=10)
+            assert (response["updated"] == [str(doc_file)])
+            assert (doc_file.read_text() == '<!-- block insert "a" -->\nline a\n<!-- end insert -->\n')
+
+            response = request(socket_path, "where", identity="a", timeout=10)
+            assert (response["extracts"] == [{"path": str(source_file), "line": 1}])
+            assert ([(r["path"], r["status"]) for r in response["inserts"]] == [(str(doc_file), "current")])
+
+            # Edited sources are picked up; unchanged documents come from the cache
+            source_file.write_text('# block extract "a"\nline b\n# end extract\n')
+            misses = request(socket_path, "ping", timeout=10)["cache_misses"]
+            assert (request(socket_path, "sync", timeout=10)["updated"] == [str(doc_file)])
+            assert ("line b" in doc_file.read_text())
+            assert (request(socket_path, "ping", timeout=10)["cache_misses"] == misses + 1)
+
+            assert (request(socket_path, "where", timeout=10)["ok"] is False)
+
+            # Requests that are not JSON objects get an error and keep the connection open
+            import json
+            import socket
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.settimeout(10)
+                sock.connect(str(socket_path))
+                sock.sendall(b'[]\n"sync"\n{"command": "ping"}\n')
+                with sock.makefile("rb") as stream:
+                    responses = [json.loads(stream.readline()) for _ in range(3)]
+            assert ([r["ok"] for r in responses] == [False, False, True])
+            assert ("expected a JSON object" in responses[0]["error"])
+        finally:
+            request(socket_path, "shutdown", timeout=10)
+            thread.join(10)
+        assert (not thread.is_alive())
+        assert (not socket_path.exists())
+
+
+def test_render_stdin(monkeypatch, capsys):
+    import io
+    import os
+    import sys
+    from lineblock.cli import main
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        root = Path(tmp_dir).resolve()
+        (root / "a.py").write_text('# block extract "a"\nline a\n# end extract\n')
+        (root / "doc.md").write_text('<!-- block insert "b" -->\n')
+        monkeypatch.chdir(root)
+
+        buffer = '# block extract "b"\nline b\n# end extract\n<!-- block insert "a" -->\n<!-- block insert "b" -->\n'
+        monkeypatch.setattr(sys, "argv", ["lineblock", "render", "--stdin", "--filename", "doc.md"])
+        monkeypatch.setattr(sys, "stdin", io.StringIO(buffer))
+        assert (main() == 0)
+        assert (capsys.readouterr().out == (
+            '# block extract "b"\nline b\n# end extract\n'
+            '<!-- block insert "a" -->\nline a\n<!-- end insert -->\n'
+            '<!-- block insert "b" -->\nline b\n<!-- end insert -->\n'))
+        # Nothing is written
+        assert ((root / "doc.md").read_text() == '<!-- block insert "b" -->\n')
+        assert (sorted(os.listdir(root)) == ["a.py", "doc.md"])
+
+
+def test_lazy_import():
+    import subprocess
+    import sys
+
+    code = ("import sys, lineblock\n"
+            "print(sorted(m for m in ('argparse', 'asyncio', 'sqlite3', 'lineblock.cli', 'lineblock.lineblock')"
+            " if m in sys.modules))\n"
+            "print(lineblock.lineblock.__module__, lineblock.render.__module__)\n"
+            "import lineblock.lineblock as m\n"
+            "print(type(m).__name__, m.discover_files.__module__)\n"
+            "print(sorted(m for m in ('pickle', 'tracemalloc') if m in sys.modules))")
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                            cwd=Path(__file__).resolve().parent.parent, check=True)
+    assert (result.stdout.splitlines() == ["[]", "lineblock.cli lineblock.api", "module lineblock.lineblock", "[]"])
+
+
+def test_benchmark_corpus(capsys):
+    from benchmarks.corpus import generate_corpus
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        root = Path(tmp_dir)
+        stats = generate_corpus(root / "a", seed=7, files=12, lines=30, density=0.2, fanout=3,
+                                long_line_ratio=0.1, long_line_length=500)
+        generate_corpus(root / "b", seed=7, files=12, lines=30, density=0.2, fanout=3,
+                        long_line_ratio=0.1, long_line_length=500)
+        files = sorted(p.relative_to(root / "a") for p in (root / "a").rglob("*") if p.is_file())
+        assert (len(files) == stats["files"] == 12)
+        assert (stats["inserts"] == 3 * stats["extracts"] > 0)
+        assert (all((root / "a" / f).read_text() == (root / "b" / f).read_text() for f in files))
+
+        assert (lineblock(path=root / "a") == 0)
+        assert ("stale\n" not in "".join(p.read_text() for p in (root / "a").rglob("doc*")))
+        capsys.readouterr()
+        assert (lineblock(path=root / "a") == 0)
+        assert ("Updated file" not in capsys.readouterr().out)
+
+
+def test_profile(capsys):
+    import json
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        root = Path(tmp_dir).resolve()
+        tree = root / "tree"
+        tree.mkdir()
+        (tree / "a.py").write_text('# block extract "a"\nline a\n# end extract\n')
+        (tree / "doc.md").write_text('<!-- block insert "a" -->\n')
+        profile_file = root / "profile.json"
+
+        assert (lineblock(path=tree, profile=profile_file, profile_top=1, profile_pstats=root / "pstats") == 0)
+        summary = json.loads(profile_file.read_text())
+        assert (set(summary["phases"]) == {"discover", "extract", "insert", "write"})
+        assert (summary["phases"]["extract"]["calls"] == 2 and summary["phases"]["write"]["calls"] == 1)
+        assert (summary["files"] == 2 and len(summary["slowest_files"]) == 1)
+        assert (all(phase["wall"] >= 0 and phase["cpu"] >= 0 for phase in summary["phases"].values()))
+        assert (sorted(p.name for p in (root / "pstats").iterdir()) ==
+                ["discover.pstats", "extract.pstats", "insert.pstats", "write.pstats"])
+        assert ("Slowest files:" in capsys.readouterr().err)
+
+        with pytest.raises(IncompatibleOptionsError):
+            lineblock(path=tree, profile_pstats=root / "pstats", jobs=2)
+
+
+def test_run_stats(capsys):
+    import json
+    from lineblock import RunStats
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        root = Path(tmp_dir).resolve()
+        tree = root / "tree"
+        (tree / "build").mkdir(parents=True)
+        (tree / "a.py").write_text('# block extract "a"\nline \u00e4\n# end extract\n')
+        (tree / "doc.md").write_text('<!-- block insert "a" -->\n<!-- end insert -->\n'
+                                     '<!-- block insert "a" -->\nline \u00e4\n<!-- end insert -->\n')
+        (tree / "build" / "skip.md").write_text("")
+
+        stats = RunStats()
+        assert (lineblock(path=tree, exclude="build", stats=stats, stats_format="json",
+                          prometheus=root / "lineblock.prom") == 0)
+        assert (stats.files_discovered == 2 and stats.files_excluded == 1 and stats.files_scanned == 2)
+        # a.py has no insert markers, doc.md no extract markers
+        assert (stats.extract_prefiltered == 1 and stats.insert_prefiltered == 1)
+        assert (stats.files_written == 1 and stats.bytes_read > 0)
+        # Bytes, not characters: "\u00e4" is two bytes in UTF-8
+        assert (stats.bytes_written == (tree / "doc.md").stat().st_size == len((tree / "doc.md").read_text()) + 2)
+        assert (stats.blocks == 1 and stats.identities == 1)
+        assert (stats.insert_sites == 2 and stats.regions_updated == 1 and stats.regions_current == 1)
+        assert (stats.markers == {"Python": {"extract": 1, "insert": 0}, "HTML": {"extract": 0, "insert": 2}})
+        assert (stats.format_cache_misses == 1 and stats.format_cache_hits >= 1)
+
+        assert (json.loads(capsys.readouterr().err)["regions_updated"] == 1)
+        prom = (root / "lineblock.prom").read_text()
+        assert ("lineblock_files_written 1\n" in prom)
+        assert ('lineblock_marker_lines{dialect="HTML",section="insert"} 2\n' in prom)
+
+        # A file without markers is prefiltered once per phase
+        (tree / "plain.txt").write_text("no markers\n")
+        stats = RunStats()
+        assert (lineblock(path=tree, exclude="build", stats=stats) == 0)
+        assert (stats.files_discovered == 3 and stats.extract_prefiltered == 2 and stats.insert_prefiltered == 2)
+        assert ("extract prefiltered: 2\ninsert prefiltered: 2\n" in stats.to_text())
+
+
+def test_trace():
+    import json
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        root = Path(tmp_dir).resolve()
+        tree = root / "tree"
+        tree.mkdir()
+        (tree / "a.py").write_text('# block extract "a"\nline a\n# end extract\n')
+        for n in range(4):
+            (tree / f"doc{n}.md").write_text('<!-- block insert "a" -->\n')
+        trace_file = root / "trace.json"
+
+        assert (lineblock(path=tree, jobs=2, trace=trace_file) == 0)
+        events = json.loads(trace_file.read_text())["traceEvents"]
+        spans = [e for e in events if e["ph"] == "X"]
+        assert ([e["cat"] for e in spans].count("discover") == 1)
+        assert ([e["cat"] for e in spans].count("extract") == 5)
+        writes = [e for e in spans if e["cat"] == "write"]
+        assert (sorted(e["args"]["path"] for e in writes) == [str(tree / f"doc{n}.md") for n in range(4)])
+        assert (all(e["args"]["size"] == len('<!-- block insert "a" -->\nline a\n<!-- end insert -->\n')
+                    for e in writes))
+        assert (all(e["dur"] >= 0 and e["tid"] == e["args"]["worker"] for e in spans))
+        names = {e["tid"]: e["args"]["name"] for e in events if e["ph"] == "M"}
+        assert ({e["tid"] for e in spans} <= set(names) and names[0] == "main")
+
+
+def test_hooks(capsys):
+    from lineblock import Hooks
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        root = Path(tmp_dir).resolve()
+        (root / "a.py").write_text('# block extract "a"\nline a\n# end extract\n')
+        (root / "doc.md").write_text('<!-- block insert "a" -->\n')
+        (root / "doc2.md").write_text('<!-- block insert "a" -->\nline a\n<!-- end insert -->\n')
+
+        hooks = Hooks()
+        events = []
+        for event in ("file_discovered", "file_scanned", "block_extracted", "region_updated", "file_written"):
+            hooks.register(event, events.append)
+
+        assert (lineblock(path=root, hooks=hooks) == 0)
+        names = [e["event"] for e in events]
+        assert (names.count("file_discovered") == 3 and names.count("file_scanned") == 3)
+        assert ([e["block"]["identity"] for e in events if e["event"] == "block_extracted"] == ["a"])
+        assert ([(e["path"], e["line"]) for e in events if e["event"] == "region_updated"] == [(root / "doc.md", 1)])
+        assert ([(e["path"], e["method"]) for e in events if e["event"] == "file_written"] ==
+                [(root / "doc.md", "write")])
+        assert (names.index("file_scanned") > names.index("file_discovered"))
+
+        # Errors are reported, then raised
+        (root / "bad.py").write_text('# block extract "b"\n')
+        errors = []
+        hooks = Hooks()
+        hooks.on("error")(errors.append)
+        with pytest.raises(UnclosedBlockError):
+            lineblock(path=root, hooks=hooks)
+        assert ([e["path"] for e in errors] == [root / "bad.py"])
+        (root / "bad.py").unlink()
+
+        # Cancelling stops the run before the next file
+        (root / "doc.md").write_text('<!-- block insert "a" -->\n')
+        hooks = Hooks()
+        hooks.on("file_scanned")(lambda e: hooks.cancel())
+        assert (lineblock(path=root, hooks=hooks) == 1)
+        assert (hooks.cancelled)
+        assert ((root / "doc.md").read_text() == '<!-- block insert "a" -->\n')
+        assert ("Run cancelled" in capsys.readouterr().err)
+
+        with pytest.raises(ValueError):
+            Hooks().register("no_such_event", print)
+
+
+def test_memory_report(capsys):
+    import json
+    import tracemalloc
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        root = Path(tmp_dir).resolve()
+        tree = root / "tree"
+        tree.mkdir()
+        (tree / "a.py").write_text('# block extract "a"\n' + "line a\n" * 1000 + '# end extract\n')
+        (tree / "doc.md").write_text('<!-- block insert "a" -->\n')
+        report_file = root / "memory.json"
+
+        assert (lineblock(path=tree, memory_report=report_file, memory_top=2) == 0)
+        assert (not tracemalloc.is_tracing())
+        report = json.loads(report_file.read_text())
+        assert ([phase["phase"] for phase in report["phases"]] == ["discover", "extract", "insert"])
+        extract = report["phases"][1]
+        assert (extract["peak"] >= extract["retained"] > 0 and extract["growth"] > 0)
+        assert (len(extract["top"]) == 2 and all(":" in site["site"] for site in extract["top"]))
+        assert (report["peak"] == max(phase["peak"] for phase in report["phases"]))
+        assert ("Memory: peak" in capsys.readouterr().err)
+
+
+def test_depfile(monkeypatch, capsys):
+    import io
+    import sys
+    from lineblock.cli import main
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        root = Path(tmp_dir).resolve()
+        tree = root / "tree"
+        (tree / "my docs").mkdir(parents=True)
+        (tree / "a.py").write_text('# block extract "a"\nA\n# end extract\n# block extract "b"\nB\n# end extract\n')
+        (tree / "c.py").write_text('# block extract "c"\nC\n# end extract\n')
+        (tree / "my docs" / "d.md").write_text('<!-- block insert "a" -->\n<!-- block insert "c" -->\n')
+        (tree / "e.md").write_text('<!-- block insert "b" -->\n')
+        depfile, ninja = root / "out.d", root / "build.ninja"
+
+        assert (lineblock(path=tree, depfile=depfile, ninja=ninja) == 0)
+        assert (depfile.read_text() == (
+            f"{tree}/e.md: \\\n  {tree}/a.py\n"
+            f"{tree}/my\\ docs/d.md: \\\n  {tree}/a.py \\\n  {tree}/c.py\n"
+        ))
+        text = ninja.read_text()
+        assert (f"build $stampdir/my$ docs/d.md.stamp: lineblock_update {tree}/my$ docs/d.md"
+                f" | {tree}/a.py {tree}/c.py\n" in text)
+        assert ("build lineblock: phony $stampdir/e.md.stamp $stampdir/my$ docs/d.md.stamp\n" in text)
+
+        # The command ninja runs for a path with a space keeps it one word
+        import shlex
+        command = next(line for line in text.splitlines() if line.startswith("  command = lineblock render")
+                       and "cmp" in line)[len("  command = "):]
+        src = next(line for line in text.splitlines() if line.startswith("  src = ") and "d.md" in line)[len("  src = "):]
+        root_value = next(line for line in text.splitlines() if line.startswith("root = "))[len("root = "):]
+        selection = next(line for line in text.splitlines() if line.startswith("selection ="))[len("selection ="):]
+        expanded = (command.replace("$root", root_value).replace("$selection", selection).replace("$src", src)
+                    .replace("$out", shlex.quote(".lineblock-stamps/my docs/d.md.stamp")))
+        words = shlex.split(expanded)
+        assert (words[:7] == ["lineblock", "render", "--stdin", "--root", str(tree),
+                              "--filename", str(tree / "my docs" / "d.md")])
+        assert (words[7:9] == ["<", str(tree / "my docs" / "d.md")])
+
+        # In output mode the targets are the rendered files
+        output = root / "out"
+        assert (lineblock(path=tree, output=output, depfile=depfile) == 0)
+        assert (depfile.read_text().startswith(f"{output}/e.md: \\\n  {tree}/a.py\n"))
+
+        # The render edges take blocks from the files the run selected: not from
+        # excluded files or an output directory inside the tree
+        (tree / "vendor").mkdir()
+        (tree / "vendor" / "a.py").write_text('# block extract "a"\nvendored\n# end extract\n'
+                                              '# block extract "v"\nvendored\n# end extract\n')
+        (tree / "out").mkdir()
+        (tree / "out" / "old.py").write_text('# block extract "o"\nold\n# end extract\n')
+        assert (lineblock(path=tree, exclude=["vendor"], output=tree / "out", ninja=ninja) == 0)
+        selection = next(line for line in ninja.read_text().splitlines() if line.startswith("selection = "))
+        args = shlex.split(selection[len("selection = "):])
+        assert (args == ["-x", "vendor", "-x", "/out"])
+        monkeypatch.setattr(sys, "argv", ["lineblock", "render", "--stdin", "--root", str(tree)] + args
+                            + ["--filename", str(tree / "e.md")])
+        monkeypatch.setattr(sys, "stdin", io.StringIO('<!-- block insert "a" -->\n'))
+        capsys.readouterr()
+        assert (main() == 0)
+        assert (capsys.readouterr().out == '<!-- block insert "a" -->\nA\n<!-- end insert -->\n')
+        for identity in ("v", "o"):
+            monkeypatch.setattr(sys, "stdin", io.StringIO(f'<!-- block insert "{identity}" -->\n'))
+            with pytest.raises(SystemExit):
+                main()
+            assert (f"Identity '{identity}' not found" in capsys.readouterr().err)
+
+
+def test_shard():
+    from lineblock.index import load_index
+    from lineblock.stats import RunStats
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        root = Path(tmp_dir).resolve()
+        tree, single = root / "tree", root / "single"
+        for base in (tree, single):
+            base.mkdir()
+            for i in range(12):
+                (base / f"p{i}.py").write_text(f'# block extract "b{i}"\nvalue {i}\n# end extract\n')
+                (base / f"d{i}.md").write_text(f'<!-- block insert "b{(i + 1) % 12}" -->\n')
+        index = root / "blocks.idx"
+
+        assert (lineblock(path=single) == 0)
+        assert (lineblock(path=tree, check=True, index_out=index) == 1)
+        blocks = load_index(index, tree)
+        assert (len(blocks) == 12 and blocks[0]["path"].parent == tree)
+        b0 = next(block for block in blocks if block["identity"] == "b0")
+        assert (b0["path"] == tree / "p0.py" and b0["block"] == ["value 0\n"])
+
+        # The shards of a run read no producer files and update disjoint files
+        written = 0
+        for i in range(1, 4):
+            stats = RunStats()
+            assert (lineblock(path=tree, shard=f"{i}/3", index=index, stats=stats) == 0)
+            assert (stats.files_scanned == 0)
+            written += stats.files_written
+        assert (written == 12)
+        for i in range(12):
+            assert ((tree / f"d{i}.md").read_text() == (single / f"d{i}.md").read_text())
+
+        with pytest.raises(ValueError):
+            lineblock(path=tree, shard="4/3")
+        with pytest.raises(IncompatibleOptionsError):
+            lineblock(path=tree / "d0.md", shard="1/2")
+
+
+def test_index_apply(monkeypatch, capsys):
+    import io
+    import sys
+    from lineblock.cli import main
+    from lineblock.exceptions import InvalidIndexError
+    from lineblock.index import dumps, load_index, loads
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        root = Path(tmp_dir).resolve()
+        runner, builder = root / "runner", root / "builder"
+        (runner / "src").mkdir(parents=True)
+        (builder / "docs").mkdir(parents=True)
+        (runner / "src" / "a.py").write_text('# block extract "a"\nline a\n# end extract\n')
+        (builder / "docs" / "doc.md").write_text('<!-- block insert "a" -->\n')
+        index = root / "blocks.idx"
+
+        # Extracted on one tree, applied to another holding only the docs
+        monkeypatch.setattr(sys, "argv", ["lineblock", "index", str(runner), "--out", str(index)])
+        assert (main() == 0)
+        assert ("Indexed 1 block(s) from 1 file(s)" in capsys.readouterr().out)
+        (block,) = load_index(index, builder)
+        assert (block["path"] == builder / "src" / "a.py" and len(block["hash"]) == 32)
+
+        monkeypatch.setattr(sys, "argv", ["lineblock", "apply", str(builder), "--index", str(index), "--check"])
+        assert (main() == 1)
+        monkeypatch.setattr(sys, "argv", ["lineblock", "apply", str(builder), "--index", str(index)])
+        assert (main() == 0)
+        assert ((builder / "docs" / "doc.md").read_text() == '<!-- block insert "a" -->\nline a\n<!-- end insert -->\n')
+
+        monkeypatch.setattr(sys, "argv", ["lineblock", "render", "--stdin", "--root", str(builder),
+                                          "--index", str(index)])
+        monkeypatch.setattr(sys, "stdin", io.StringIO('<!-- block insert "a" -->\n'))
+        capsys.readouterr()
+        assert (main() == 0)
+        assert (capsys.readouterr().out == '<!-- block insert "a" -->\nline a\n<!-- end insert -->\n')
+
+        data = index.read_bytes()
+        index.write_bytes(data[:4] + b"\x63\x00" + data[6:])
+        with pytest.raises(InvalidIndexError, match="version 99"):
+            load_index(index, builder)
+        index.write_bytes(data[:-8])
+        with pytest.raises(InvalidIndexError):
+            load_index(index, builder)
+        # A block whose content does not match its stored hash is rejected
+        tampered = dumps([{**block, "block": ["line b\n"]}], builder)
+        with pytest.raises(InvalidIndexError, match="hash mismatch for 'a'"):
+            loads(tampered, builder)
+
+        # apply validates --shard like the main parser
+        monkeypatch.setattr(sys, "argv", ["lineblock", "apply", str(builder), "--index", str(index),
+                                          "--shard", "5/2"])
+        with pytest.raises(SystemExit) as exc_info:
+            main()
+        assert (exc_info.value.code == 2 and "shard index must be between 1 and 2" in capsys.readouterr().err)
+
+
+def test_keep_going(capsys):
+    import json
+    from lineblock.exceptions import MissingIdentityError
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        root = Path(tmp_dir).resolve()
+        (root / "a.py").write_text('# block extract "a"\nA\n# end extract\n')
+        (root / "bad.py").write_text('# block extract "b"\nB\n')
+        (root / "ok.md").write_text('<!-- block insert "a" -->\n')
+        (root / "miss.md").write_text('<!-- block insert "a" -->\n<!-- block insert "b" -->\n<!-- block insert "c" -->\n')
+        (root / "orphan.md").write_text('x\n<!-- end insert -->\n')
+
+        with pytest.raises(UnclosedBlockError):
+            lineblock(path=root)
+        capsys.readouterr()
+
+        assert (lineblock(path=root, keep_going=True, error_format="json", jobs=4) == 1)
+        errors = json.loads(capsys.readouterr().err)["errors"]
+        assert ([(e["path"], e["line"], e["error"]) for e in errors] == [
+            (str(root / "bad.py"), 1, "UnclosedBlockError"),
+            (str(root / "miss.md"), 2, "MissingIdentityError"),
+            (str(root / "miss.md"), 3, "MissingIdentityError"),
+            (str(root / "orphan.md"), 2, "OrphanedInsertEndMarkerError"),
+        ])
+        # Files without errors are still processed; files with errors are left alone
+        assert ((root / "ok.md").read_text() == '<!-- block insert "a" -->\nA\n<!-- end insert -->\n')
+        assert ((root / "miss.md").read_text() == '<!-- block insert "a" -->\n<!-- block insert "b" -->\n<!-- block insert "c" -->\n')
+
+        assert (lineblock(path=root, keep_going=True) == 1)
+        assert ("4 error(s) found" in capsys.readouterr().err)
+
+        (root / "bad.py").unlink()
+        (root / "orphan.md").unlink()
+        (root / "miss.md").write_text('<!-- block insert "b" -->\n')
+        with pytest.raises(MissingIdentityError, match="line 1"):
+            lineblock(path=root)
+
+        # An unknown identity in a later dialect's marker is reported on its own line,
+        # after an earlier dialect's insert has added lines above it
+        (root / "miss.md").write_text('<!-- block insert "a" -->\n# block insert "p"\n# block insert "nope"\n')
+        (root / "p.py").write_text('# block extract "p"\nP\n# end extract\n')
+        with pytest.raises(MissingIdentityError, match="line 3"):
+            lineblock(path=root)
+        capsys.readouterr()
+        assert (lineblock(path=root, keep_going=True, error_format="json") == 1)
+        errors = json.loads(capsys.readouterr().err)["errors"]
+        assert ([(e["line"], e["error"]) for e in errors] == [(3, "MissingIdentityError")])